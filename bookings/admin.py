@@ -1,25 +1,257 @@
-from django.contrib import admin
-from .models import TravelOption, Booking
+from decimal import Decimal
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce, Round
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import path, reverse
+from django.utils import timezone
+
+from . import seatmaps
+from .models import TravelOption, Booking, Waitlist, ArchivedBooking, normalize_city
+from .cache import invalidate_schedule, invalidate_search_cache, invalidate_travel_options
+from .exports import csv_lines
+from .fares import queryset_route_days, refresh_route_days
+from .inventory import cancel_all_bookings, lock_travel_options
+from .pagination import EstimatedCountPaginator
+
+CITY_SUGGESTIONS = 20
+SEAT_ADJUSTMENT_BATCH_SIZE = 2000
+
+
+class CityFilter(admin.SimpleListFilter):
+    """
+    Filter on a city typed into a search box, with suggestions fetched as
+    you type, instead of a link per distinct city (a DISTINCT scan of the
+    whole table on every changelist load).
+    """
+    template = 'admin/bookings/city_filter.html'
+    field = None
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{f'{self.field}_key': normalize_city(self.value())})
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'All',
+            # The search box replaces the query string, so it resends the rest
+            'hidden_params': [
+                (name, value) for name, value in changelist.params.items()
+                if name != self.parameter_name
+            ],
+            'autocomplete_url': reverse('admin:bookings_traveloption_cities', args=[self.field]),
+        }
+
+
+class SourceCityFilter(CityFilter):
+    title = 'source'
+    parameter_name = 'source'
+    field = 'source'
+
+
+class DestinationCityFilter(CityFilter):
+    title = 'destination'
+    parameter_name = 'destination'
+    field = 'destination'
+
+
+class TravelOptionActionForm(ActionForm):
+    price_change = forms.DecimalField(
+        required=False, max_digits=5, decimal_places=2, min_value=Decimal('-99.99'),
+        label='Price change (%)',
+    )
+    seat_change = forms.IntegerField(required=False, label='Seat change')
 
 
 @admin.register(TravelOption)
 class TravelOptionAdmin(admin.ModelAdmin):
-    list_display = ['travel_id', 'type', 'source', 'destination', 'datetime', 'price', 'available_seats']
-    list_filter = ['type', 'source', 'destination', 'datetime']
+    list_display = ['travel_id', 'type', 'source', 'destination', 'datetime', 'price', 'base_price', 'available_seats']
+    list_filter = ['type', SourceCityFilter, DestinationCityFilter, 'datetime']
     search_fields = ['source', 'destination', 'type']
     ordering = ['datetime']
-    readonly_fields = ['travel_id']
+    readonly_fields = ['travel_id', 'seat_capacity']
+    actions = ['cancel_bookings', 'adjust_prices', 'adjust_seats']
+    action_form = TravelOptionActionForm
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_urls(self):
+        return [
+            path(
+                'cities/<str:field>/',
+                self.admin_site.admin_view(self.city_autocomplete),
+                name='bookings_traveloption_cities',
+            ),
+        ] + super().get_urls()
+
+    def city_autocomplete(self, request, field):
+        """Cities starting with ``term``, read off the route indexes"""
+        if field not in ('source', 'destination') or not self.has_view_permission(request):
+            return JsonResponse({'results': []}, status=404)
+        key = f'{field}_key'
+        cities = (
+            TravelOption.objects.filter(**{f'{key}__startswith': normalize_city(request.GET.get('term', ''))})
+            .order_by(key)
+            .values_list(key, flat=True)
+            .distinct()[:CITY_SUGGESTIONS]
+        )
+        return JsonResponse({'results': list(cities)})
+
+    def _action_value(self, request, name):
+        """A cleaned action form field, None if it is missing or invalid"""
+        try:
+            return TravelOptionActionForm.base_fields[name].clean(request.POST.get(name))
+        except ValidationError:
+            return None
+
+    @admin.action(description='Cancel all bookings on selected travel options')
+    def cancel_bookings(self, request, queryset):
+        cancelled = cancel_all_bookings(queryset)
+        self.message_user(
+            request,
+            f'Cancelled {cancelled} booking(s) on {queryset.count()} travel option(s).',
+            messages.SUCCESS,
+        )
+
+    @admin.action(description='Change prices of selected travel options by the given percentage')
+    def adjust_prices(self, request, queryset):
+        price_change = self._action_value(request, 'price_change')
+        if price_change is None:
+            self.message_user(request, 'Enter a price change in percent.', messages.ERROR)
+            return
+
+        factor = 1 + price_change / 100
+        with transaction.atomic():
+            route_days = queryset_route_days(queryset)
+            # One UPDATE for the whole selection; the base fare moves too, so reprice keeps the change
+            updated = queryset.update(
+                price=Round(F('price') * factor, 2),
+                base_price=Round(Coalesce('base_price', 'price') * factor, 2),
+            )
+            refresh_route_days(route_days)
+        invalidate_search_cache()
+        invalidate_schedule()
+        self.message_user(request, f'Changed prices of {updated} travel option(s).', messages.SUCCESS)
+
+    @admin.action(description='Add the given number of seats to selected travel options (negative to remove)')
+    def adjust_seats(self, request, queryset):
+        seat_change = self._action_value(request, 'seat_change')
+        if not seat_change:
+            self.message_user(request, 'Enter a seat change.', messages.ERROR)
+            return
+
+        with transaction.atomic():
+            route_days = queryset_route_days(queryset)
+            locked = lock_travel_options(queryset.order_by())
+            # Options without a seat map change in one UPDATE; never below zero
+            unmapped = locked.filter(seat_map__isnull=True)
+            if seat_change < 0:
+                unmapped = unmapped.filter(available_seats__gte=-seat_change)
+            updated = unmapped.update(available_seats=F('available_seats') + seat_change)
+            # Seat maps cannot be edited in SQL, so those are resized in batches
+            updated += self._resize_seat_maps(locked.filter(seat_map__isnull=False), seat_change)
+            refresh_route_days(route_days)
+        invalidate_search_cache()
+        # The selection can be the whole table, so every snapshot goes
+        invalidate_travel_options()
+        self.message_user(
+            request,
+            f'Changed seats on {updated} travel option(s); options without enough free seats were skipped.'
+            if seat_change < 0 else f'Changed seats on {updated} travel option(s).',
+            messages.SUCCESS,
+        )
+
+    def _resize_seat_maps(self, queryset, seat_change):
+        options = queryset.only('available_seats', 'seat_capacity', 'seat_map').order_by('pk')
+        if seat_change < 0:
+            options = options.filter(available_seats__gte=-seat_change)
+
+        updated = 0
+        last = None
+        while True:
+            # Keyset batches rather than a cursor, which would see its own writes on SQLite
+            batch = list((options.filter(pk__gt=last) if last else options)[:SEAT_ADJUSTMENT_BATCH_SIZE])
+            if not batch:
+                return updated
+            for option in batch:
+                option.seat_map, option.seat_capacity = seatmaps.resize(
+                    option.seat_map, option.seat_capacity, option.available_seats + seat_change
+                )
+                option.available_seats += seat_change
+            updated += TravelOption.objects.bulk_update(batch, ['available_seats', 'seat_capacity', 'seat_map'])
+            last = batch[-1].pk
 
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
     list_display = ['booking_id', 'user', 'travel_option', 'number_of_seats', 'total_price', 'booking_date', 'status']
     list_filter = ['status', 'booking_date', 'travel_option__type']
+    list_select_related = ['user', 'travel_option']
     search_fields = ['user__username', 'user__email', 'travel_option__source', 'travel_option__destination']
     ordering = ['-booking_date']
-    readonly_fields = ['booking_id', 'booking_date', 'total_price']
-    
+    readonly_fields = ['booking_id', 'booking_date', 'total_price', 'seat_numbers']
+    autocomplete_fields = ['user', 'travel_option']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['export_csv']
+
+    @admin.action(description='Export selected bookings as CSV')
+    def export_csv(self, request, queryset):
+        # Streamed from a cursor, so "select all" works for any number of bookings
+        response = StreamingHttpResponse(csv_lines(queryset), content_type='text/csv')
+        response['Content-Disposition'] = (
+            f'attachment; filename="bookings-{timezone.localdate().isoformat()}.csv"'
+        )
+        return response
+
     def get_readonly_fields(self, request, obj=None):
         if obj:  # editing an existing object
             return self.readonly_fields + ['user', 'travel_option', 'number_of_seats']
         return self.readonly_fields
+
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(admin.ModelAdmin):
+    """Read-only, so bookings on departed travel can still be found and exported"""
+    list_display = ['booking_id', 'user', 'travel_option', 'number_of_seats', 'total_price', 'booking_date', 'status']
+    list_filter = ['status', 'booking_date']
+    list_select_related = ['user', 'travel_option']
+    search_fields = ['user__username', 'user__email']
+    ordering = ['-booking_date']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['export_csv']
+    export_csv = BookingAdmin.export_csv
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Waitlist)
+class WaitlistAdmin(admin.ModelAdmin):
+    list_display = ['waitlist_id', 'user', 'travel_option', 'number_of_seats', 'joined_at', 'status']
+    list_filter = ['status', 'joined_at']
+    list_select_related = ['user', 'travel_option']
+    search_fields = ['user__username', 'travel_option__source', 'travel_option__destination']
+    ordering = ['joined_at']
+    readonly_fields = ['waitlist_id', 'joined_at', 'booking']
+    autocomplete_fields = ['user', 'travel_option']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,163 @@
+"""
+Read-only JSON API for travel options.
+
+Rows are read with ``.values()`` so no model instances are built, and the
+NDJSON export streams the whole result set from a database cursor so
+server memory stays flat however large the inventory is.
+"""
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .connections import search_connections
+from .fares import fare_calendar
+from .forms import ConnectionSearchForm, FareCalendarForm, TravelOptionFilterForm
+from .models import TravelOption
+from .pagination import KeysetPaginator
+from .routers import replica_reads
+from .search import search_travel_options, start_of_day
+
+TRAVEL_OPTION_FIELDS = (
+    'travel_id', 'type', 'source', 'destination', 'datetime', 'arrival', 'price', 'available_seats',
+)
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+EXPORT_CHUNK_SIZE = 2000
+CENT = Decimal('0.01')
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _ndjson_lines(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+@require_GET
+@replica_reads
+def travel_options_search(request):
+    """
+    Search travel options with the same filters as the HTML search page.
+
+    Pass ``format=ndjson`` to stream every match as one JSON object per
+    line instead of a single page.
+    """
+    form = TravelOptionFilterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+
+    travel_options = search_travel_options(form.cleaned_data)
+
+    if request.GET.get('format') == 'ndjson':
+        # The stream is read after the view returns, so fix the database now
+        rows = (
+            travel_options.using(travel_options.db).order_by('datetime', 'travel_id')
+            .values(*TRAVEL_OPTION_FIELDS)
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        return StreamingHttpResponse(_ndjson_lines(rows), content_type='application/x-ndjson')
+
+    page = KeysetPaginator(
+        travel_options.values(*TRAVEL_OPTION_FIELDS),
+        ('datetime', 'travel_id'),
+        per_page=_limit(request),
+    ).page(request.GET.get('cursor'))
+
+    return JsonResponse({
+        'results': page.object_list,
+        'next_cursor': page.next_cursor,
+    })
+
+
+@require_GET
+@replica_reads
+def travel_option_detail(request, travel_id):
+    """A single travel option"""
+    travel_option = TravelOption.objects.filter(
+        travel_id=travel_id
+    ).values(*TRAVEL_OPTION_FIELDS).first()
+
+    if travel_option is None:
+        return JsonResponse({'error': 'Travel option not found.'}, status=404)
+    return JsonResponse(travel_option)
+
+
+@require_GET
+@replica_reads
+def travel_option_seat_map(request, travel_id):
+    """
+    The seat map as raw bytes: bit ``n - 1`` (little-endian) is set while
+    seat ``n`` is free. The seat count is in the X-Seat-Capacity header.
+    """
+    seats = TravelOption.objects.filter(
+        travel_id=travel_id
+    ).values('seat_capacity', 'seat_map', 'available_seats').first()
+
+    if seats is None or seats['seat_map'] is None:
+        return JsonResponse({'error': 'Seat map not found.'}, status=404)
+
+    response = HttpResponse(bytes(seats['seat_map']), content_type='application/octet-stream')
+    response['X-Seat-Capacity'] = seats['seat_capacity']
+    response['X-Seats-Available'] = seats['available_seats']
+    return response
+
+
+@require_GET
+@replica_reads
+def route_fare_calendar(request):
+    """Cheapest fare, departures and seats left per day for the next 60 days on a route"""
+    form = FareCalendarForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+
+    days = fare_calendar(
+        form.cleaned_data['source'],
+        form.cleaned_data['destination'],
+        travel_type=form.cleaned_data['travel_type'],
+        start=form.cleaned_data['start'],
+    )
+    # SQLite hands back aggregated decimals unquantized
+    results = [dict(day, min_price=day['min_price'].quantize(CENT)) for day in days]
+    return JsonResponse({'results': results})
+
+
+@require_GET
+@replica_reads
+def connections(request):
+    """Itineraries between two cities with up to two changes, as on the connections page"""
+    form = ConnectionSearchForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+
+    date = form.cleaned_data['date']
+    itineraries = search_connections(
+        form.cleaned_data['source'],
+        form.cleaned_data['destination'],
+        after=start_of_day(date) if date else None,
+        seats=form.cleaned_data['seats'] or 1,
+        sort=form.cleaned_data['sort'] or 'earliest',
+    )
+    return JsonResponse({
+        'results': [
+            {
+                'departure': itinerary.departure,
+                'arrival': itinerary.arrival,
+                'transfers': itinerary.transfers,
+                'total_price': itinerary.total_price,
+                'legs': [
+                    {field: getattr(leg, field) for field in TRAVEL_OPTION_FIELDS}
+                    for leg in itinerary.legs
+                ],
+            }
+            for itinerary in itineraries
+        ],
+    })
@@ -0,0 +1,105 @@
+"""
+Archival of departed travel options.
+
+``archive_past_travel()`` moves travel options that departed before a
+cutoff, and their bookings, into ArchivedTravelOption and ArchivedBooking,
+so the tables every search and booking touches only hold what can still
+be booked. Each chunk is copied and deleted in one transaction, so an
+interrupted run loses nothing and the next run carries on where it
+stopped. ``my_bookings`` reads both tables, so users still see past trips.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_schedule, invalidate_search_cache
+from .fares import deferred_refresh
+from .inventory import lock_travel_options
+from .models import (
+    ArchivedBooking, ArchivedTravelOption, Booking, IdempotencyKey, RouteDaySummary,
+    TravelOption, Waitlist,
+)
+
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_AFTER_DAYS = 7
+
+TRAVEL_OPTION_FIELDS = (
+    'travel_id', 'type', 'source', 'destination', 'datetime', 'price', 'available_seats', 'seat_capacity',
+)
+BOOKING_FIELDS = (
+    'booking_id', 'user_id', 'travel_option_id', 'number_of_seats', 'total_price', 'booking_date',
+    'status', 'seat_numbers',
+)
+
+
+def archive_cutoff(days=ARCHIVE_AFTER_DAYS):
+    """Travel options that departed before this are archived"""
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_chunk(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move up to ``batch_size`` travel options that departed before
+    ``cutoff``, with their bookings, into the archive. Returns
+    ``(travel options, bookings)`` moved.
+    """
+    with transaction.atomic():
+        pks = list(
+            TravelOption.objects.filter(datetime__lt=cutoff)
+            .order_by('datetime', 'travel_id')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return 0, 0
+        # Wait for any cancellation still giving seats back to these
+        options = list(
+            lock_travel_options(TravelOption.objects.filter(pk__in=pks)).values(*TRAVEL_OPTION_FIELDS)
+        )
+        bookings = list(Booking.objects.filter(travel_option__in=pks).values(*BOOKING_FIELDS))
+
+        # ignore_conflicts: rows a crashed run copied are already there
+        ArchivedTravelOption.objects.bulk_create(
+            [ArchivedTravelOption(**option) for option in options], ignore_conflicts=True
+        )
+        ArchivedBooking.objects.bulk_create(
+            [ArchivedBooking(**booking) for booking in bookings],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+
+        # Children first. Booking and TravelOption have reverse foreign keys,
+        # so their deletes still fetch the rows and look for dependents, but
+        # find none left to cascade or null one by one.
+        IdempotencyKey.objects.filter(booking__travel_option__in=pks).delete()
+        Waitlist.objects.filter(travel_option__in=pks).delete()
+        Booking.objects.filter(travel_option__in=pks).delete()
+        with deferred_refresh(rebuild=False):
+            TravelOption.objects.filter(pk__in=pks).delete()
+
+    return len(options), len(bookings)
+
+
+def archive_past_travel(cutoff, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """
+    Archive every travel option that departed before ``cutoff``, a chunk
+    at a time. ``progress`` is called with the running totals after each
+    chunk. Returns ``(travel options, bookings)`` moved.
+    """
+    archived_options = archived_bookings = 0
+    try:
+        while True:
+            options, bookings = archive_chunk(cutoff, batch_size)
+            if not options:
+                break
+            archived_options += options
+            archived_bookings += bookings
+            if progress:
+                progress(archived_options, archived_bookings)
+    finally:
+        if archived_options:
+            # Days wholly before the cutoff have nothing left to show
+            RouteDaySummary.objects.filter(date__lt=timezone.localdate(cutoff)).delete()
+            invalidate_search_cache()
+            invalidate_schedule()
+    return archived_options, archived_bookings
@@ -0,0 +1,77 @@
+"""
+Async versions of the read-only pages, used when ASYNC_VIEWS is on. It
+is off by default, under ASGI too.
+
+Queries go through Django's async ORM and the cache through its async API,
+so the event loop can serve other requests while they wait. Rendering
+still runs in a worker thread: the auth and messages context processors
+read the session and the user from the database, which Django only allows
+from sync code. The detail page reads through ``bookings.snapshots``, a
+per-process cache behind a thread lock, so it runs in a worker thread too,
+and the home page's departures are only queried, while rendering, when
+its cached block has expired.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import render
+
+from . import snapshots
+from .cache import SEARCH_GENERATION_KEY, acached_search, aget_generation
+from .forms import TravelOptionFilterForm
+from .pagination import KeysetPaginator
+from .routers import pinned_to_primary, replica_reads
+from .search import search_travel_options, upcoming_travel_options
+from .views import TRAVEL_OPTIONS_PER_PAGE
+
+arender = sync_to_async(render)
+
+
+@replica_reads
+async def home(request):
+    """Home page view with recent travel options"""
+    context = {
+        'recent_options': upcoming_travel_options()[:6],
+        'recent_options_generation': await aget_generation(SEARCH_GENERATION_KEY),
+        'pinned_to_primary': pinned_to_primary(),
+        'home_cache_timeout': settings.HOME_CACHE_TIMEOUT,
+        'card_cache_timeout': settings.CARD_CACHE_TIMEOUT,
+    }
+    return await arender(request, 'bookings/home.html', context)
+
+
+@replica_reads
+async def travel_options_list(request):
+    """List and filter travel options"""
+    form = TravelOptionFilterForm(request.GET)
+    filters = form.cleaned_data if form.is_valid() else {}
+    cursor = request.GET.get('cursor')
+
+    page = await acached_search(
+        filters, cursor, TRAVEL_OPTIONS_PER_PAGE,
+        lambda: KeysetPaginator(
+            search_travel_options(filters),
+            ('datetime', 'travel_id'),
+            per_page=TRAVEL_OPTIONS_PER_PAGE,
+        ).apage(cursor),
+    )
+
+    context = {
+        'form': form,
+        'travel_options': page.object_list,
+        'page': page,
+        'next_querystring': page.next_querystring(request.GET) if page.has_next else '',
+        'first_querystring': page.first_querystring(request.GET),
+        'card_cache_timeout': settings.CARD_CACHE_TIMEOUT,
+    }
+    return await arender(request, 'bookings/travel_options_list.html', context)
+
+
+@replica_reads
+async def travel_option_detail(request, travel_id):
+    """View details of a travel option"""
+    travel_option = await sync_to_async(snapshots.get_travel_option_or_404)(travel_id)
+
+    context = {
+        'travel_option': travel_option,
+    }
+    return await arender(request, 'bookings/travel_option_detail.html', context)
@@ -0,0 +1,38 @@
+"""
+Helpers shared by the bench_* management commands.
+"""
+import math
+import statistics
+
+from django.conf import settings
+
+
+def allowed_host():
+    """A host name the configured ALLOWED_HOSTS accepts, for test client requests"""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (0 < pct <= 100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize_latencies(seconds):
+    """Count, mean and p50/p95/p99 of latencies, reported in milliseconds"""
+    if not seconds:
+        return {'count': 0}
+    return {
+        'count': len(seconds),
+        'mean_ms': round(statistics.fmean(seconds) * 1000, 3),
+        'p50_ms': round(percentile(seconds, 50) * 1000, 3),
+        'p95_ms': round(percentile(seconds, 95) * 1000, 3),
+        'p99_ms': round(percentile(seconds, 99) * 1000, 3),
+        'max_ms': round(max(seconds) * 1000, 3),
+    }
@@ -0,0 +1,201 @@
+"""
+Versioned caching of travel option data.
+
+Cached entries embed a generation number in their key. Bumping the
+generation makes every older entry unreachable at once, without having to
+know which keys were written; the stale entries simply age out.
+
+A generation starts from the current time in nanoseconds rather than 1,
+so one that was evicted and set again never comes back to a value that
+entries, or the travel option snapshots of other processes, were stored
+under. The cache backend should increment atomically (Redis, memcached);
+the file-based cache reads and writes, so concurrent bumps can collapse
+into one.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import normalize_city
+from .routers import pinned_to_primary
+
+SEARCH_GENERATION_KEY = 'search:generation'
+SEARCH_HITS_KEY = 'search:hits'
+SEARCH_MISSES_KEY = 'search:misses'
+SCHEDULE_GENERATION_KEY = 'schedule:generation'
+TRAVEL_OPTION_GENERATION_KEY = 'travel_option:generation'
+
+
+def travel_option_generation_key(pk):
+    return f'travel_option:{pk}:generation'
+
+
+def _seed_generation(key):
+    """Start ``key`` at a generation it cannot have had before, unless another process just did"""
+    generation = time.time_ns()
+    cache.add(key, generation, timeout=None)
+    return cache.get(key, generation)
+
+
+def get_generation(key):
+    generation = cache.get(key)
+    if generation is None:
+        generation = _seed_generation(key)
+    return generation
+
+
+async def aget_generation(key):
+    generation = await cache.aget(key)
+    if generation is None:
+        generation = time.time_ns()
+        await cache.aadd(key, generation, timeout=None)
+        generation = await cache.aget(key, generation)
+    return generation
+
+
+def bump_generation(key):
+    """Move ``key`` to a new generation and return it"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted or never set: a fresh seed is past every value it had
+        return _seed_generation(key)
+
+
+def _incr_counter(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+async def _aincr_counter(key):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 1, timeout=None)
+
+
+def invalidate_search_cache():
+    """
+    Drop cached search results after seats or prices change.
+
+    The generation is bumped straight away so other workers stop serving
+    the old results, and again once the transaction commits so a result
+    read before the commit cannot survive under the new generation.
+    """
+    bump_generation(SEARCH_GENERATION_KEY)
+    transaction.on_commit(lambda: bump_generation(SEARCH_GENERATION_KEY))
+
+
+def invalidate_schedule():
+    """
+    Make every process rebuild its connection index once the transaction
+    commits, and drop all its travel option snapshots, after departures,
+    arrivals or prices change without the model signals (bulk creates,
+    updates and deletes).
+    """
+    transaction.on_commit(lambda: bump_generation(SCHEDULE_GENERATION_KEY))
+    invalidate_travel_options()
+
+
+def invalidate_travel_options(pks=None):
+    """
+    Make every process drop its snapshots of the travel options with the
+    given primary keys, or of all travel options when ``pks`` is None.
+    Bumped straight away and again on commit, like the search generation.
+    """
+    keys = (
+        [TRAVEL_OPTION_GENERATION_KEY] if pks is None
+        else [travel_option_generation_key(pk) for pk in set(pks)]
+    )
+
+    def bump():
+        for key in keys:
+            bump_generation(key)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def _search_digest(filters, cursor, per_page):
+    normalized = {}
+    for name, value in filters.items():
+        if value in (None, ''):
+            continue
+        if name in ('source', 'destination'):
+            value = normalize_city(value)
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        else:
+            value = str(value)
+        normalized[name] = value
+
+    payload = json.dumps([normalized, cursor, per_page], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def search_cache_key(filters, cursor=None, per_page=None):
+    """Cache key for one page of results for TravelOptionFilterForm data"""
+    generation = get_generation(SEARCH_GENERATION_KEY)
+    return f'search:{generation}:{_search_digest(filters, cursor, per_page)}'
+
+
+def cached_search(filters, cursor, per_page, compute):
+    """
+    Return the cached result for this search, or call ``compute()`` and
+    cache what it returns for at most SEARCH_CACHE_TIMEOUT seconds, which
+    bounds how stale availability can get if an invalidation is missed.
+    Users pinned to the primary skip the cache, which may hold a page read
+    from a lagging replica.
+    """
+    timeout = settings.SEARCH_CACHE_TIMEOUT
+    if timeout <= 0 or pinned_to_primary():
+        return compute()
+
+    key = search_cache_key(filters, cursor, per_page)
+    result = cache.get(key)
+    if result is not None:
+        _incr_counter(SEARCH_HITS_KEY)
+        return result
+
+    _incr_counter(SEARCH_MISSES_KEY)
+    result = compute()
+    cache.set(key, result, timeout)
+    return result
+
+
+async def acached_search(filters, cursor, per_page, compute):
+    """``cached_search()`` for async views; ``compute`` is a coroutine function"""
+    timeout = settings.SEARCH_CACHE_TIMEOUT
+    if timeout <= 0 or pinned_to_primary():
+        return await compute()
+
+    generation = await aget_generation(SEARCH_GENERATION_KEY)
+    key = f'search:{generation}:{_search_digest(filters, cursor, per_page)}'
+    result = await cache.aget(key)
+    if result is not None:
+        await _aincr_counter(SEARCH_HITS_KEY)
+        return result
+
+    await _aincr_counter(SEARCH_MISSES_KEY)
+    result = await compute()
+    await cache.aset(key, result, timeout)
+    return result
+
+
+def search_cache_stats():
+    """Hit and miss counters for the search cache"""
+    hits = cache.get(SEARCH_HITS_KEY, 0)
+    misses = cache.get(SEARCH_MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'generation': get_generation(SEARCH_GENERATION_KEY),
+    }
@@ -0,0 +1,400 @@
+"""
+Connecting itineraries.
+
+``ConnectionIndex`` holds the departures of the next INDEX_DAYS days that
+have an arrival time as parallel arrays (a timetable of connections), with
+the live connections listed in departure order and, per city and travel
+type, each city's departures in departure order. Each of those lists has
+a parallel array of its departure times to bisect on. Two searches run on
+it:
+
+- earliest arrival, a connection scan (CSA): one pass over the
+  connections in departure order, keeping each stop's earliest arrival
+  per number of legs, stopping once nothing can arrive sooner;
+- cheapest, Dijkstra over the time-expanded graph, where a departure
+  leads to the next departure of the same type from the same city
+  (waiting) and, by riding it, to the first departure of each type that
+  can be caught at the arrival city after the minimum transfer time.
+
+A leg can be caught TRANSFER_MINUTES after the previous one arrives,
+depending on the type of the leg caught.
+
+Each process keeps one index. Travel options saved or deleted through the
+model are patched into it in place. Every change also bumps the schedule
+generation in the cache (``invalidate_schedule()`` does it for bulk
+changes), and a process that sees a generation it did not make rebuilds
+its index from the database, as it does every INDEX_MAX_AGE seconds.
+
+Seats change with every booking and are not tracked: the legs of every
+itinerary found are read back, and a search that turns up a sold-out leg
+is run again without it.
+"""
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import timedelta
+from heapq import heappop, heappush
+from itertools import count
+import threading
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import SCHEDULE_GENERATION_KEY, bump_generation, get_generation
+from .models import TravelOption, normalize_city
+
+INDEX_DAYS = 30
+INDEX_MAX_AGE = 5 * 60
+# Every leg departs within this long of the requested time
+SEARCH_WINDOW = timedelta(days=2)
+MAX_LEGS = 3
+MAX_RESULTS = 5
+# Searches run again at most this many times to avoid sold-out legs
+SEAT_CHECKS = 3
+
+TRAVEL_TYPES = [travel_type for travel_type, _ in TravelOption.TRAVEL_TYPES]
+TRANSFER_MINUTES = {
+    'Flight': 90,
+    'Train': 20,
+    'Bus': 15,
+}
+SORTS = ('earliest', 'cheapest')
+
+_TRANSFER_SECONDS = [TRANSFER_MINUTES[travel_type] * 60 for travel_type in TRAVEL_TYPES]
+_TYPE_CODES = {travel_type: code for code, travel_type in enumerate(TRAVEL_TYPES)}
+_ROW_FIELDS = (
+    'pk', 'source_key', 'source', 'destination_key', 'destination', 'type', 'datetime', 'arrival',
+    'price', 'available_seats',
+)
+
+
+def schedule_rows(travel_options):
+    """The values ConnectionIndex reads from a travel option queryset"""
+    return (
+        travel_options.filter(arrival__isnull=False)
+        .order_by('datetime', 'travel_id')
+        .values_list(*_ROW_FIELDS)
+    )
+
+
+class ConnectionIndex:
+    """
+    A timetable of connections. Connection ids are positions in the
+    column arrays; a removed connection keeps its id but leaves ``order``
+    and ``departures``.
+    """
+
+    def __init__(self, generation=None):
+        self.generation = generation
+        self.built_at = time.monotonic()
+        self.stops = {}  # city key -> stop number
+        self.cities = []  # stop number -> city name
+        self.ids = {}  # travel option pk -> connection id
+        self.pks = []
+        self.dep_stop = array('l')
+        self.arr_stop = array('l')
+        self.dep_time = array('q')
+        self.arr_time = array('q')
+        self.price = array('q')  # cents
+        self.type = array('b')
+        self.seats = array('l')
+        # Live connection ids in departure order, overall and per stop and
+        # type, each with its departure times alongside
+        self.order = array('l')
+        self.order_times = array('q')
+        self.departures = []
+        self.departure_times = []
+
+    @classmethod
+    def build(cls, generation=None, now=None):
+        """An index of the departures in the next INDEX_DAYS days"""
+        now = now or timezone.now()
+        index = cls(generation)
+        for row in schedule_rows(
+            TravelOption.objects.filter(datetime__gte=now, datetime__lt=now + timedelta(days=INDEX_DAYS))
+        ).iterator(chunk_size=5000):
+            connection = index._append(row)
+            # Rows arrive in departure order, so appending keeps every list sorted
+            for connections, times in index._lists(connection):
+                connections.append(connection)
+                times.append(index.dep_time[connection])
+        return index
+
+    def __len__(self):
+        return len(self.order)
+
+    def _stop(self, key, name):
+        stop = self.stops.get(key)
+        if stop is None:
+            stop = self.stops[key] = len(self.cities)
+            self.cities.append(name)
+            self.departures.append([array('l') for _ in TRAVEL_TYPES])
+            self.departure_times.append([array('q') for _ in TRAVEL_TYPES])
+        return stop
+
+    def _append(self, row):
+        (
+            pk, source_key, source, destination_key, destination, travel_type, departure, arrival, price, seats,
+        ) = row
+        connection = len(self.pks)
+        self.ids[pk] = connection
+        self.pks.append(pk)
+        self.dep_stop.append(self._stop(source_key, source))
+        self.arr_stop.append(self._stop(destination_key, destination))
+        self.dep_time.append(int(departure.timestamp()))
+        self.arr_time.append(int(arrival.timestamp()))
+        self.price.append(int(price * 100))
+        self.type.append(_TYPE_CODES[travel_type])
+        self.seats.append(seats)
+        return connection
+
+    def _lists(self, connection):
+        """The departure-ordered lists ``connection`` belongs in, with their times"""
+        stop, code = self.dep_stop[connection], self.type[connection]
+        return (
+            (self.order, self.order_times),
+            (self.departures[stop][code], self.departure_times[stop][code]),
+        )
+
+    def add(self, row):
+        """Add or replace the connection of one schedule row"""
+        self.remove(row[0])
+        connection = self._append(row)
+        departure = self.dep_time[connection]
+        for connections, times in self._lists(connection):
+            position = bisect_left(times, departure)
+            connections.insert(position, connection)
+            times.insert(position, departure)
+
+    def remove(self, pk):
+        connection = self.ids.pop(pk, None)
+        if connection is None:
+            return
+        for connections, times in self._lists(connection):
+            position = bisect_left(times, self.dep_time[connection])
+            while connections[position] != connection:
+                position += 1
+            del connections[position]
+            del times[position]
+
+    def earliest_arrival(self, origin, target, after, seats=1, max_legs=MAX_LEGS):
+        """
+        Connection ids of the itinerary leaving ``origin`` no earlier than
+        ``after`` (a timestamp) that reaches ``target`` first, or None.
+        """
+        dep_stop, arr_stop, dep_time, arr_time = self.dep_stop, self.arr_stop, self.dep_time, self.arr_time
+        travel_type, free, order = self.type, self.seats, self.order
+        never = float('inf')
+        # Earliest arrival at each stop per number of legs, and the connection
+        # it came by: reaching a stop sooner with more legs must not hide a
+        # later arrival that leaves legs to spare
+        arrival = [[never] * len(self.cities) for _ in range(max_legs + 1)]
+        entered_by = [[-1] * len(self.cities) for _ in range(max_legs + 1)]
+        arrival[0][origin] = -never
+        best = never
+        deadline = after + SEARCH_WINDOW.total_seconds()
+
+        for position in range(bisect_left(self.order_times, after), len(order)):
+            connection = order[position]
+            departure = dep_time[connection]
+            if departure >= best or departure > deadline:
+                break
+            stop, reached = dep_stop[connection], arr_stop[connection]
+            if free[connection] < seats or reached == origin:
+                continue
+            ready = departure - _TRANSFER_SECONDS[travel_type[connection]]
+            arrives = arr_time[connection]
+            for leg in range(1, max_legs + 1):
+                if arrival[leg - 1][stop] <= ready and arrives < arrival[leg][reached]:
+                    arrival[leg][reached] = arrives
+                    entered_by[leg][reached] = connection
+                    if reached == target:
+                        best = min(best, arrives)
+
+        if best == never:
+            return None
+        # The fewest legs among the earliest arrivals
+        leg = min(range(1, max_legs + 1), key=lambda leg: arrival[leg][target])
+        itinerary, stop = [], target
+        while leg:
+            itinerary.append(entered_by[leg][stop])
+            stop = dep_stop[itinerary[-1]]
+            leg -= 1
+        return itinerary[::-1]
+
+    def cheapest(self, origin, target, after, seats=1, limit=MAX_RESULTS, max_legs=MAX_LEGS):
+        """
+        Connection ids of up to ``limit`` itineraries from ``origin`` to
+        ``target`` leaving no earlier than ``after`` (a timestamp), cheapest
+        first.
+        """
+        dep_time, arr_stop, arr_time = self.dep_time, self.arr_stop, self.arr_time
+        price, free, departures, departure_times = self.price, self.seats, self.departures, self.departure_times
+        deadline = after + SEARCH_WINDOW.total_seconds()
+        tiebreak = count()
+        # Rides taken so far as (connection, previous ride) links
+        rides = []
+        # (fare, legs, tiebreak, stop, travel type, position in its departures, last ride)
+        queue = []
+        for code, times in enumerate(departure_times[origin]):
+            position = bisect_left(times, after)
+            if position < len(times):
+                heappush(queue, (0, 0, next(tiebreak), origin, code, position, -1))
+
+        settled = {}
+        results = []
+        while queue and len(results) < limit:
+            fare, legs, _, stop, code, position, ride = heappop(queue)
+            if stop < 0:
+                results.append(self._rides(rides, ride))
+                continue
+
+            connections = departures[stop][code]
+            connection = connections[position]
+            if dep_time[connection] > deadline or settled.get(connection, max_legs + 1) <= legs:
+                continue
+            settled[connection] = legs
+
+            # Wait for the next departure of this type
+            if position + 1 < len(connections):
+                heappush(queue, (fare, legs, next(tiebreak), stop, code, position + 1, ride))
+
+            if free[connection] < seats:
+                continue
+            rides.append((connection, ride))
+            reached, fare = arr_stop[connection], fare + price[connection]
+            if reached == target:
+                heappush(queue, (fare, legs + 1, next(tiebreak), -1, 0, 0, len(rides) - 1))
+            elif legs + 1 < max_legs and reached != origin:
+                for next_code, next_times in enumerate(departure_times[reached]):
+                    next_position = bisect_left(next_times, arr_time[connection] + _TRANSFER_SECONDS[next_code])
+                    if next_position < len(next_times):
+                        heappush(queue, (
+                            fare, legs + 1, next(tiebreak), reached, next_code, next_position, len(rides) - 1,
+                        ))
+        return results
+
+    def _rides(self, rides, ride):
+        itinerary = []
+        while ride >= 0:
+            connection, ride = rides[ride]
+            itinerary.append(connection)
+        return itinerary[::-1]
+
+    def search(self, source, destination, after, seats=1, sort='earliest', limit=MAX_RESULTS):
+        """Connection ids of up to ``limit`` itineraries between two city keys"""
+        origin, target = self.stops.get(source), self.stops.get(destination)
+        if origin is None or target is None or origin == target:
+            return []
+        if sort == 'cheapest':
+            return self.cheapest(origin, target, after, seats, limit)
+
+        itineraries = []
+        while len(itineraries) < limit:
+            itinerary = self.earliest_arrival(origin, target, after, seats)
+            if itinerary is None:
+                break
+            itineraries.append(itinerary)
+            # The next itinerary leaves later
+            after = self.dep_time[itinerary[0]] + 1
+        return itineraries
+
+
+@dataclass
+class Itinerary:
+    legs: list
+    seats: int
+
+    @property
+    def departure(self):
+        return self.legs[0].datetime
+
+    @property
+    def arrival(self):
+        return self.legs[-1].arrival
+
+    @property
+    def duration(self):
+        return self.arrival - self.departure
+
+    @property
+    def transfers(self):
+        return len(self.legs) - 1
+
+    @property
+    def total_price(self):
+        return sum(leg.price for leg in self.legs) * self.seats
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _current_index():
+    """This process's index, rebuilt if it is out of date; call with the lock held"""
+    global _index
+    generation = get_generation(SCHEDULE_GENERATION_KEY)
+    if (
+        _index is None
+        or _index.generation != generation
+        or time.monotonic() - _index.built_at > INDEX_MAX_AGE
+    ):
+        _index = ConnectionIndex.build(generation)
+    return _index
+
+
+def _patch(pk):
+    generation = bump_generation(SCHEDULE_GENERATION_KEY)
+    with _index_lock:
+        # Only this change happened since the index was built or patched
+        if _index is None or generation != _index.generation + 1:
+            return
+        _index.remove(pk)
+        for row in schedule_rows(TravelOption.objects.filter(pk=pk)):
+            _index.add(row)
+        _index.generation = generation
+
+
+def schedule_changed(travel_option):
+    """Patch a saved or deleted travel option into the index once the transaction commits"""
+    pk = travel_option.pk
+    transaction.on_commit(lambda: _patch(pk))
+
+
+def search_connections(source, destination, after=None, seats=1, sort='earliest', limit=MAX_RESULTS):
+    """
+    Up to ``limit`` Itineraries from ``source`` to ``destination`` (city
+    names) leaving no earlier than ``after``, with ``seats`` free on every
+    leg: the earliest to arrive first, or the cheapest with
+    ``sort='cheapest'``.
+    """
+    after = max(after or timezone.now(), timezone.now())
+    source, destination = normalize_city(source), normalize_city(destination)
+
+    for _ in range(SEAT_CHECKS):
+        with _index_lock:
+            index = _current_index()
+            found = [
+                [index.pks[connection] for connection in itinerary]
+                for itinerary in index.search(source, destination, int(after.timestamp()), seats, sort, limit)
+            ]
+
+        legs = TravelOption.objects.in_bulk({pk for itinerary in found for pk in itinerary})
+        sold_out = {
+            pk for itinerary in found for pk in itinerary
+            if pk not in legs or legs[pk].available_seats < seats
+        }
+        if not sold_out:
+            break
+        with _index_lock:
+            # Reaches the index even if it was rebuilt meanwhile
+            for pk in sold_out:
+                if pk in _index.ids:
+                    _index.seats[_index.ids[pk]] = legs[pk].available_seats if pk in legs else 0
+
+    return [
+        Itinerary([legs[pk] for pk in itinerary], seats)
+        for itinerary in found
+        if not sold_out.intersection(itinerary)
+    ]
@@ -0,0 +1,92 @@
+"""
+CSV export of bookings for finance.
+
+Rows are read with ``.values_list()`` across the user and travel option
+joins, so each table is read by one query and no model instances are
+built (``Booking.__str__`` would otherwise fetch the user and travel
+option per row). The rows come from a database cursor a chunk at a time
+and are written out as they arrive, so memory stays flat for millions of
+bookings.
+
+Archived bookings are exported with the current ones: both tables are
+read in booking date order and their rows merged as they arrive, as
+``MergedKeysetPaginator`` does for My Bookings.
+"""
+from datetime import timedelta
+import csv
+import heapq
+
+from .models import ArchivedBooking, Booking
+from .search import start_of_day
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (CSV header, lookup)
+EXPORT_COLUMNS = (
+    ('booking_id', 'booking_id'),
+    ('booking_date', 'booking_date'),
+    ('status', 'status'),
+    ('username', 'user__username'),
+    ('email', 'user__email'),
+    ('travel_id', 'travel_option_id'),
+    ('type', 'travel_option__type'),
+    ('source', 'travel_option__source'),
+    ('destination', 'travel_option__destination'),
+    ('departure', 'travel_option__datetime'),
+    ('number_of_seats', 'number_of_seats'),
+    ('seat_numbers', 'seat_numbers'),
+    ('total_price', 'total_price'),
+)
+EXPORT_HEADERS = [header for header, _ in EXPORT_COLUMNS]
+BOOKING_ID_COLUMN = EXPORT_HEADERS.index('booking_id')
+BOOKING_DATE_COLUMN = EXPORT_HEADERS.index('booking_date')
+SEAT_NUMBERS_COLUMN = EXPORT_HEADERS.index('seat_numbers')
+
+
+class _Echo:
+    """A file-like object that hands back what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def filter_bookings(bookings, date_from=None, date_to=None, status=None):
+    """Bookings made on ``date_from`` through ``date_to`` with ``status``"""
+    if date_from:
+        bookings = bookings.filter(booking_date__gte=start_of_day(date_from))
+    if date_to:
+        bookings = bookings.filter(booking_date__lt=start_of_day(date_to + timedelta(days=1)))
+    if status:
+        bookings = bookings.filter(status=status)
+    return bookings
+
+
+def _export_key(row):
+    return row[BOOKING_DATE_COLUMN], row[BOOKING_ID_COLUMN]
+
+
+def _rows(bookings):
+    return (
+        bookings.using(bookings.db)
+        .order_by('booking_date', 'booking_id')
+        .values_list(*(lookup for _, lookup in EXPORT_COLUMNS))
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def csv_lines(*querysets):
+    """
+    The export of the bookings in ``querysets`` of Booking or
+    ArchivedBooking as CSV lines, header first, in booking date order. All
+    bookings, current and archived, by default.
+    """
+    if not querysets:
+        querysets = (Booking.objects.all(), ArchivedBooking.objects.all())
+    rows = heapq.merge(*(_rows(queryset) for queryset in querysets), key=_export_key)
+
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_HEADERS)
+    for row in rows:
+        row = list(row)
+        row[SEAT_NUMBERS_COLUMN] = ' '.join(map(str, row[SEAT_NUMBERS_COLUMN]))
+        yield writer.writerow(row)
@@ -0,0 +1,214 @@
+"""
+Fare calendar.
+
+``RouteDaySummary`` holds one row per route, travel type and day with the
+cheapest bookable fare, the departures that still have seats and the seats
+left on them. Every change to a travel option's seats, price, route or
+departure refreshes the rows it touches, so a calendar is a single range
+read on the summary's unique index instead of a scan of travel options.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import RouteDaySummary, TravelOption, normalize_city
+from .search import start_of_day
+
+CALENDAR_DAYS = 60
+REBUILD_BATCH_SIZE = 2000
+# Days refreshed per statement, keeping the OR of day filters short
+REFRESH_BATCH_SIZE = 200
+
+KEY_FIELDS = ('source_key', 'destination_key', 'type', 'date')
+TOTAL_FIELDS = ('min_price', 'departures', 'total_seats')
+
+_refresh_deferred = ContextVar('fare_calendar_refresh_deferred', default=False)
+
+
+def _day_totals(travel_options):
+    """Group travel options into summary rows"""
+    return (
+        travel_options.filter(available_seats__gt=0)
+        .annotate(date=TruncDate('datetime'))
+        .order_by()
+        .values(*KEY_FIELDS)
+        .annotate(
+            min_price=Min('price'),
+            departures=Count('pk'),
+            total_seats=Sum('available_seats'),
+        )
+    )
+
+
+def route_day(travel_option):
+    """The (source_key, destination_key, type, date) row a travel option counts towards"""
+    return (
+        travel_option.source_key,
+        travel_option.destination_key,
+        travel_option.type,
+        timezone.localdate(travel_option.datetime),
+    )
+
+
+def route_days(travel_options):
+    """Summary keys of travel options given as instances or primary keys"""
+    keys, pks = set(), []
+    for option in travel_options:
+        if isinstance(option, TravelOption):
+            keys.add(route_day(option))
+        else:
+            pks.append(option)
+
+    if pks:
+        for option in TravelOption.objects.filter(pk__in=pks).only(
+            'source_key', 'destination_key', 'type', 'datetime'
+        ):
+            keys.add(route_day(option))
+    return keys
+
+
+def queryset_route_days(travel_options):
+    """Summary keys of every travel option in a queryset, in one query"""
+    return set(
+        travel_options.annotate(date=TruncDate('datetime'))
+        .order_by()
+        .values_list(*KEY_FIELDS)
+        .distinct()
+    )
+
+
+def refresh_route_days(keys):
+    """
+    Recompute the summary rows for ``keys`` from the travel options table,
+    REFRESH_BATCH_SIZE days at a time.
+
+    The rows are locked before the travel options are read, so concurrent
+    refreshes of the same day run one after the other and each one sees
+    the seats the previous one committed.
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return
+
+    # No savepoint: a failed refresh must fail the seat change that caused it
+    with transaction.atomic(savepoint=False):
+        for start in range(0, len(keys), REFRESH_BATCH_SIZE):
+            _refresh_batch(keys[start:start + REFRESH_BATCH_SIZE])
+
+
+def _refresh_batch(keys):
+    by_key = reduce(or_, (
+        Q(source_key=source_key, destination_key=destination_key, type=travel_type, date=date)
+        for source_key, destination_key, travel_type, date in keys
+    ))
+    by_departure = reduce(or_, (
+        Q(
+            source_key=source_key,
+            destination_key=destination_key,
+            type=travel_type,
+            datetime__gte=start_of_day(date),
+            datetime__lt=start_of_day(date + timedelta(days=1)),
+        )
+        for source_key, destination_key, travel_type, date in keys
+    ))
+
+    RouteDaySummary.objects.bulk_create(
+        [RouteDaySummary(**dict(zip(KEY_FIELDS, key))) for key in keys],
+        ignore_conflicts=True,
+    )
+    summaries = list(
+        RouteDaySummary.objects.select_for_update().filter(by_key).order_by(*KEY_FIELDS)
+    )
+    totals = {
+        tuple(row[field] for field in KEY_FIELDS): row
+        for row in _day_totals(TravelOption.objects.filter(by_departure))
+    }
+
+    for summary in summaries:
+        row = totals.get(tuple(getattr(summary, field) for field in KEY_FIELDS), {})
+        summary.min_price = row.get('min_price')
+        summary.departures = row.get('departures', 0)
+        summary.total_seats = row.get('total_seats', 0)
+    RouteDaySummary.objects.bulk_update(summaries, TOTAL_FIELDS)
+
+
+def refresh_travel_options(travel_options):
+    """Refresh the summary rows of travel options given as instances or primary keys"""
+    refresh_route_days(route_days(travel_options))
+
+
+def rebuild_route_day_summaries():
+    """
+    Recompute the whole fare calendar, for use after bulk loads that skip
+    the model signals. Returns the number of summary rows written.
+    """
+    created = 0
+    batch = []
+    with transaction.atomic():
+        RouteDaySummary.objects.all().delete()
+        for row in _day_totals(TravelOption.objects.all()).iterator(chunk_size=REBUILD_BATCH_SIZE):
+            batch.append(RouteDaySummary(**row))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                created += len(RouteDaySummary.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            created += len(RouteDaySummary.objects.bulk_create(batch))
+    return created
+
+
+def refresh_deferred():
+    """Whether per-row refreshes are suspended by ``deferred_refresh()``"""
+    return _refresh_deferred.get()
+
+
+@contextmanager
+def deferred_refresh(rebuild=True):
+    """
+    Skip the per-row refreshes the model signals do inside the block, and
+    rebuild the calendar once when it completes. For bulk deletes and loads;
+    the caller invalidates the search cache. Pass ``rebuild=False`` when the
+    caller keeps the calendar right itself.
+    """
+    token = _refresh_deferred.set(True)
+    try:
+        yield
+    finally:
+        _refresh_deferred.reset(token)
+    if rebuild:
+        rebuild_route_day_summaries()
+
+
+def fare_calendar(source, destination, travel_type=None, start=None, days=CALENDAR_DAYS):
+    """
+    Cheapest fare, departures and seats left per day on a route for
+    ``days`` days from ``start`` (today by default), across all travel
+    types unless ``travel_type`` is given. Days with nothing bookable are
+    left out.
+    """
+    start = start or timezone.localdate()
+    summaries = RouteDaySummary.objects.filter(
+        source_key=normalize_city(source),
+        destination_key=normalize_city(destination),
+        date__gte=start,
+        date__lt=start + timedelta(days=days),
+        departures__gt=0,
+    )
+    if travel_type:
+        summaries = summaries.filter(type=travel_type)
+
+    return (
+        summaries.values('date')
+        .annotate(
+            min_price=Min('min_price'),
+            departures=Sum('departures'),
+            total_seats=Sum('total_seats'),
+        )
+        .order_by('date')
+    )
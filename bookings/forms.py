@@ -1,7 +1,10 @@
+import uuid
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm, AuthenticationForm
 from django.contrib.auth.models import User
-from .models import Booking, TravelOption
+from . import pricing, seatmaps
+from .models import Booking, TravelOption, Waitlist
 
 
 class CustomAuthenticationForm(AuthenticationForm):
@@ -91,9 +94,68 @@ class TravelOptionFilterForm(forms.Form):
     )
 
 
+class FareCalendarForm(forms.Form):
+    """Route and start day for the fare calendar"""
+    source = forms.CharField(
+        max_length=100,
+        widget=forms.TextInput(attrs={'placeholder': 'Source city', 'class': 'form-control'})
+    )
+    destination = forms.CharField(
+        max_length=100,
+        widget=forms.TextInput(attrs={'placeholder': 'Destination city', 'class': 'form-control'})
+    )
+    travel_type = forms.ChoiceField(
+        choices=[('', 'All Types')] + TravelOption.TRAVEL_TYPES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    start = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+
+
+class ConnectionSearchForm(forms.Form):
+    """Route, day and party size for connecting itineraries"""
+    source = forms.CharField(
+        max_length=100,
+        widget=forms.TextInput(attrs={'placeholder': 'Source city', 'class': 'form-control'})
+    )
+    destination = forms.CharField(
+        max_length=100,
+        widget=forms.TextInput(attrs={'placeholder': 'Destination city', 'class': 'form-control'})
+    )
+    date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    seats = forms.IntegerField(
+        min_value=1,
+        max_value=10,
+        initial=1,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+    sort = forms.ChoiceField(
+        choices=[('earliest', 'Earliest arrival'), ('cheapest', 'Cheapest')],
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+
 class BookingForm(forms.ModelForm):
     """Form for creating a new booking"""
     
+    seats = forms.CharField(
+        required=False,
+        help_text='Leave blank to get the best seats available together',
+        widget=forms.TextInput(attrs={'placeholder': 'e.g. 12, 13', 'class': 'form-control'})
+    )
+    # Identifies this submission so a retry returns the first booking
+    idempotency_key = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    # The signed price the page showed, which the booking is charged
+    price_quote = forms.CharField(required=False, widget=forms.HiddenInput)
+    
     class Meta:
         model = Booking
         fields = ['number_of_seats']
@@ -101,6 +163,7 @@ class BookingForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.travel_option = kwargs.pop('travel_option', None)
         super().__init__(*args, **kwargs)
+        self.fields['idempotency_key'].initial = uuid.uuid4
         
         self.fields['number_of_seats'].widget.attrs.update({
             'class': 'form-control',
@@ -109,6 +172,7 @@ class BookingForm(forms.ModelForm):
         })
         
         if self.travel_option:
+            self.fields['price_quote'].initial = pricing.sign_quote(self.travel_option)
             self.fields['number_of_seats'].help_text = f"Maximum {self.travel_option.available_seats} seats available"
 
     def clean_number_of_seats(self):
@@ -121,6 +185,45 @@ class BookingForm(forms.ModelForm):
         
         return number_of_seats
 
+    def clean_seats(self):
+        try:
+            return sorted({int(seat) for seat in self.cleaned_data['seats'].replace(',', ' ').split()})
+        except ValueError:
+            raise forms.ValidationError('Enter seat numbers separated by commas.')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        seats = cleaned_data.get('seats')
+        number_of_seats = cleaned_data.get('number_of_seats')
+        
+        if seats and number_of_seats and len(seats) != number_of_seats:
+            self.add_error('seats', f'Choose exactly {number_of_seats} seat(s).')
+        elif seats and self.travel_option:
+            if self.travel_option.seat_map is None:
+                self.add_error('seats', 'Seat selection is not available for this travel option.')
+            else:
+                taken = set(seats) - set(seatmaps.free_seats(self.travel_option.seat_map))
+                if taken:
+                    self.add_error(
+                        'seats',
+                        f"Seat(s) {', '.join(map(str, sorted(taken)))} are not available."
+                    )
+        
+        return cleaned_data
+
+
+class WaitlistForm(forms.ModelForm):
+    """Form for joining the waitlist of a sold-out travel option"""
+    
+    class Meta:
+        model = Waitlist
+        fields = ['number_of_seats']
+        
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['number_of_seats'].widget.attrs.update({'class': 'form-control', 'min': '1'})
+        self.fields['number_of_seats'].help_text = "You'll be booked automatically when this many seats free up"
+
 
 class BookingSearchForm(forms.Form):
     """Form for searching user's bookings"""
@@ -0,0 +1,76 @@
+"""
+Idempotency keys for booking submissions.
+
+The booking form carries a random key, and clients may send their own in
+an ``Idempotency-Key`` header instead. The key is stored with the booking
+it produced in the same transaction, so a retry of a submission that went
+through finds the booking with one indexed read and never touches the
+travel option again. Keys expire after IDEMPOTENCY_KEY_TTL seconds.
+"""
+from datetime import timedelta
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+PURGE_BATCH_SIZE = 5000
+
+
+def request_key(request):
+    """The idempotency key of a submission as a UUID, or None"""
+    value = request.POST.get('idempotency_key') or request.headers.get(IDEMPOTENCY_HEADER)
+    try:
+        return uuid.UUID(value) if value else None
+    except ValueError:
+        return None
+
+
+def replayed_booking(user, key):
+    """The booking a still-valid key already produced, or None"""
+    stored = (
+        IdempotencyKey.objects.filter(user=user, key=key)
+        .select_related('booking')
+        .first()
+    )
+    if stored is None:
+        return None
+    if stored.expires_at <= timezone.now():
+        # Free the key for reuse before it is written again
+        stored.delete()
+        return None
+    return stored.booking
+
+
+def remember(user, key, booking):
+    """
+    Store the booking a key produced. Call inside the transaction that
+    made the booking: if a concurrent retry stored the key first, this
+    raises IntegrityError and the duplicate booking is rolled back with it.
+    """
+    with transaction.atomic():
+        IdempotencyKey.objects.create(
+            user=user,
+            key=key,
+            booking=booking,
+            expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+        )
+
+
+def purge_expired_keys(batch_size=PURGE_BATCH_SIZE):
+    """Delete expired keys in batches of ``batch_size``. Returns the number deleted."""
+    deleted = 0
+    now = timezone.now()
+    while True:
+        pks = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
+
+
@@ -0,0 +1,244 @@
+"""
+Seat inventory for travel options.
+
+Every change to ``TravelOption.available_seats`` and ``seat_map`` goes
+through this module. Seats are taken and given back with the travel
+option's row locked, and the counter is rewritten from the seat map in the
+same UPDATE, so two concurrent bookings can never both get the same seat
+and the counter always matches the map. Travel options without a seat map
+fall back to a conditional UPDATE of the counter alone. Each change also
+refreshes the fare calendar rows of the travel options it touched.
+
+Batch callers such as ``bookings.waitlist`` lock travel options with
+``lock_travel_options()``, take seats in memory with ``take_seats()`` and
+write them back themselves.
+"""
+from collections import defaultdict
+
+from django.db import connections, transaction
+from django.db.models import F
+
+from . import seatmaps
+from .models import TravelOption, Booking, Waitlist
+from .cache import invalidate_search_cache, invalidate_travel_options
+from .fares import refresh_travel_options
+
+
+def _travel_option_pk(travel_option):
+    return getattr(travel_option, 'pk', travel_option)
+
+
+def lock_travel_options(travel_options):
+    """
+    ``travel_options`` with their rows locked until the transaction ends.
+
+    SQLite has no row locks, so there a no-op UPDATE takes the database
+    write lock before anything is read; reading first would mean upgrading
+    the lock later, which fails with "database is locked" under contention
+    instead of waiting.
+    """
+    if connections[travel_options.db].features.has_select_for_update:
+        return travel_options.select_for_update()
+    travel_options.update(available_seats=F('available_seats'))
+    return travel_options
+
+
+def _lock_seats(pk):
+    return (
+        lock_travel_options(TravelOption.objects.filter(pk=pk))
+        .values('available_seats', 'seat_capacity', 'seat_map')
+        .first()
+    )
+
+
+def _save_seat_map(pk, seat_map):
+    TravelOption.objects.filter(pk=pk).update(
+        seat_map=seat_map, available_seats=seatmaps.free_count(seat_map)
+    )
+
+
+def _seats_changed(travel_options):
+    refresh_travel_options(travel_options)
+    invalidate_search_cache()
+    invalidate_travel_options(_travel_option_pk(option) for option in travel_options)
+
+
+def take_seats(travel_option, number_of_seats):
+    """
+    Take the best available seats on a travel option the caller has locked
+    and loaded, changing only the instance; the caller saves
+    ``available_seats`` and ``seat_map``.
+
+    Returns the seat numbers taken, an empty list for travel options
+    without a seat map, or None if too few seats are free.
+    """
+    if travel_option.seat_map is None:
+        if travel_option.available_seats < number_of_seats:
+            return None
+        travel_option.available_seats -= number_of_seats
+        return []
+
+    seats = seatmaps.best_available(travel_option.seat_map, number_of_seats)
+    if seats is None:
+        return None
+    travel_option.seat_map = seatmaps.claim(travel_option.seat_map, travel_option.seat_capacity, seats)
+    travel_option.available_seats = seatmaps.free_count(travel_option.seat_map)
+    return seats
+
+
+def held_seats(travel_option):
+    """Seat numbers held by the confirmed bookings on a travel option"""
+    return [
+        seat
+        for seat_numbers in Booking.objects.filter(
+            travel_option=_travel_option_pk(travel_option), status='Confirmed'
+        ).values_list('seat_numbers', flat=True)
+        for seat in seat_numbers
+    ]
+
+
+def claim_seats(travel_option, number_of_seats=None, seat_numbers=None):
+    """
+    Take the given ``seat_numbers`` on a travel option, or the best
+    available ``number_of_seats`` (adjacent if possible).
+
+    Returns the seat numbers taken, an empty list for travel options
+    without a seat map, or None if the option does not exist or the seats
+    are not all free.
+    """
+    if seat_numbers:
+        seat_numbers = sorted(set(seat_numbers))
+        number_of_seats = len(seat_numbers)
+    if not number_of_seats or number_of_seats < 1:
+        raise ValueError('number_of_seats must be at least 1')
+
+    pk = _travel_option_pk(travel_option)
+    with transaction.atomic():
+        row = _lock_seats(pk)
+        if row is None:
+            return None
+
+        if row['seat_map'] is None:
+            if seat_numbers:
+                return None
+            updated = TravelOption.objects.filter(
+                pk=pk, available_seats__gte=number_of_seats,
+            ).update(available_seats=F('available_seats') - number_of_seats)
+            if not updated:
+                return None
+            seats = []
+        else:
+            seats = seat_numbers or seatmaps.best_available(row['seat_map'], number_of_seats)
+            seat_map = seats and seatmaps.claim(row['seat_map'], row['seat_capacity'], seats)
+            if not seat_map:
+                return None
+            _save_seat_map(pk, seat_map)
+
+        _seats_changed([travel_option])
+    return seats
+
+
+def reserve_seats(travel_option, number_of_seats):
+    """
+    Take ``number_of_seats`` from a travel option.
+
+    Returns True if the seats were reserved, False if the option does not
+    exist or has fewer seats left than requested.
+    """
+    return claim_seats(travel_option, number_of_seats) is not None
+
+
+def release_seats(travel_option, number_of_seats, seat_numbers=None):
+    """
+    Give ``number_of_seats`` back to a travel option: ``seat_numbers`` if
+    given, and otherwise taken seats no confirmed booking holds.
+
+    Returns True if the travel option was updated.
+    """
+    if number_of_seats < 1:
+        raise ValueError('number_of_seats must be at least 1')
+
+    pk = _travel_option_pk(travel_option)
+    with transaction.atomic():
+        row = _lock_seats(pk)
+        if row is None:
+            return False
+
+        if row['seat_map'] is None:
+            TravelOption.objects.filter(pk=pk).update(
+                available_seats=F('available_seats') + number_of_seats
+            )
+        else:
+            seat_map, freed = seatmaps.release(
+                row['seat_map'], row['seat_capacity'], seat_numbers or []
+            )
+            if freed < number_of_seats:
+                seat_map, _ = seatmaps.release_any(
+                    seat_map, row['seat_capacity'], number_of_seats - freed, held_seats(pk)
+                )
+            _save_seat_map(pk, seat_map)
+
+        _seats_changed([travel_option])
+    return True
+
+
+def cancel_all_bookings(travel_options):
+    """
+    Cancel every confirmed booking on the given travel options.
+
+    The seats of all confirmed bookings are read by one query, streamed
+    2000 rows at a time (one fetch per chunk, from a server-side cursor
+    where the database has them) so memory stays flat however many
+    bookings there are. They are given back to the travel options in a
+    bulk UPDATE, which the backend may split into batches when there are
+    many travel options, then the bookings are flipped to Cancelled in a
+    single UPDATE. Waitlist entries are cancelled too, so nobody is
+    promoted onto a pulled travel option, and the fare calendar is
+    refreshed once for all the days involved. Returns the number of
+    bookings cancelled.
+    """
+    travel_option_pks = [_travel_option_pk(option) for option in travel_options]
+
+    with transaction.atomic():
+        # Lock the travel options so no booking lands between the read and the updates
+        locked = list(
+            lock_travel_options(TravelOption.objects.filter(pk__in=travel_option_pks))
+            .only(
+                'source_key', 'destination_key', 'type', 'datetime',
+                'available_seats', 'seat_capacity', 'seat_map',
+            )
+        )
+
+        confirmed = Booking.objects.filter(
+            travel_option__in=travel_option_pks, status='Confirmed'
+        )
+        booked = defaultdict(int)
+        numbered = defaultdict(list)
+        for travel_option_pk, number_of_seats, seat_numbers in confirmed.values_list(
+            'travel_option', 'number_of_seats', 'seat_numbers'
+        ).iterator(chunk_size=2000):
+            booked[travel_option_pk] += number_of_seats
+            numbered[travel_option_pk].extend(seat_numbers)
+
+        for option in locked:
+            if option.seat_map is None:
+                option.available_seats += booked[option.pk]
+                continue
+            seat_map, freed = seatmaps.release(
+                option.seat_map, option.seat_capacity, numbered[option.pk]
+            )
+            option.seat_map, _ = seatmaps.release_any(
+                seat_map, option.seat_capacity, booked[option.pk] - freed
+            )
+            option.available_seats = seatmaps.free_count(option.seat_map)
+
+        TravelOption.objects.bulk_update(locked, ['available_seats', 'seat_map'])
+        cancelled = confirmed.update(status='Cancelled')
+        Waitlist.objects.filter(
+            travel_option__in=travel_option_pks, status='Waiting'
+        ).update(status='Cancelled')
+        refresh_travel_options(locked)
+
+    invalidate_search_cache()
+    invalidate_travel_options(travel_option_pks)
+    return cancelled
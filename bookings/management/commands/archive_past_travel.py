@@ -0,0 +1,76 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bookings.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, archive_cutoff, archive_past_travel
+from bookings.benchmarks import summarize_latencies
+from bookings.models import Booking, TravelOption
+from bookings.search import search_travel_options, upcoming_travel_options
+
+# Queries on the hot tables timed by --benchmark
+HOT_QUERIES = {
+    'home': lambda: list(upcoming_travel_options()[:6]),
+    'search_route': lambda: list(
+        search_travel_options({'source': 'Boston', 'destination': 'New York'})[:20]
+    ),
+    'search_max_price': lambda: list(search_travel_options({'max_price': 60})[:20]),
+    'count_bookable': lambda: TravelOption.objects.filter(available_seats__gt=0).count(),
+    'count_confirmed_bookings': lambda: Booking.objects.filter(status='Confirmed').count(),
+}
+
+
+class Command(BaseCommand):
+    help = 'Move departed travel options and their bookings into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                            help=f'Archive departures more than this many days ago (default: {ARCHIVE_AFTER_DAYS})')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                            help=f'Travel options moved per transaction (default: {ARCHIVE_BATCH_SIZE})')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Time queries on the hot tables before and after archiving')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Runs of each benchmark query (default: 20)')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        if options['batch_size'] < 1 or options['repeat'] < 1:
+            raise CommandError('--batch-size and --repeat must be at least 1')
+
+        before = self._benchmark(options['repeat']) if options['benchmark'] else None
+
+        def progress(travel_options, bookings):
+            self.stdout.write(f'Archived {travel_options} travel options...')
+
+        started = time.perf_counter()
+        travel_options, bookings = archive_past_travel(
+            archive_cutoff(options['days']), options['batch_size'], progress
+        )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Archived {travel_options} travel options and {bookings} bookings in {elapsed:.2f}s'
+            )
+        )
+
+        if before:
+            after = self._benchmark(options['repeat'])
+            self.stdout.write(json.dumps({'before': before, 'after': after}, indent=2))
+
+    def _benchmark(self, repeat):
+        report = {
+            'travel_options': TravelOption.objects.count(),
+            'bookings': Booking.objects.count(),
+            'queries': {},
+        }
+        for name, query in HOT_QUERIES.items():
+            query()  # warm up
+            latencies = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                query()
+                latencies.append(time.perf_counter() - started)
+            report['queries'][name] = summarize_latencies(latencies)
+        return report
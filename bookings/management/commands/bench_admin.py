@@ -0,0 +1,71 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from bookings.benchmarks import allowed_host, summarize_latencies
+
+BENCH_USERNAME = 'bench_admin'
+
+# (URL name, query parameters) of the changelist pages to load
+PAGES = (
+    ('admin:bookings_booking_changelist', {}),
+    ('admin:bookings_booking_changelist', {'status__exact': 'Confirmed'}),
+    ('admin:bookings_traveloption_changelist', {}),
+    ('admin:bookings_traveloption_changelist', {'source': 'Boston', 'type__exact': 'Flight'}),
+    ('admin:bookings_waitlist_changelist', {}),
+)
+
+
+class Command(BaseCommand):
+    help = 'Measure SQL queries and latency of the admin changelists on the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5,
+                            help='Loads of each changelist page (default: 5)')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+
+        user = User.objects.create_superuser(BENCH_USERNAME, f'{BENCH_USERNAME}@example.com', None)
+        try:
+            client = Client(HTTP_HOST=allowed_host())
+            client.force_login(user)
+            report = {
+                'bookings': self._rows('bookings_booking'),
+                'travel_options': self._rows('bookings_traveloption'),
+                'pages': [self._measure(client, name, params, options['requests']) for name, params in PAGES],
+            }
+        finally:
+            user.delete()
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _rows(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0]
+
+    def _measure(self, client, name, params, requests):
+        url = reverse(name)
+        latencies, queries = [], set()
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url, params, secure=True)
+                latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(f'{url} returned {response.status_code}')
+            queries.add(len(captured))
+        return {
+            'page': url,
+            'params': params,
+            # Session and user lookups included
+            'queries': sorted(queries),
+            'latency': summarize_latencies(latencies),
+        }
@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from bookings.benchmarks import summarize_latencies
+
+SERVERS = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = 'Compare read-page throughput of the sync views under WSGI and the async views under ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='Requests sent to each entry point (default: 1000)')
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help='Requests in flight at once (default: 32)')
+        parser.add_argument('--wsgi-threads', type=int, default=1,
+                            help='Threads serving WSGI requests; 1 matches a gunicorn sync worker (default: 1)')
+        parser.add_argument('--views', default='home,travel_options_list',
+                            help='Comma-separated URL names to request in turn (default: home,travel_options_list)')
+        parser.add_argument('--server', choices=SERVERS, help='Run one side only (used internally)')
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['concurrency'], options['wsgi_threads']) < 1:
+            raise CommandError('--requests, --concurrency and --wsgi-threads must be at least 1')
+
+        if options['server']:
+            # AsyncClient always sends 'Host: testserver'
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self.stdout.write(json.dumps(self._run(options)))
+            return
+
+        # ASYNC_VIEWS is read when the URLconf loads, so each side gets its own process
+        report = {}
+        for server in SERVERS:
+            env = dict(os.environ, ASYNC_VIEWS=str(server == 'asgi'))
+            command = [
+                sys.executable, '-m', 'django', 'bench_asgi', '--server', server,
+                '--requests', str(options['requests']),
+                '--concurrency', str(options['concurrency']),
+                '--wsgi-threads', str(options['wsgi_threads']),
+                '--views', options['views'],
+            ]
+            result = subprocess.run(
+                command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True
+            )
+            if result.returncode:
+                raise CommandError(f'{server} run failed:\n{result.stderr}')
+            report[server] = json.loads(result.stdout.strip().splitlines()[-1])
+
+        report['asgi_vs_wsgi_throughput'] = round(
+            report['asgi']['throughput_rps'] / report['wsgi']['throughput_rps'], 2
+        )
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _run(self, options):
+        urls = [reverse(name.strip()) for name in options['views'].split(',')]
+        paths = [urls[i % len(urls)] for i in range(options['requests'])]
+
+        started = time.perf_counter()
+        if options['server'] == 'asgi':
+            samples = asyncio.run(self._run_asgi(paths, options['concurrency']))
+        else:
+            samples = self._run_wsgi(paths, options['wsgi_threads'])
+        elapsed = time.perf_counter() - started
+        latencies = [seconds for _, seconds in samples]
+
+        return {
+            'server': options['server'],
+            'async_views': settings.ASYNC_VIEWS,
+            'requests': len(latencies),
+            'elapsed_s': round(elapsed, 3),
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'errors': sum(1 for status_code, _ in samples if status_code != 200),
+            'latency': summarize_latencies(latencies),
+        }
+
+    def _run_wsgi(self, paths, threads):
+        def timed(path):
+            started = time.perf_counter()
+            response = client.get(path, secure=True)
+            return response.status_code, time.perf_counter() - started
+
+        client = Client()
+        client.get(paths[0], secure=True)  # warm up
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(timed, paths))
+
+    async def _run_asgi(self, paths, concurrency):
+        client = AsyncClient()
+        await client.get(paths[0], secure=True)  # warm up
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(path):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path, secure=True)
+                return response.status_code, time.perf_counter() - started
+
+        return await asyncio.gather(*(timed(path) for path in paths))
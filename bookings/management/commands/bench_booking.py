@@ -0,0 +1,244 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import json
+import multiprocessing
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.db.models import Q, Sum
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from bookings.benchmarks import allowed_host, summarize_latencies
+from bookings.cache import invalidate_schedule, invalidate_search_cache
+from bookings import seatmaps
+from bookings.models import TravelOption, Booking
+from bookings.seeding import generate_chunk
+
+BENCH_USER_PREFIX = 'bench_user_'
+OPERATIONS = ('book', 'cancel', 'search')
+
+
+def _retry_locked(call):
+    """
+    ``call()``, retried while SQLite reports lock contention as an error
+    instead of waiting. Requests are not retried: their errors are counted.
+    """
+    while True:
+        try:
+            return call()
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            time.sleep(0.001)
+
+
+def run_worker(worker_index, user_id, travel_ids, requests, weights, seed):
+    """
+    Send ``requests`` requests as one user and time each of them.
+
+    Returns a list of ``(operation, status_code, seconds, query_count)``.
+    """
+    rng = random.Random(seed * 7919 + worker_index)
+    client = Client(HTTP_HOST=allowed_host(), raise_request_exception=False)
+    _retry_locked(lambda: client.force_login(User.objects.get(pk=user_id)))
+    samples = []
+
+    try:
+        for _ in range(requests):
+            operation = rng.choices(OPERATIONS, weights)[0]
+
+            booking_id = None
+            if operation == 'cancel':
+                booking_id = _retry_locked(
+                    lambda: Booking.objects.filter(
+                        user_id=user_id, status='Confirmed'
+                    ).values_list('pk', flat=True).first()
+                )
+                if booking_id is None:
+                    operation = 'book'
+
+            if operation == 'book':
+                url = reverse('book_travel', kwargs={'travel_id': rng.choice(travel_ids)})
+                data = {'number_of_seats': rng.randint(1, 2)}
+            elif operation == 'cancel':
+                url = reverse('cancel_booking', kwargs={'booking_id': booking_id})
+                data = {}
+            else:
+                url = reverse('travel_options_list')
+                data = None
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                if data is None:
+                    response = client.get(url, secure=True)
+                else:
+                    response = client.post(url, data, secure=True)
+                elapsed = time.perf_counter() - started
+
+            samples.append((operation, response.status_code, elapsed, len(queries)))
+    finally:
+        connection.close()
+
+    return samples
+
+
+class Command(BaseCommand):
+    help = 'Benchmark book_travel, cancel_booking and travel_options_list under concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--travel-options', type=int, default=5,
+                            help='Travel options to create; few options means more contention (default: 5)')
+        parser.add_argument('--seats', type=int, default=200,
+                            help='Seats on each benchmark travel option (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Number of concurrent workers, one user each (default: 8)')
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Requests sent by each worker (default: 100)')
+        parser.add_argument('--mode', choices=['threads', 'processes'], default='threads',
+                            help='Run workers as threads or forked processes (default: threads)')
+        parser.add_argument('--mix', default='5,2,3',
+                            help='Relative weights of book,cancel,search requests (default: 5,2,3)')
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Random seed for the dataset and request mix (default: 1)')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the benchmark users, travel options and bookings afterwards')
+
+    def handle(self, *args, **options):
+        try:
+            weights = [float(weight) for weight in options['mix'].split(',')]
+        except ValueError:
+            raise CommandError('--mix must be three comma-separated numbers')
+        if len(weights) != len(OPERATIONS) or sum(weights) <= 0:
+            raise CommandError('--mix must be three comma-separated numbers')
+        if min(options['travel_options'], options['seats'], options['concurrency'], options['requests']) < 1:
+            raise CommandError('--travel-options, --seats, --concurrency and --requests must be at least 1')
+
+        travel_ids, user_ids = self._seed(options)
+        try:
+            report = self._run(options, weights, travel_ids, user_ids)
+        finally:
+            if not options['keep']:
+                TravelOption.objects.filter(pk__in=travel_ids).delete()
+                User.objects.filter(pk__in=user_ids).delete()
+
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+
+    def _seed(self, options):
+        travel_options, _ = generate_chunk(
+            options['seed'], 0, options['travel_options'], timezone.now() + timedelta(days=1), 0, []
+        )
+        rows = []
+        for travel_id, travel_type, source, destination, departure, price, *_, arrival in travel_options:
+            option = TravelOption(
+                travel_id=travel_id,
+                type=travel_type,
+                source=source,
+                destination=destination,
+                datetime=departure,
+                arrival=arrival,
+                price=price,
+                available_seats=options['seats'],
+                seat_capacity=options['seats'],
+                seat_map=seatmaps.all_free(options['seats']),
+            )
+            option.set_route_keys()
+            rows.append(option)
+        TravelOption.objects.bulk_create(rows)
+        invalidate_search_cache()
+        invalidate_schedule()
+
+        User.objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+        password = make_password(None)
+        users = User.objects.bulk_create([
+            User(username=f'{BENCH_USER_PREFIX}{i}', password=password)
+            for i in range(options['concurrency'])
+        ])
+        user_ids = list(
+            User.objects.filter(username__in=[user.username for user in users]).values_list('pk', flat=True)
+        )
+        return [str(option.travel_id) for option in rows], user_ids
+
+    def _run(self, options, weights, travel_ids, user_ids):
+        jobs = [
+            (index, user_id, travel_ids, options['requests'], weights, options['seed'])
+            for index, user_id in enumerate(user_ids)
+        ]
+
+        started = time.perf_counter()
+        if options['mode'] == 'processes':
+            # Children must open their own connections after the fork
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(len(jobs)) as pool:
+                results = pool.starmap(run_worker, jobs)
+        else:
+            with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+                results = list(executor.map(lambda job: run_worker(*job), jobs))
+        elapsed = time.perf_counter() - started
+
+        by_operation = defaultdict(list)
+        for samples in results:
+            for sample in samples:
+                by_operation[sample[0]].append(sample)
+
+        total = sum(len(samples) for samples in by_operation.values())
+        report = {
+            'config': {
+                key: options[key]
+                for key in ('travel_options', 'seats', 'concurrency', 'requests', 'mode', 'mix', 'seed')
+            },
+            'database': connection.vendor,
+            'elapsed_s': round(elapsed, 3),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else None,
+            'errors': sum(1 for samples in by_operation.values() for sample in samples if sample[1] >= 500),
+            'operations': {},
+            'oversell_violations': self._oversell_violations(travel_ids, options['seats']),
+        }
+        for operation in OPERATIONS:
+            samples = by_operation.get(operation, [])
+            summary = summarize_latencies([sample[2] for sample in samples])
+            if samples:
+                summary['throughput_rps'] = round(len(samples) / elapsed, 2)
+                summary['errors'] = sum(1 for sample in samples if sample[1] >= 500)
+                summary['queries_mean'] = round(sum(sample[3] for sample in samples) / len(samples), 2)
+                summary['queries_max'] = max(sample[3] for sample in samples)
+            report['operations'][operation] = summary
+        return report
+
+    def _oversell_violations(self, travel_ids, seats):
+        """
+        Options whose free seats plus confirmed bookings differ from
+        capacity, or whose seat map does not match the seats booked
+        """
+        held = defaultdict(list)
+        for travel_id, seat_numbers in Booking.objects.filter(
+            travel_option__in=travel_ids, status='Confirmed'
+        ).values_list('travel_option', 'seat_numbers'):
+            held[travel_id].extend(seat_numbers)
+
+        options = TravelOption.objects.filter(pk__in=travel_ids).annotate(
+            booked=Sum('bookings__number_of_seats', filter=Q(bookings__status='Confirmed'))
+        )
+        violations = []
+        for option in options:
+            taken = sorted(set(range(1, seats + 1)) - set(seatmaps.free_seats(option.seat_map)))
+            if option.available_seats + (option.booked or 0) != seats or sorted(held[option.pk]) != taken:
+                violations.append({
+                    'travel_id': str(option.travel_id),
+                    'available_seats': option.available_seats,
+                    'booked_seats': option.booked or 0,
+                    'seats_taken_on_map': len(taken),
+                })
+        return violations
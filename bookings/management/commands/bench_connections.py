@@ -0,0 +1,68 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from bookings.benchmarks import summarize_latencies
+from bookings.connections import SORTS, ConnectionIndex, schedule_rows, search_connections
+from bookings.models import TravelOption
+
+
+class Command(BaseCommand):
+    help = 'Measure connection index builds, patches and itinerary searches on the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Searches of each sort between random cities (default: 200)')
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Seed for picking the cities (default: 1)')
+
+    def handle(self, *args, **options):
+        if options['queries'] < 1:
+            raise CommandError('--queries must be at least 1')
+
+        started = time.perf_counter()
+        index = ConnectionIndex.build()
+        build_seconds = time.perf_counter() - started
+        if len(index.cities) < 2:
+            raise CommandError('Not enough departures with arrival times; run seed_data first')
+
+        # Replace one departure in place, as a saved travel option is
+        pk = index.pks[index.order[len(index) // 2]]
+        row = schedule_rows(TravelOption.objects.filter(pk=pk)).get()
+        patches = []
+        for _ in range(options['queries']):
+            started = time.perf_counter()
+            index.add(row)
+            patches.append(time.perf_counter() - started)
+
+        rng = random.Random(options['seed'])
+        cities = list(index.stops)
+        now = int(timezone.now().timestamp())
+        report = {
+            'departures': len(index),
+            'cities': len(cities),
+            'build_s': round(build_seconds, 3),
+            'patch': summarize_latencies(patches),
+        }
+        for sort in SORTS:
+            latencies, found = [], 0
+            for _ in range(options['queries']):
+                source, destination = rng.sample(cities, 2)
+                after = now + rng.randint(0, 20 * 24 * 60 * 60)
+                started = time.perf_counter()
+                found += bool(index.search(source, destination, after, sort=sort))
+                latencies.append(time.perf_counter() - started)
+            report[sort] = {'found': found, 'latency': summarize_latencies(latencies)}
+
+        # With the seat check and the legs read back from the database
+        latencies = []
+        for _ in range(options['queries']):
+            source, destination = rng.sample([index.cities[stop] for stop in index.stops.values()], 2)
+            started = time.perf_counter()
+            search_connections(source, destination)
+            latencies.append(time.perf_counter() - started)
+        report['search_connections'] = {'latency': summarize_latencies(latencies)}
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,75 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+from bookings.benchmarks import allowed_host, percentile, summarize_latencies
+from bookings.metrics import registry
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request cost of MetricsMiddleware and template instrumentation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per view and configuration in each round (default: 500)')
+        parser.add_argument('--rounds', type=int, default=3,
+                            help='Alternating off/on rounds, to even out noise (default: 3)')
+        parser.add_argument('--views', default='home,travel_options_list',
+                            help='Comma-separated URL names to request (default: home,travel_options_list)')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['rounds'] < 1:
+            raise CommandError('--requests and --rounds must be at least 1')
+
+        middleware = [
+            name for name in settings.MIDDLEWARE if name != 'bookings.metrics.MetricsMiddleware'
+        ]
+        templates = [dict(engine) for engine in settings.TEMPLATES]
+        plain_templates = [
+            dict(engine, BACKEND='django.template.backends.django.DjangoTemplates') for engine in templates
+        ]
+        instrumented_templates = [
+            dict(engine, BACKEND='bookings.metrics.InstrumentedDjangoTemplates') for engine in templates
+        ]
+        configurations = {
+            'off': override_settings(MIDDLEWARE=middleware, TEMPLATES=plain_templates),
+            'on': override_settings(
+                MIDDLEWARE=['bookings.metrics.MetricsMiddleware'] + middleware,
+                TEMPLATES=instrumented_templates,
+            ),
+        }
+
+        report = {}
+        for url_name in options['views'].split(','):
+            url = reverse(url_name.strip())
+            latencies = {'off': [], 'on': []}
+            for _ in range(options['rounds']):
+                for name, configuration in configurations.items():
+                    with configuration:
+                        latencies[name].extend(self._time_requests(url, options['requests']))
+
+            off = percentile(latencies['off'], 50)
+            on = percentile(latencies['on'], 50)
+            report[url_name] = {
+                'off': summarize_latencies(latencies['off']),
+                'on': summarize_latencies(latencies['on']),
+                'added_p50_us': round((on - off) * 1_000_000, 1),
+                'added_p50_pct': round((on - off) / off * 100, 2),
+            }
+
+        registry.reset()
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _time_requests(self, url, requests):
+        client = Client(HTTP_HOST=allowed_host())
+        client.get(url, secure=True)  # warm up caches and connections
+
+        latencies = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            client.get(url, secure=True)
+            latencies.append(time.perf_counter() - started)
+        return latencies
@@ -0,0 +1,120 @@
+from collections import defaultdict
+from datetime import timedelta
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from bookings.benchmarks import allowed_host, summarize_latencies
+from bookings.models import Booking, TravelOption
+
+BENCH_USERNAME = 'bench_sessions_user'
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+MESSAGE_STORAGES = {
+    'fallback': 'django.contrib.messages.storage.fallback.FallbackStorage',
+    'session': 'django.contrib.messages.storage.session.SessionStorage',
+    'cookie': 'django.contrib.messages.storage.cookie.CookieStorage',
+}
+# Django's defaults, which the project ran with before SESSION_ENGINE and MESSAGE_STORAGE were set
+BASELINE = 'db+fallback'
+
+
+class Command(BaseCommand):
+    help = 'Count SQL and session queries per request for each session engine and message storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Times each step is repeated per configuration (default: 50)')
+        parser.add_argument('--configurations',
+                            default='db+fallback,db+session,db+cookie,cached_db+cookie,signed_cookies+cookie',
+                            help='Comma-separated session_engine+message_storage pairs to compare')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+        configurations = {}
+        for name in options['configurations'].split(','):
+            engine, _, storage = name.strip().partition('+')
+            if engine not in SESSION_ENGINES or storage not in MESSAGE_STORAGES:
+                raise CommandError(
+                    f'Unknown configuration {name!r}; engines are {", ".join(SESSION_ENGINES)} '
+                    f'and message storages {", ".join(MESSAGE_STORAGES)}'
+                )
+            configurations[name.strip()] = override_settings(
+                SESSION_ENGINE=SESSION_ENGINES[engine], MESSAGE_STORAGE=MESSAGE_STORAGES[storage],
+            )
+
+        user = User.objects.create_user(BENCH_USERNAME)
+        travel_option = TravelOption.objects.create(
+            type='Train',
+            source='Bench Source',
+            destination='Bench Destination',
+            datetime=timezone.now() + timedelta(days=30),
+            price=10,
+            available_seats=options['requests'] + 1,
+        )
+        try:
+            report = {}
+            for name, configuration in configurations.items():
+                with configuration:
+                    report[name] = self._run(user, travel_option, options['requests'])
+        finally:
+            Booking.objects.filter(user=user).delete()
+            travel_option.delete()
+            user.delete()
+
+        if BASELINE in report:
+            for name, steps in report.items():
+                for step, result in steps.items():
+                    result['queries_saved'] = round(
+                        report[BASELINE][step]['queries_per_request'] - result['queries_per_request'], 2
+                    )
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _run(self, user, travel_option, requests):
+        anonymous = Client(HTTP_HOST=allowed_host())
+        client = Client(HTTP_HOST=allowed_host())
+        client.force_login(user)
+        detail = reverse('travel_option_detail', args=[travel_option.pk])
+        book = reverse('book_travel', args=[travel_option.pk])
+
+        samples = defaultdict(list)  # step -> [(seconds, queries, session queries)]
+
+        def request(step, client, method, url, data=None):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data, secure=True)
+                elapsed = time.perf_counter() - started
+            session_queries = sum('django_session' in query['sql'] for query in queries)
+            samples[step].append((elapsed, len(queries), session_queries))
+            return response
+
+        for _ in range(requests):
+            request('anonymous_home', anonymous, 'get', reverse('home'))
+            request('anonymous_list', anonymous, 'get', reverse('travel_options_list'))
+            request('home', client, 'get', reverse('home'))
+            request('detail', client, 'get', detail)
+            # A booking sets a flash message, which the next page shows
+            request('book', client, 'post', book, {'number_of_seats': 1, 'seats': ''})
+            request('my_bookings', client, 'get', reverse('my_bookings'))
+            booking = Booking.objects.filter(user=user, status='Confirmed').first()
+            request('cancel', client, 'post', reverse('cancel_booking', args=[booking.pk]))
+            request('my_bookings', client, 'get', reverse('my_bookings'))
+
+        return {
+            step: {
+                'queries_per_request': round(sum(queries for _, queries, _ in rows) / len(rows), 2),
+                'session_queries_per_request': round(sum(session for _, _, session in rows) / len(rows), 2),
+                'latency': summarize_latencies([seconds for seconds, _, _ in rows]),
+            }
+            for step, rows in samples.items()
+        }
@@ -0,0 +1,96 @@
+import json
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from bookings.benchmarks import allowed_host, percentile, summarize_latencies
+from bookings.forms import TravelOptionFilterForm
+from bookings.pagination import KeysetPaginator
+from bookings.search import search_travel_options
+
+DUMMY_CACHE = 'django.core.cache.backends.dummy.DummyCache'
+FRAGMENT_CACHE = 'template_fragments'
+
+
+class Command(BaseCommand):
+    help = 'Measure travel options list render time with and without card fragment caching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-page', type=int, default=500,
+                            help='Travel options on the rendered page (default: 500)')
+        parser.add_argument('--rounds', type=int, default=20,
+                            help='Renders per mode (default: 20)')
+        parser.add_argument('--changed', type=float, default=0.1,
+                            help='Share of cards whose seats change before each render in the "changed" mode '
+                                 '(default: 0.1)')
+
+    def handle(self, *args, **options):
+        if options['per_page'] < 1 or options['rounds'] < 1:
+            raise CommandError('--per-page and --rounds must be at least 1')
+        if not 0 <= options['changed'] <= 1:
+            raise CommandError('--changed must be between 0 and 1')
+
+        page = KeysetPaginator(
+            search_travel_options({}), ('datetime', 'travel_id'), per_page=options['per_page'],
+        ).page(None)
+        if len(page.object_list) < options['per_page']:
+            raise CommandError(f'Only {len(page.object_list)} upcoming travel options; seed more first')
+
+        request = RequestFactory(HTTP_HOST=allowed_host()).get(reverse('travel_options_list'))
+        request.user = AnonymousUser()
+        context = {
+            'form': TravelOptionFilterForm({}),
+            'travel_options': page.object_list,
+            'page': page,
+            'next_querystring': '',
+            'first_querystring': '',
+            'card_cache_timeout': settings.CARD_CACHE_TIMEOUT,
+        }
+
+        rng = random.Random(0)
+        changed = round(options['changed'] * len(page.object_list))
+        fragments = settings.CACHES[FRAGMENT_CACHE]
+
+        def render():
+            started = time.perf_counter()
+            render_to_string('bookings/travel_options_list.html', context, request)
+            return time.perf_counter() - started
+
+        def change_seats():
+            for option in rng.sample(page.object_list, changed):
+                option.available_seats += 1
+
+        modes = {
+            'uncached': (dict(fragments, BACKEND=DUMMY_CACHE), None),
+            'cold': (fragments, lambda: caches[FRAGMENT_CACHE].clear()),
+            'warm': (fragments, None),
+            'changed': (fragments, change_seats),
+        }
+        latencies = {}
+        for mode, (backend, before_each) in modes.items():
+            with override_settings(CACHES=dict(settings.CACHES, **{FRAGMENT_CACHE: backend})):
+                caches[FRAGMENT_CACHE].clear()
+                render()  # compile and load the template
+                latencies[mode] = []
+                for _ in range(options['rounds']):
+                    if before_each:
+                        before_each()
+                    latencies[mode].append(render())
+                caches[FRAGMENT_CACHE].clear()
+
+        uncached = percentile(latencies['uncached'], 50)
+        report = {
+            'per_page': len(page.object_list),
+            'cache_backend': fragments['BACKEND'],
+            'changed_cards': changed,
+        }
+        for mode, seconds in latencies.items():
+            report[mode] = summarize_latencies(seconds)
+            report[mode]['saved_p50_pct'] = round((uncached - percentile(seconds, 50)) / uncached * 100, 1)
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,39 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from bookings.models import TravelOption
+from bookings.inventory import cancel_all_bookings
+
+
+class Command(BaseCommand):
+    help = 'Cancel every confirmed booking on one or more travel options'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'travel_ids',
+            nargs='+',
+            help='IDs of the travel options that were pulled',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            travel_ids = {uuid.UUID(travel_id) for travel_id in options['travel_ids']}
+        except ValueError as e:
+            raise CommandError(f'Invalid travel option ID: {e}')
+
+        found = set(
+            TravelOption.objects.filter(travel_id__in=travel_ids).values_list('travel_id', flat=True)
+        )
+        missing = travel_ids - found
+        if missing:
+            raise CommandError(
+                f'Travel options not found: {", ".join(str(travel_id) for travel_id in missing)}'
+            )
+
+        cancelled = cancel_all_bookings(found)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Cancelled {cancelled} bookings on {len(found)} travel options.'
+            )
+        )
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from bookings.exports import csv_lines, filter_bookings
+from bookings.models import ArchivedBooking, Booking
+
+
+def _date(value):
+    date = parse_date(value)
+    if date is None:
+        raise ValueError(value)
+    return date
+
+
+class Command(BaseCommand):
+    help = 'Write bookings as CSV, streamed from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', type=_date,
+                            help='First booking date to include (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', type=_date,
+                            help='Last booking date to include (YYYY-MM-DD)')
+        parser.add_argument('--status', choices=[status for status, _ in Booking.STATUS_CHOICES],
+                            help='Only bookings with this status')
+        parser.add_argument('--output', help='File to write (default: standard output)')
+
+    def handle(self, *args, **options):
+        if options['date_from'] and options['date_to'] and options['date_from'] > options['date_to']:
+            raise CommandError('--from must not be after --to')
+
+        # Archived bookings too, so past quarters export in full
+        bookings = [
+            filter_bookings(
+                queryset,
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+                status=options['status'],
+            )
+            for queryset in (Booking.objects.all(), ArchivedBooking.objects.all())
+        ]
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                rows = self._write(f, bookings)
+        else:
+            rows = self._write(self.stdout, bookings)
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f'Exported {rows} bookings to {options["output"]}'))
+
+    def _write(self, f, bookings):
+        rows = -1  # the header
+        for line in csv_lines(*bookings):
+            f.write(line)
+            rows += 1
+        return rows
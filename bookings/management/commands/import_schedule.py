@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bookings.schedule import FORMATS, IMPORT_CHUNK_SIZE, import_schedule
+
+
+class Command(BaseCommand):
+    help = 'Create or update travel options from a CSV or JSONL schedule file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Schedule file, or '-' for standard input")
+        parser.add_argument('--format', choices=FORMATS,
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help=f'Rows validated and upserted per transaction (default: {IMPORT_CHUNK_SIZE})')
+        parser.add_argument('--max-errors', type=int, default=100,
+                            help='Row errors to print (default: 100)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(f'Cannot tell the format of {path}; pass --format {"/".join(FORMATS)}')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        started = time.perf_counter()
+
+        def progress(result):
+            self.stdout.write(f'Processed {result.rows} rows...')
+
+        try:
+            if path == '-':
+                result = import_schedule(sys.stdin, file_format, options['chunk_size'], progress)
+            else:
+                with open(path, newline='', encoding='utf-8') as stream:
+                    result = import_schedule(stream, file_format, options['chunk_size'], progress)
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+        elapsed = time.perf_counter() - started
+
+        for line_number, message in result.errors[:options['max_errors']]:
+            self.stderr.write(f'Line {line_number}: {message}')
+        if len(result.errors) > options['max_errors']:
+            self.stderr.write(f'... and {len(result.errors) - options["max_errors"]} more errors')
+
+        style = self.style.WARNING if result.errors else self.style.SUCCESS
+        self.stdout.write(
+            style(
+                f'Imported {result.rows} rows: {result.created} created, '
+                f'{result.updated} updated, {len(result.errors)} errors'
+            )
+        )
+        self.stdout.write(
+            f'Throughput: {result.rows} rows in {elapsed:.2f}s '
+            f'({result.rows / elapsed if elapsed else 0:.0f} rows/sec)'
+        )
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bookings.waitlist import PROMOTION_BATCH_SIZE, promote_waitlist
+
+
+class Command(BaseCommand):
+    help = 'Book waiting users onto travel options whose seats have been freed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PROMOTION_BATCH_SIZE,
+                            help=f'Travel options promoted per transaction (default: {PROMOTION_BATCH_SIZE})')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, promoting every --interval seconds')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between passes with --loop (default: 5)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        while True:
+            promoted = promote_waitlist(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Promoted {promoted} waitlist entries'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
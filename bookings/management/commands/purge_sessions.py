@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from bookings.sessions import PURGE_BATCH_SIZE, purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE,
+                            help=f'Sessions deleted per statement (default: {PURGE_BATCH_SIZE})')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        deleted = purge_expired_sessions(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions'))
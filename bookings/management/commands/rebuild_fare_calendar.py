@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from bookings.fares import rebuild_route_day_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the fare calendar from all travel options'
+
+    def handle(self, *args, **options):
+        created = rebuild_route_day_summaries()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt fare calendar: {created} route days'))
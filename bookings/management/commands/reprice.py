@@ -0,0 +1,110 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from bookings.fares import deferred_refresh, rebuild_route_day_summaries
+from bookings.models import TravelOption
+from bookings.pricing import (
+    REPRICE_BATCH_SIZE, fill_base_prices, load_inventory, option_price, price_cents, reprice, write_prices,
+)
+
+
+class Command(BaseCommand):
+    help = 'Reprice upcoming travel options by days to departure and seats sold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REPRICE_BATCH_SIZE,
+                            help=f'Prices written per transaction (default: {REPRICE_BATCH_SIZE})')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Time each step and compare with repricing one row at a time')
+        parser.add_argument('--sample', type=int, default=10000,
+                            help='Rows repriced one at a time (and rolled back) by --benchmark (default: 10000)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['sample'] < 1:
+            raise CommandError('--batch-size and --sample must be at least 1')
+
+        if options['benchmark']:
+            self.stdout.write(json.dumps(self._benchmark(options['batch_size'], options['sample']), indent=2))
+            return
+
+        started = time.perf_counter()
+        priced, changed = reprice(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Repriced {priced} travel options, {changed} prices changed, in {elapsed:.2f}s '
+                f'({priced / elapsed if elapsed else 0:.0f} rows/sec)'
+            )
+        )
+
+    def _benchmark(self, batch_size, sample):
+        """
+        Time a full reprice and a per-row loop, then roll both back. Nothing
+        is invalidated, so caches keep serving the prices that are still live.
+        """
+        with transaction.atomic():
+            report = self._timed_reprice(batch_size, sample)
+            transaction.set_rollback(True)
+        return report
+
+    def _timed_reprice(self, batch_size, sample):
+        now = timezone.now()
+        report = {'per_row_loop': self._per_row_loop(now, sample)}
+
+        timings = {}
+        started = time.perf_counter()
+        fill_base_prices(now)
+        inventory = load_inventory(now)
+        timings['load_s'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        cents = price_cents(inventory, now)
+        changed = (cents != inventory.price_cents).nonzero()[0]
+        timings['compute_s'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        write_prices([inventory.pks[i] for i in changed], cents[changed], batch_size)
+        timings['write_s'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        if len(changed):
+            rebuild_route_day_summaries()
+        timings['fare_calendar_s'] = time.perf_counter() - started
+
+        total = sum(timings.values())
+        report['vectorized'] = {
+            'rows': len(inventory),
+            'changed': len(changed),
+            **{name: round(seconds, 3) for name, seconds in timings.items()},
+            'total_s': round(total, 3),
+            'rows_per_sec': round(len(inventory) / total) if total else 0,
+        }
+        loop = report['per_row_loop']
+        if loop['rows_per_sec']:
+            report['per_row_loop']['estimated_total_s'] = round(len(inventory) / loop['rows_per_sec'], 1)
+        return report
+
+    def _per_row_loop(self, now, sample):
+        """
+        Load, price and save one travel option at a time, then roll back.
+        The saves skip the per-row cache invalidation and calendar refresh.
+        """
+        started = time.perf_counter()
+        rows = 0
+        with transaction.atomic(), deferred_refresh(rebuild=False):
+            for option in TravelOption.objects.filter(datetime__gt=now).order_by()[:sample].iterator():
+                price = option_price(option, now)
+                if price != option.price:
+                    option.price = price
+                    option.save(update_fields=['price'])
+                rows += 1
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return {
+            'rows': rows,
+            'total_s': round(elapsed, 3),
+            'rows_per_sec': round(rows / elapsed) if elapsed else 0,
+        }
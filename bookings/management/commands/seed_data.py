@@ -1,12 +1,24 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from datetime import datetime, timedelta
-from bookings.models import TravelOption
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from bookings.models import TravelOption, Booking
+from bookings.cache import invalidate_schedule, invalidate_search_cache
+from bookings.fares import deferred_refresh
+from bookings.seeding import chunk_bounds, generate_shard
+
+SEED_USER_PREFIX = 'seed_user_'
 
 
 class Command(BaseCommand):
-    help = 'Seed the database with sample travel options'
+    help = 'Seed the database with sample travel options, users and bookings'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -15,89 +27,170 @@ class Command(BaseCommand):
             default=50,
             help='Number of travel options to create (default: 50)',
         )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=0,
+            help='Number of sample users to create (default: 0)',
+        )
+        parser.add_argument(
+            '--bookings',
+            type=int,
+            default=0,
+            help='Number of bookings to spread over the travel options (needs --users)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed; the same seed always produces the same data',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk insert (default: 5000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes used to generate rows (default: 1)',
+        )
 
     def handle(self, *args, **options):
         count = options['count']
-        
-        # Sample data
-        cities = [
-            'New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix',
-            'Philadelphia', 'San Antonio', 'San Diego', 'Dallas', 'San Jose',
-            'Austin', 'Jacksonville', 'Fort Worth', 'Columbus', 'Charlotte',
-            'San Francisco', 'Indianapolis', 'Seattle', 'Denver', 'Boston',
-            'Washington DC', 'Nashville', 'Oklahoma City', 'Las Vegas', 'Portland'
-        ]
-        
-        travel_types = ['Flight', 'Train', 'Bus']
-        
-        # Clear existing data
-        TravelOption.objects.all().delete()
-        
-        created_count = 0
-        
-        for i in range(count):
-            # Random source and destination (ensure they're different)
-            source = random.choice(cities)
-            destination = random.choice([city for city in cities if city != source])
-            
-            # Random travel type
-            travel_type = random.choice(travel_types)
-            
-            # Random datetime (between now and 60 days from now)
-            start_date = timezone.now()
-            end_date = start_date + timedelta(days=60)
-            random_date = start_date + timedelta(
-                seconds=random.randint(0, int((end_date - start_date).total_seconds()))
-            )
-            
-            # Price based on travel type and distance simulation
-            base_prices = {
-                'Flight': (150, 800),
-                'Train': (50, 300),
-                'Bus': (25, 150)
-            }
-            
-            min_price, max_price = base_prices[travel_type]
-            price = round(random.uniform(min_price, max_price), 2)
-            
-            # Random available seats
-            seat_ranges = {
-                'Flight': (50, 200),
-                'Train': (100, 400),
-                'Bus': (30, 60)
-            }
-            
-            min_seats, max_seats = seat_ranges[travel_type]
-            available_seats = random.randint(min_seats, max_seats)
-            
-            # Create travel option
-            travel_option = TravelOption.objects.create(
-                type=travel_type,
-                source=source,
-                destination=destination,
-                datetime=random_date,
-                price=price,
-                available_seats=available_seats
+        user_count = options['users']
+        booking_count = options['bookings']
+        batch_size = options['batch_size']
+        seed = options['seed']
+
+        if batch_size < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be at least 1')
+        if booking_count and not user_count:
+            raise CommandError('--bookings needs --users')
+
+        if seed is None:
+            seed = random.SystemRandom().randrange(2 ** 32)
+        self.stdout.write(f'Using seed {seed}')
+
+        started = time.perf_counter()
+
+        with deferred_refresh():
+            # Clear existing data
+            TravelOption.objects.all().delete()
+            User.objects.filter(username__startswith=SEED_USER_PREFIX).delete()
+
+            user_ids = self._create_users(user_count, batch_size)
+
+            # One timestamp for the whole run so every chunk shares it
+            generate = partial(
+                generate_shard,
+                seed=seed,
+                start_time=timezone.now(),
+                count=count,
+                booking_count=booking_count,
+                user_ids=user_ids,
             )
-            
-            created_count += 1
-            
-            if created_count % 10 == 0:
-                self.stdout.write(f'Created {created_count} travel options...')
-        
+            chunks = chunk_bounds(count, batch_size)
+
+            created_options = created_bookings = 0
+            if options['workers'] > 1:
+                with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+                    results = executor.map(generate, chunks)
+                    created_options, created_bookings = self._insert(results, batch_size)
+            else:
+                created_options, created_bookings = self._insert(map(generate, chunks), batch_size)
+
+        invalidate_search_cache()
+        invalidate_schedule()
+        elapsed = time.perf_counter() - started
+
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully created {created_count} travel options!'
+                f'Successfully created {created_options} travel options, '
+                f'{len(user_ids)} users and {created_bookings} bookings!'
             )
         )
-        
+
         # Display some statistics
-        flight_count = TravelOption.objects.filter(type='Flight').count()
-        train_count = TravelOption.objects.filter(type='Train').count()
-        bus_count = TravelOption.objects.filter(type='Bus').count()
-        
+        type_counts = dict(
+            TravelOption.objects.order_by().values_list('type').annotate(total=Count('pk'))
+        )
+        total_rows = created_options + len(user_ids) + created_bookings
+
         self.stdout.write(f'Statistics:')
-        self.stdout.write(f'  Flights: {flight_count}')
-        self.stdout.write(f'  Trains: {train_count}')
-        self.stdout.write(f'  Buses: {bus_count}')
-        self.stdout.write(f'  Total: {created_count}')
+        self.stdout.write(f'  Flights: {type_counts.get("Flight", 0)}')
+        self.stdout.write(f'  Trains: {type_counts.get("Train", 0)}')
+        self.stdout.write(f'  Buses: {type_counts.get("Bus", 0)}')
+        self.stdout.write(f'  Total: {created_options}')
+        self.stdout.write(
+            f'Throughput: {total_rows} rows in {elapsed:.2f}s '
+            f'({total_rows / elapsed if elapsed else 0:.0f} rows/sec)'
+        )
+
+    def _create_users(self, user_count, batch_size):
+        if not user_count:
+            return []
+
+        # Hashing is deliberately slow, so every sample user shares one hash
+        password = make_password('password123')
+        User.objects.bulk_create(
+            [
+                User(username=f'{SEED_USER_PREFIX}{i}', email=f'{SEED_USER_PREFIX}{i}@example.com', password=password)
+                for i in range(user_count)
+            ],
+            batch_size=batch_size,
+        )
+        return list(
+            User.objects.filter(username__startswith=SEED_USER_PREFIX)
+            .order_by('username')
+            .values_list('pk', flat=True)
+        )
+
+    def _insert(self, results, batch_size):
+        created_options = created_bookings = 0
+
+        for travel_options, bookings in results:
+            option_rows = []
+            for (
+                travel_id, travel_type, source, destination, departure, price,
+                seats, seat_capacity, seat_map, arrival,
+            ) in travel_options:
+                option = TravelOption(
+                    travel_id=travel_id,
+                    type=travel_type,
+                    source=source,
+                    destination=destination,
+                    datetime=departure,
+                    arrival=arrival,
+                    price=price,
+                    available_seats=seats,
+                    seat_capacity=seat_capacity,
+                    seat_map=seat_map,
+                )
+                option.set_route_keys()
+                option_rows.append(option)
+
+            booking_rows = [
+                Booking(
+                    booking_id=booking_id,
+                    user_id=user_id,
+                    travel_option_id=travel_id,
+                    number_of_seats=number_of_seats,
+                    total_price=total_price,
+                    seat_numbers=seat_numbers,
+                )
+                for booking_id, user_id, travel_id, number_of_seats, total_price, seat_numbers in bookings
+            ]
+
+            # A chunk's options and bookings land together or not at all
+            with transaction.atomic():
+                TravelOption.objects.bulk_create(option_rows, batch_size=batch_size)
+                Booking.objects.bulk_create(booking_rows, batch_size=batch_size)
+
+            created_options += len(option_rows)
+            created_bookings += len(booking_rows)
+            self.stdout.write(f'Created {created_options} travel options...')
+
+        return created_options, created_bookings
@@ -0,0 +1,238 @@
+"""
+Per-view request metrics in Prometheus text format.
+
+``MetricsMiddleware`` times every request, counts its SQL queries and their
+time through ``connection.execute_wrapper``, and picks up template render
+time from ``InstrumentedDjangoTemplates``. Everything is aggregated per URL
+name in an in-process registry; each worker process serves its own
+numbers, so scrape every worker (or run one) to see the full picture.
+
+Both the middleware and the ``/metrics`` endpoint are only installed when
+``METRICS_ENABLED`` is set.
+"""
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current_request = ContextVar('metrics_request', default=None)
+
+
+class RequestMetrics:
+    """Counters for the request being handled"""
+    __slots__ = ('queries', 'query_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """(le, cumulative count) pairs, ending with +Inf"""
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield ('+Inf' if bound == float('inf') else repr(bound)), cumulative
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}
+            self.query_counts = {}
+            self.query_seconds = {}
+            self.template_seconds = {}
+            self.responses = {}
+
+    def observe(self, view, status_code, seconds, metrics):
+        with self._lock:
+            if view not in self.latency:
+                self.latency[view] = Histogram(LATENCY_BUCKETS)
+                self.query_counts[view] = Histogram(QUERY_COUNT_BUCKETS)
+                self.template_seconds[view] = Histogram(LATENCY_BUCKETS)
+                self.query_seconds[view] = 0.0
+            self.latency[view].observe(seconds)
+            self.query_counts[view].observe(metrics.queries)
+            self.query_seconds[view] += metrics.query_seconds
+            if metrics.template_seconds:
+                self.template_seconds[view].observe(metrics.template_seconds)
+            key = (view, status_code)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self):
+        """The registry in Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            self._histogram(lines, 'travel_booking_request_duration_seconds',
+                            'Request latency by URL name.', self.latency)
+            self._histogram(lines, 'travel_booking_db_queries_per_request',
+                            'SQL queries issued per request by URL name.', self.query_counts)
+            self._histogram(lines, 'travel_booking_template_render_seconds',
+                            'Template render time per request by URL name.', self.template_seconds)
+
+            lines.append('# HELP travel_booking_db_query_seconds_total Time spent in SQL queries by URL name.')
+            lines.append('# TYPE travel_booking_db_query_seconds_total counter')
+            for view, seconds in sorted(self.query_seconds.items()):
+                lines.append(f'travel_booking_db_query_seconds_total{{view="{view}"}} {seconds!r}')
+
+            lines.append('# HELP travel_booking_responses_total Responses by URL name and status code.')
+            lines.append('# TYPE travel_booking_responses_total counter')
+            for (view, status_code), count in sorted(self.responses.items()):
+                lines.append(f'travel_booking_responses_total{{view="{view}",status="{status_code}"}} {count}')
+
+        from .cache import search_cache_stats
+        stats = search_cache_stats()
+        lines.append('# HELP travel_booking_search_cache_lookups_total Search result cache lookups.')
+        lines.append('# TYPE travel_booking_search_cache_lookups_total counter')
+        lines.append(f'travel_booking_search_cache_lookups_total{{result="hit"}} {stats["hits"]}')
+        lines.append(f'travel_booking_search_cache_lookups_total{{result="miss"}} {stats["misses"]}')
+
+        from .snapshots import snapshot_stats
+        stats = snapshot_stats()
+        lines.append('# HELP travel_booking_travel_option_cache_lookups_total '
+                     'Travel option snapshot lookups in this process.')
+        lines.append('# TYPE travel_booking_travel_option_cache_lookups_total counter')
+        for result, name in (('hit', 'hits'), ('miss', 'misses'), ('invalidated', 'invalidated')):
+            lines.append(
+                f'travel_booking_travel_option_cache_lookups_total{{result="{result}"}} {stats[name]}'
+            )
+        lines.append('# HELP travel_booking_travel_option_cache_size Travel options cached in this process.')
+        lines.append('# TYPE travel_booking_travel_option_cache_size gauge')
+        lines.append(f'travel_booking_travel_option_cache_size {stats["size"]}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _histogram(lines, name, help_text, histograms):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for view, histogram in sorted(histograms.items()):
+            for le, count in histogram.samples():
+                lines.append(f'{name}_bucket{{view="{view}",le="{le}"}} {count}')
+            lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum!r}')
+            lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """
+    Record latency, SQL and template metrics for every request.
+
+    Async-capable, so installing it at the top of the chain does not push
+    the async views below it back into threads under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        token = _current_request.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                _wrap_connections(stack, metrics)
+                response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+        _observe(request, response, started, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current_request.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                # Queries run on the connections of the request's sync thread
+                await sync_to_async(_wrap_connections)(stack, metrics)
+                response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+        _observe(request, response, started, metrics)
+        return response
+
+
+def _wrap_connections(stack, metrics):
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(metrics))
+
+
+def _observe(request, response, started, metrics):
+    match = request.resolver_match
+    view = (match.url_name or match.view_name) if match else 'unresolved'
+    registry.observe(view, response.status_code, time.perf_counter() - started, metrics)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current_request.get()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_seconds += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose templates report their render time"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
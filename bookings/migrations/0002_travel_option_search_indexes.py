@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:05
+
+from django.db import migrations, models
+
+
+def populate_route_keys(apps, schema_editor):
+    TravelOption = apps.get_model('bookings', 'TravelOption')
+    batch = []
+    for option in TravelOption.objects.only('source', 'destination').iterator(chunk_size=2000):
+        option.source_key = ' '.join(option.source.split()).casefold()
+        option.destination_key = ' '.join(option.destination.split()).casefold()
+        batch.append(option)
+        if len(batch) >= 2000:
+            TravelOption.objects.bulk_update(batch, ['source_key', 'destination_key'])
+            batch = []
+    if batch:
+        TravelOption.objects.bulk_update(batch, ['source_key', 'destination_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveloption',
+            name='destination_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='source_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(populate_route_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(condition=models.Q(('available_seats__gt', 0)), fields=['datetime'], name='travel_upcoming_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['source_key', 'destination_key', 'datetime'], name='travel_route_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['destination_key', 'datetime'], name='travel_destination_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(condition=models.Q(('available_seats__gt', 0)), fields=['type', 'datetime'], name='travel_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(condition=models.Q(('available_seats__gt', 0)), fields=['price', 'datetime'], name='travel_price_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:22
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_route_day_summaries(apps, schema_editor):
+    TravelOption = apps.get_model('bookings', 'TravelOption')
+    RouteDaySummary = apps.get_model('bookings', 'RouteDaySummary')
+    rows = (
+        TravelOption.objects.filter(available_seats__gt=0)
+        .annotate(date=TruncDate('datetime'))
+        .order_by()
+        .values('source_key', 'destination_key', 'type', 'date')
+        .annotate(min_price=Min('price'), departures=Count('pk'), total_seats=Sum('available_seats'))
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(RouteDaySummary(**row))
+        if len(batch) >= 2000:
+            RouteDaySummary.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        RouteDaySummary.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_booking_user_recent_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteDaySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_key', models.CharField(max_length=100)),
+                ('destination_key', models.CharField(max_length=100)),
+                ('type', models.CharField(choices=[('Flight', 'Flight'), ('Train', 'Train'), ('Bus', 'Bus')], max_length=10)),
+                ('date', models.DateField()),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('departures', models.PositiveIntegerField(default=0)),
+                ('total_seats', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='routedaysummary',
+            constraint=models.UniqueConstraint(fields=('source_key', 'destination_key', 'date', 'type'), name='route_day_unique'),
+        ),
+        migrations.RunPython(populate_route_day_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:27
+
+from django.db import migrations, models
+
+
+def populate_seat_maps(apps, schema_editor):
+    """Number the seats of confirmed bookings from 1 in booking order, and map the rest as free"""
+    TravelOption = apps.get_model('bookings', 'TravelOption')
+    Booking = apps.get_model('bookings', 'Booking')
+
+    taken = {}
+    bookings = []
+    confirmed = Booking.objects.filter(status='Confirmed').order_by(
+        'travel_option_id', 'booking_date', 'booking_id'
+    ).only('travel_option_id', 'number_of_seats')
+    for booking in confirmed.iterator(chunk_size=2000):
+        first = taken.get(booking.travel_option_id, 0)
+        booking.seat_numbers = list(range(first + 1, first + booking.number_of_seats + 1))
+        taken[booking.travel_option_id] = first + booking.number_of_seats
+        bookings.append(booking)
+        if len(bookings) >= 2000:
+            Booking.objects.bulk_update(bookings, ['seat_numbers'])
+            bookings = []
+    if bookings:
+        Booking.objects.bulk_update(bookings, ['seat_numbers'])
+
+    options = []
+    for option in TravelOption.objects.only('available_seats').iterator(chunk_size=2000):
+        booked = taken.get(option.pk, 0)
+        option.seat_capacity = option.available_seats + booked
+        free = ((1 << option.seat_capacity) - 1) & ~((1 << booked) - 1)
+        option.seat_map = free.to_bytes((option.seat_capacity + 7) // 8, 'little')
+        options.append(option)
+        if len(options) >= 2000:
+            TravelOption.objects.bulk_update(options, ['seat_capacity', 'seat_map'])
+            options = []
+    if options:
+        TravelOption.objects.bulk_update(options, ['seat_capacity', 'seat_map'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_route_day_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='seat_numbers',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='seat_capacity',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='seat_map',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(populate_seat_maps, migrations.RunPython.noop),
+    ]
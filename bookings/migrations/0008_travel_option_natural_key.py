@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:41
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count
+
+KEY = ('source_key', 'destination_key', 'datetime', 'type')
+
+
+def separate_duplicate_departures(apps, schema_editor):
+    """
+    Nothing used to stop two travel options sharing a route, type and
+    departure (seed_data could generate them). Move each duplicate after the
+    first one forward by a microsecond, which no page shows, so the
+    constraint can be added.
+    """
+    TravelOption = apps.get_model('bookings', 'TravelOption')
+    duplicates = (
+        TravelOption.objects.order_by().values(*KEY)
+        .annotate(copies=Count('pk')).filter(copies__gt=1)
+    )
+    for key in duplicates.iterator():
+        key.pop('copies')
+        copies = TravelOption.objects.filter(**key).order_by('travel_id')
+        for offset, option in enumerate(copies[1:], start=1):
+            option.datetime += timedelta(microseconds=offset)
+            option.save(update_fields=['datetime'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(separate_duplicate_departures, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='traveloption',
+            constraint=models.UniqueConstraint(fields=('source_key', 'destination_key', 'datetime', 'type'), name='travel_natural_key'),
+        ),
+    ]
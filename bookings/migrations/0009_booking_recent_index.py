@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_travel_option_natural_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['-booking_date', '-booking_id'], name='booking_recent_idx'),
+        ),
+    ]
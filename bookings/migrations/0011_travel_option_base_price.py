@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:13
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveloption',
+            name='base_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
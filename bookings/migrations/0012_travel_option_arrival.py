@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0011_travel_option_base_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveloption',
+            name='arrival',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='traveloption',
+            constraint=models.CheckConstraint(check=models.Q(('arrival__isnull', True), ('arrival__gt', models.F('datetime')), _connector='OR'), name='travel_arrival_after_departure', violation_error_message='Arrival must be after departure.'),
+        ),
+    ]
@@ -1,8 +1,15 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 import uuid
 
+from . import seatmaps
+
+
+def normalize_city(value):
+    """Case-folded, whitespace-collapsed city name used for indexed lookups"""
+    return ' '.join(value.split()).casefold()
+
 
 class TravelOption(models.Model):
     """Model representing a travel option (Flight/Train/Bus)"""
@@ -18,15 +25,99 @@ class TravelOption(models.Model):
     source = models.CharField(max_length=100)
     destination = models.CharField(max_length=100)
     datetime = models.DateTimeField()
+    # Needed to chain the option into connecting itineraries
+    arrival = models.DateTimeField(null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+    # Fare the reprice command scales by demand; blank means ``price`` is the base
+    base_price = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, validators=[MinValueValidator(0)]
+    )
     available_seats = models.PositiveIntegerField()
+    source_key = models.CharField(max_length=100, editable=False, default='')
+    destination_key = models.CharField(max_length=100, editable=False, default='')
+    # One bit per seat, set while the seat is free; see bookings.seatmaps
+    seat_capacity = models.PositiveIntegerField(null=True, editable=False)
+    seat_map = models.BinaryField(null=True, editable=False)
     
     class Meta:
         ordering = ['datetime']
+        indexes = [
+            # Searches only ever look at departures with seats left
+            models.Index(
+                fields=['datetime'],
+                condition=models.Q(available_seats__gt=0),
+                name='travel_upcoming_idx',
+            ),
+            models.Index(
+                fields=['source_key', 'destination_key', 'datetime'],
+                name='travel_route_idx',
+            ),
+            models.Index(
+                fields=['destination_key', 'datetime'],
+                name='travel_destination_idx',
+            ),
+            models.Index(
+                fields=['type', 'datetime'],
+                condition=models.Q(available_seats__gt=0),
+                name='travel_type_idx',
+            ),
+            models.Index(
+                fields=['price', 'datetime'],
+                condition=models.Q(available_seats__gt=0),
+                name='travel_price_idx',
+            ),
+        ]
+        constraints = [
+            # Natural key schedule imports upsert on
+            models.UniqueConstraint(
+                fields=['source_key', 'destination_key', 'datetime', 'type'],
+                name='travel_natural_key',
+            ),
+            models.CheckConstraint(
+                check=models.Q(arrival__isnull=True) | models.Q(arrival__gt=models.F('datetime')),
+                name='travel_arrival_after_departure',
+                violation_error_message='Arrival must be after departure.',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.type} from {self.source} to {self.destination} on {self.datetime.strftime('%Y-%m-%d %H:%M')}"
     
+    def set_route_keys(self):
+        """Fill the lookup keys from the display names (bulk_create skips save)"""
+        self.source_key = normalize_city(self.source)
+        self.destination_key = normalize_city(self.destination)
+    
+    def set_seat_map(self):
+        """
+        Give a new travel option a map of free seats, and make an existing
+        map agree with an edited ``available_seats``.
+        """
+        if self.seat_map is None:
+            if self._state.adding:
+                self.seat_capacity = self.available_seats
+                self.seat_map = seatmaps.all_free(self.available_seats)
+        elif seatmaps.free_count(self.seat_map) != self.available_seats:
+            self.seat_map, self.seat_capacity = seatmaps.resize(
+                self.seat_map, self.seat_capacity, self.available_seats
+            )
+    
+    def save(self, *args, **kwargs):
+        # Keep the lookup keys in step with the display names
+        self.set_route_keys()
+        self.set_seat_map()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'source' in update_fields:
+                update_fields.add('source_key')
+            if 'destination' in update_fields:
+                update_fields.add('destination_key')
+            if 'available_seats' in update_fields:
+                update_fields.update(['seat_map', 'seat_capacity'])
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+    
     @property
     def has_available_seats(self):
         return self.available_seats > 0
@@ -47,9 +138,21 @@ class Booking(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     booking_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Confirmed')
+    seat_numbers = models.JSONField(default=list, blank=True, editable=False)
     
     class Meta:
         ordering = ['-booking_date']
+        indexes = [
+            models.Index(
+                fields=['user', '-booking_date', '-booking_id'],
+                name='booking_user_recent_idx',
+            ),
+            # The admin changelist and the CSV export walk all bookings by date
+            models.Index(
+                fields=['-booking_date', '-booking_id'],
+                name='booking_recent_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Booking {str(self.booking_id)[:8]} - {self.user.username} - {self.travel_option.type}"
@@ -62,10 +165,163 @@ class Booking(models.Model):
     
     def cancel(self):
         """Cancel the booking and return seats to travel option"""
-        if self.status == 'Confirmed':
-            self.status = 'Cancelled'
+        from .inventory import release_seats
+
+        if self.status != 'Confirmed':
+            return False
+
+        with transaction.atomic():
+            # Only one caller can flip the status, so seats are returned once
+            updated = Booking.objects.filter(
+                pk=self.pk, status='Confirmed'
+            ).update(status='Cancelled')
+            if not updated:
+                return False
+            release_seats(self.travel_option_id, self.number_of_seats, self.seat_numbers)
+
+        self.status = 'Cancelled'
+        if Booking.travel_option.is_cached(self):
             self.travel_option.available_seats += self.number_of_seats
-            self.travel_option.save()
-            self.save()
-            return True
-        return False
+        return True
+
+
+
+class Waitlist(models.Model):
+    """A user's place in the queue for seats on a sold-out travel option"""
+    
+    STATUS_CHOICES = [
+        ('Waiting', 'Waiting'),
+        ('Promoted', 'Promoted'),
+        ('Cancelled', 'Cancelled'),
+    ]
+    
+    waitlist_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries')
+    travel_option = models.ForeignKey(TravelOption, on_delete=models.CASCADE, related_name='waitlist_entries')
+    number_of_seats = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    joined_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Waiting')
+    # The booking made when the entry was promoted
+    booking = models.OneToOneField(
+        Booking, null=True, blank=True, on_delete=models.SET_NULL, related_name='waitlist_entry'
+    )
+    
+    class Meta:
+        ordering = ['joined_at']
+        indexes = [
+            # Promotion reads each travel option's queue in joining order
+            models.Index(
+                fields=['travel_option', 'joined_at'],
+                condition=models.Q(status='Waiting'),
+                name='waitlist_queue_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'travel_option'],
+                condition=models.Q(status='Waiting'),
+                name='waitlist_one_entry_per_user',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Waitlist {str(self.waitlist_id)[:8]} - {self.user.username} - {self.travel_option}"
+
+class RouteDaySummary(models.Model):
+    """
+    Cheapest bookable fare, departures with seats left and total seats left
+    for one route, travel type and day. Kept in step with TravelOption by
+    ``bookings.fares`` so the fare calendar never scans travel options.
+    """
+    
+    source_key = models.CharField(max_length=100)
+    destination_key = models.CharField(max_length=100)
+    type = models.CharField(max_length=10, choices=TravelOption.TRAVEL_TYPES)
+    date = models.DateField()
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    departures = models.PositiveIntegerField(default=0)
+    total_seats = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            # Also the index the fare calendar reads a route's date range from
+            models.UniqueConstraint(
+                fields=['source_key', 'destination_key', 'date', 'type'],
+                name='route_day_unique',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.source_key} → {self.destination_key} ({self.type}) {self.date}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A booking submission already handled, so a retried submission with the
+    same key gets the original booking back instead of a second one.
+    """
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.UUIDField()
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='+')
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        constraints = [
+            # Also the index retries are looked up by
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_key_expiry_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.key} → {self.booking_id}"
+
+
+class ArchivedTravelOption(models.Model):
+    """A departed travel option moved out of TravelOption by archive_past_travel"""
+    
+    travel_id = models.UUIDField(primary_key=True, editable=False)
+    type = models.CharField(max_length=10, choices=TravelOption.TRAVEL_TYPES)
+    source = models.CharField(max_length=100)
+    destination = models.CharField(max_length=100)
+    datetime = models.DateTimeField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    available_seats = models.PositiveIntegerField()
+    seat_capacity = models.PositiveIntegerField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['datetime']
+    
+    def __str__(self):
+        return f"{self.type} from {self.source} to {self.destination} on {self.datetime.strftime('%Y-%m-%d %H:%M')}"
+
+
+class ArchivedBooking(models.Model):
+    """A booking on an archived travel option; reads like a Booking in templates"""
+    
+    archived = True
+    
+    booking_id = models.UUIDField(primary_key=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bookings')
+    travel_option = models.ForeignKey(ArchivedTravelOption, on_delete=models.CASCADE, related_name='bookings')
+    number_of_seats = models.PositiveIntegerField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    booking_date = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=Booking.STATUS_CHOICES)
+    seat_numbers = models.JSONField(default=list, blank=True)
+    
+    class Meta:
+        ordering = ['-booking_date']
+        indexes = [
+            # my_bookings pages through a user's past trips like their bookings
+            models.Index(
+                fields=['user', '-booking_date', '-booking_id'],
+                name='archived_booking_user_idx',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Archived booking {str(self.booking_id)[:8]}"
@@ -0,0 +1,194 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page starts right after the last row of the
+previous one, so fetching page N costs the same as fetching page 1 as long
+as an index covers the ordering.
+
+``MergedKeysetPaginator`` pages through a table and its archive as one.
+``EstimatedCountPaginator`` is for the admin changelists, which keep
+numbered pages but should not count a large table on every load.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Below this many rows an exact COUNT(*) is cheap enough
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+class KeysetPage:
+    """One page of results plus the cursor for the page after it"""
+
+    def __init__(self, object_list, next_cursor, cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.cursor is not None
+
+    def next_querystring(self, params):
+        """``params`` (e.g. request.GET) with the cursor set to the next page"""
+        params = params.copy()
+        params['cursor'] = self.next_cursor
+        return params.urlencode()
+
+    def first_querystring(self, params):
+        """``params`` with the cursor removed, i.e. the first page"""
+        params = params.copy()
+        params.pop('cursor', None)
+        return params.urlencode()
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` on ``ordering``, a sequence of field names whose
+    last entry must be unique (normally the primary key). Prefix a name
+    with '-' for descending order; all fields must share one direction.
+    """
+
+    def __init__(self, queryset, ordering, per_page=20):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+        self.descending = self.ordering[0].startswith('-')
+        self.field_names = [name.lstrip('-') for name in self.ordering]
+        self.fields = [queryset.model._meta.get_field(name) for name in self.field_names]
+
+        if any(name.startswith('-') != self.descending for name in self.ordering):
+            raise ValueError('Keyset ordering fields must all sort in the same direction')
+
+    def encode_cursor(self, obj):
+        """Cursor pointing just past ``obj``, a model instance or a .values() dict"""
+        values = []
+        for field in self.fields:
+            if isinstance(obj, dict):
+                value = obj[field.attname]
+            else:
+                value = field.value_from_object(obj)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Field values stored in ``cursor``, or None if it is not valid"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                return None
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return None
+
+    def _after(self, values):
+        """Rows that sort strictly after ``values``"""
+        op = 'lt' if self.descending else 'gt'
+        inclusive = 'lte' if self.descending else 'gte'
+
+        # (a > x) OR (a = x AND ((b > y) OR (b = y AND ...)))
+        after = None
+        for name, value in reversed(list(zip(self.field_names, values))):
+            strictly = Q(**{f'{name}__{op}': value})
+            after = strictly if after is None else strictly | (Q(**{name: value}) & after)
+        # Leading bound on the first column so the database can seek the index
+        return Q(**{f'{self.field_names[0]}__{inclusive}': values[0]}) & after
+
+    def _page_queryset(self, cursor):
+        values = self.decode_cursor(cursor) if cursor else None
+        queryset = self.queryset.order_by(*self.ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(values))
+        # One extra row tells us whether there is a next page
+        return queryset[:self.per_page + 1], (cursor if values is not None else None)
+
+    def _build_page(self, rows, cursor):
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.encode_cursor(rows[-1])
+        return KeysetPage(rows, next_cursor, cursor)
+
+    def page(self, cursor=None):
+        queryset, cursor = self._page_queryset(cursor)
+        return self._build_page(list(queryset), cursor)
+
+    async def apage(self, cursor=None):
+        """``page()`` for async views"""
+        queryset, cursor = self._page_queryset(cursor)
+        return self._build_page([row async for row in queryset], cursor)
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """
+    Keyset pagination over several querysets that share the ordering
+    fields, such as a table and its archive, as if they were one. Each page
+    reads one page from every queryset and keeps the first rows overall.
+    """
+
+    def __init__(self, querysets, ordering, per_page=20):
+        super().__init__(querysets[0], ordering, per_page)
+        self.paginators = [KeysetPaginator(queryset, ordering, per_page) for queryset in querysets]
+
+    def _sort_key(self, row):
+        return tuple(getattr(row, field.attname) for field in self.fields)
+
+    def page(self, cursor=None):
+        rows = []
+        for paginator in self.paginators:
+            queryset, page_cursor = paginator._page_queryset(cursor)
+            rows.extend(queryset)
+        rows.sort(key=self._sort_key, reverse=self.descending)
+        return self._build_page(rows, page_cursor)
+
+
+def estimated_count(queryset):
+    """
+    The planner's row estimate for an unfiltered queryset on PostgreSQL,
+    None when there is none to use.
+    """
+    if queryset.query.where or queryset.query.distinct:
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # reltuples is -1 until the table is first analyzed
+    return int(row[0]) if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A Paginator that takes the total of an unfiltered queryset from the
+    planner's statistics when the table is large, instead of COUNT(*) over
+    every row. Filtered querysets and small tables are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super().count
@@ -0,0 +1,191 @@
+"""
+Dynamic pricing.
+
+``reprice()`` sets the price of every upcoming travel option to its base
+fare times two multipliers read off piecewise-linear curves: one by days
+left until departure (PRICING_DAYS_CURVE) and one by the share of seats
+sold (PRICING_LOAD_CURVE). Options without a base fare get their current
+price as one on the first run. The inventory is loaded into NumPy arrays, all
+prices are computed in one vectorized pass, and only the prices that
+changed are written back, REPRICE_BATCH_SIZE rows per transaction.
+Travel options without a seat map have no known capacity, so only the
+days curve applies to them.
+
+The booking page signs the price it shows into a quote. A booking made
+with a quote is charged the quoted price for PRICE_QUOTE_TTL seconds, so a
+reprice that lands while the user fills in the form does not change what
+they pay.
+"""
+from bisect import bisect_right
+from dataclasses import dataclass
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core import signing
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .cache import invalidate_schedule, invalidate_search_cache
+from .fares import rebuild_route_day_summaries
+from .models import TravelOption
+
+REPRICE_BATCH_SIZE = 1000
+LOAD_BATCH_SIZE = 20000
+SECONDS_PER_DAY = 24 * 60 * 60
+QUOTE_SALT = 'bookings.pricing.quote'
+
+
+@dataclass
+class Inventory:
+    """Upcoming travel options, one array element per option"""
+    pks: list
+    base_cents: np.ndarray
+    price_cents: np.ndarray
+    available_seats: np.ndarray
+    capacity: np.ndarray  # 0 for options without a seat map
+    departure: np.ndarray  # POSIX timestamps
+
+    def __len__(self):
+        return len(self.pks)
+
+
+def fill_base_prices(now=None):
+    """
+    Give upcoming travel options without a base fare their current price
+    as one, so repricing never compounds. Returns how many were filled.
+    """
+    return TravelOption.objects.filter(
+        datetime__gt=now or timezone.now(), base_price__isnull=True
+    ).update(base_price=F('price'))
+
+
+def load_inventory(now=None):
+    """Every travel option departing after ``now`` as an Inventory; see fill_base_prices()"""
+    now = now or timezone.now()
+    rows = (
+        TravelOption.objects.filter(datetime__gt=now)
+        .order_by()
+        .values_list(
+            'pk',
+            Cast(F('base_price'), FloatField()),
+            Cast(F('price'), FloatField()),
+            'available_seats',
+            Coalesce('seat_capacity', 0),
+            'datetime',
+        )
+        .iterator(chunk_size=LOAD_BATCH_SIZE)
+    )
+    pks, base, price, available, capacity, departure = list(zip(*rows)) or [()] * 6
+    return Inventory(
+        pks=list(pks),
+        base_cents=np.rint(np.array(base, dtype=np.float64) * 100).astype(np.int64),
+        price_cents=np.rint(np.array(price, dtype=np.float64) * 100).astype(np.int64),
+        available_seats=np.array(available, dtype=np.int64),
+        capacity=np.array(capacity, dtype=np.int64),
+        departure=np.array([when.timestamp() for when in departure], dtype=np.float64),
+    )
+
+
+def _curve(curve):
+    points = sorted(curve)
+    return [x for x, _ in points], [y for _, y in points]
+
+
+def price_cents(inventory, now, days_curve=None, load_curve=None):
+    """New prices in cents for every option in ``inventory``, in one pass"""
+    days = (inventory.departure - now.timestamp()) / SECONDS_PER_DAY
+    multiplier = np.interp(days, *_curve(days_curve or settings.PRICING_DAYS_CURVE))
+
+    mapped = inventory.capacity > 0
+    sold = 1 - inventory.available_seats[mapped] / inventory.capacity[mapped]
+    multiplier[mapped] *= np.interp(sold, *_curve(load_curve or settings.PRICING_LOAD_CURVE))
+
+    return np.rint(inventory.base_cents * multiplier).astype(np.int64)
+
+
+def _interpolate(xs, ys, x):
+    """``np.interp`` for one value"""
+    if x <= xs[0]:
+        return ys[0]
+    if x >= xs[-1]:
+        return ys[-1]
+    i = bisect_right(xs, x)
+    return ys[i - 1] + (ys[i] - ys[i - 1]) * (x - xs[i - 1]) / (xs[i] - xs[i - 1])
+
+
+def option_price(travel_option, now, days_curve=None, load_curve=None):
+    """The new price of one travel option, without NumPy"""
+    days = (travel_option.datetime - now).total_seconds() / SECONDS_PER_DAY
+    multiplier = _interpolate(*_curve(days_curve or settings.PRICING_DAYS_CURVE), days)
+    if travel_option.seat_capacity:
+        sold = 1 - travel_option.available_seats / travel_option.seat_capacity
+        multiplier *= _interpolate(*_curve(load_curve or settings.PRICING_LOAD_CURVE), sold)
+
+    base = travel_option.base_price if travel_option.base_price is not None else travel_option.price
+    return Decimal(round(int(base * 100) * multiplier)) / 100
+
+
+def write_prices(pks, cents, batch_size=REPRICE_BATCH_SIZE):
+    """Set the price of each travel option in ``pks``, one transaction per batch"""
+    for start in range(0, len(pks), batch_size):
+        TravelOption.objects.bulk_update(
+            [
+                TravelOption(pk=pk, price=Decimal(int(price)) / 100)
+                for pk, price in zip(pks[start:start + batch_size], cents[start:start + batch_size])
+            ],
+            ['price'],
+        )
+
+
+def reprice(now=None, batch_size=REPRICE_BATCH_SIZE, days_curve=None, load_curve=None):
+    """
+    Reprice every upcoming travel option. Returns ``(options priced,
+    prices changed)``.
+    """
+    now = now or timezone.now()
+    fill_base_prices(now)
+    inventory = load_inventory(now)
+    if not len(inventory):
+        return 0, 0
+
+    cents = price_cents(inventory, now, days_curve, load_curve)
+    changed = np.flatnonzero(cents != inventory.price_cents)
+    write_prices([inventory.pks[i] for i in changed], cents[changed], batch_size)
+
+    if len(changed):
+        # bulk_update skips the signals that keep the calendar current
+        rebuild_route_day_summaries()
+        invalidate_search_cache()
+        invalidate_schedule()
+    return len(inventory), len(changed)
+
+
+def sign_quote(travel_option):
+    """A tamper-proof record of the price the user is shown"""
+    return signing.dumps([str(travel_option.pk), str(travel_option.price)], salt=QUOTE_SALT)
+
+
+def quoted_price(travel_option, quote):
+    """
+    The price per seat to charge for a booking made with ``quote``: the
+    quoted price while the quote is fresh, or after that as long as the
+    price has not gone up, and never more than the price is now. None if
+    the quote is invalid or the user has to see the new price first.
+    """
+    try:
+        travel_id, price = signing.loads(quote, salt=QUOTE_SALT, max_age=settings.PRICE_QUOTE_TTL)
+        fresh = True
+    except signing.SignatureExpired:
+        travel_id, price = signing.loads(quote, salt=QUOTE_SALT)
+        fresh = False
+    except signing.BadSignature:
+        return None
+
+    if travel_id != str(travel_option.pk):
+        return None
+    price = Decimal(price)
+    if not fresh and travel_option.price > price:
+        return None
+    return min(price, travel_option.price)
@@ -0,0 +1,85 @@
+"""
+Read-replica routing.
+
+Views wrapped in ``replica_reads`` read travel data from one of the
+DATABASE_REPLICAS aliases; everything else, including every write, uses
+``default``. A user who has just booked or cancelled gets a short-lived
+cookie that pins their reads to the primary, so they see their own
+change even if the replicas lag behind.
+"""
+from contextvars import ContextVar
+from functools import wraps
+import random
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+PRIMARY = 'default'
+PIN_COOKIE = 'db_pin_primary'
+
+# 'replica' inside a replica_reads view, 'primary' when the user is pinned
+_read_mode = ContextVar('read_mode', default=None)
+
+
+def pinned_to_primary():
+    """Whether this request reads from the primary to see the user's own writes"""
+    return _read_mode.get() == 'primary'
+
+
+def pin_to_primary(response):
+    """Send the user's reads to the primary for DATABASE_REPLICA_PIN_SECONDS"""
+    if settings.DATABASE_REPLICAS:
+        response.set_cookie(
+            PIN_COOKIE, '1',
+            max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+            httponly=True,
+            samesite='Lax',
+        )
+    return response
+
+
+def _mode_for(request):
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return 'primary' if request.COOKIES.get(PIN_COOKIE) else 'replica'
+
+
+def replica_reads(view):
+    """Let a read-only view (sync or async) read travel data from a replica"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            token = _read_mode.set(_mode_for(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_mode.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = _read_mode.set(_mode_for(request))
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _read_mode.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Send reads of bookings models to a random replica inside replica_reads
+    views. Auth and session reads stay on the primary, so a user who has
+    just logged in is never logged out by replication lag.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_mode.get() == 'replica' and model._meta.app_label == 'bookings':
+            return random.choice(settings.DATABASE_REPLICAS)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary's data
+        return True
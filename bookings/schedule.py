@@ -0,0 +1,246 @@
+"""
+Schedule imports.
+
+Carriers send departures as CSV or JSONL with the columns ``type``,
+``source``, ``destination``, ``datetime``, ``price``, ``seats`` (the
+departure's seat capacity) and optionally ``arrival``. Files are read a
+chunk at a time, so memory stays flat however long they are. Each chunk
+is validated, then upserted with one ``INSERT ... ON CONFLICT`` on the
+travel option natural key (route, departure and type). Departures that already exist keep the seats
+booked on them: only the unbooked seats follow the new capacity.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+import csv
+import json
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import seatmaps
+from .cache import invalidate_schedule, invalidate_search_cache
+from .fares import refresh_travel_options
+from .inventory import lock_travel_options
+from .models import Booking, TravelOption
+
+IMPORT_CHUNK_SIZE = 1000
+FORMATS = ('csv', 'jsonl')
+TRAVEL_TYPES = {travel_type.casefold(): travel_type for travel_type, _ in TravelOption.TRAVEL_TYPES}
+UPDATE_FIELDS = [
+    'source', 'destination', 'arrival', 'price', 'base_price', 'available_seats', 'seat_capacity',
+    'seat_map',
+]
+MAX_PRICE = Decimal('99999999.99')
+
+
+class RowError(ValueError):
+    """A record that cannot be imported; the message says why"""
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)  # (line number, message)
+
+    def add(self, other):
+        self.rows += other.rows
+        self.created += other.created
+        self.updated += other.updated
+        self.errors.extend(other.errors)
+
+
+def read_rows(stream, file_format):
+    """``(line number, row dict)`` for every record in an open text stream"""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = e
+        yield line_number, row
+
+
+def _required(row, column):
+    value = row.get(column)
+    if value is None or not str(value).strip():
+        raise RowError(f'{column} is required')
+    return str(value).strip()
+
+
+def parse_row(row):
+    """A travel option built from one record. Raises RowError if it is invalid."""
+    if isinstance(row, Exception):
+        raise RowError(f'invalid JSON: {row}')
+    if not isinstance(row, dict):
+        raise RowError('expected an object')
+
+    travel_type = TRAVEL_TYPES.get(_required(row, 'type').casefold())
+    if travel_type is None:
+        raise RowError(f"type must be one of {', '.join(TRAVEL_TYPES.values())}")
+
+    departure = parse_datetime(_required(row, 'datetime'))
+    if departure is None:
+        raise RowError('datetime must be ISO 8601, e.g. 2025-06-01T08:30')
+    if timezone.is_naive(departure):
+        departure = timezone.make_aware(departure)
+
+    arrival = None
+    if str(row.get('arrival') or '').strip():
+        arrival = parse_datetime(str(row['arrival']).strip())
+        if arrival is None:
+            raise RowError('arrival must be ISO 8601, e.g. 2025-06-01T11:45')
+        if timezone.is_naive(arrival):
+            arrival = timezone.make_aware(arrival)
+        if arrival <= departure:
+            raise RowError('arrival must be after datetime')
+
+    try:
+        price = Decimal(_required(row, 'price'))
+    except InvalidOperation:
+        raise RowError('price must be a number')
+    if not 0 <= price <= MAX_PRICE or price != price.quantize(Decimal('0.01')):
+        raise RowError('price must be between 0 and 99999999.99 with at most two decimals')
+
+    try:
+        seats = int(_required(row, 'seats'))
+    except ValueError:
+        raise RowError('seats must be a whole number')
+    if seats < 0:
+        raise RowError('seats must not be negative')
+
+    option = TravelOption(
+        type=travel_type,
+        source=' '.join(_required(row, 'source').split()),
+        destination=' '.join(_required(row, 'destination').split()),
+        datetime=departure,
+        arrival=arrival,
+        price=price,
+        base_price=price,
+        available_seats=seats,
+        seat_capacity=seats,
+    )
+    if max(len(option.source), len(option.destination)) > 100:
+        raise RowError('city names must be at most 100 characters')
+    option.set_route_keys()
+    if option.source_key == option.destination_key:
+        raise RowError('source and destination must differ')
+    return option
+
+
+def _natural_key(option):
+    return (option.source_key, option.destination_key, option.datetime, option.type)
+
+
+def _keep_booked_seats(option, existing, booked):
+    """
+    Carry the seats booked on ``existing`` over to the imported ``option``.
+    ``booked`` counts them for travel options without a seat map.
+    """
+    if existing.seat_map is None:
+        if booked > option.seat_capacity:
+            raise RowError(f'{booked} seats are already booked')
+        option.available_seats = option.seat_capacity - booked
+        option.seat_capacity = None
+        option.seat_map = None
+        return
+
+    seat_map = seatmaps.set_capacity(existing.seat_map, existing.seat_capacity, option.seat_capacity)
+    if seat_map is None:
+        raise RowError(f'seats above {option.seat_capacity} are already booked')
+    option.seat_map = seat_map
+    option.available_seats = seatmaps.free_count(seat_map)
+
+
+def import_chunk(records):
+    """Validate and upsert one chunk of ``(line number, row)`` records"""
+    result = ImportResult(rows=len(records))
+    options = {}
+    for line_number, row in records:
+        try:
+            option = parse_row(row)
+        except RowError as e:
+            result.errors.append((line_number, str(e)))
+            continue
+        # A departure listed twice in a chunk: the later line wins
+        options[_natural_key(option)] = (line_number, option)
+
+    if not options:
+        return result
+
+    with transaction.atomic():
+        keys = options.keys()
+        existing = {
+            _natural_key(option): option
+            for option in lock_travel_options(
+                TravelOption.objects.filter(
+                    source_key__in={key[0] for key in keys},
+                    destination_key__in={key[1] for key in keys},
+                    datetime__in={key[2] for key in keys},
+                ).only('source_key', 'destination_key', 'datetime', 'type',
+                       'available_seats', 'seat_capacity', 'seat_map')
+            )
+        }
+        unmapped = [option.pk for option in existing.values() if option.seat_map is None]
+        booked = dict(
+            Booking.objects.filter(travel_option__in=unmapped, status='Confirmed')
+            .order_by().values_list('travel_option').annotate(Sum('number_of_seats'))
+        ) if unmapped else {}
+
+        rows = []
+        for key, (line_number, option) in options.items():
+            if key in existing:
+                try:
+                    _keep_booked_seats(option, existing[key], booked.get(existing[key].pk, 0))
+                except RowError as e:
+                    result.errors.append((line_number, str(e)))
+                    continue
+                result.updated += 1
+            else:
+                option.seat_map = seatmaps.all_free(option.seat_capacity)
+                result.created += 1
+            rows.append(option)
+
+        TravelOption.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['source_key', 'destination_key', 'datetime', 'type'],
+            update_fields=UPDATE_FIELDS,
+        )
+        refresh_travel_options(rows)
+
+    return result
+
+
+def import_schedule(stream, file_format, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Upsert every departure in ``stream``, one transaction per chunk of
+    ``chunk_size`` records. ``progress`` is called with the running
+    ImportResult after each chunk. Returns the ImportResult.
+    """
+    result = ImportResult()
+    records = read_rows(stream, file_format)
+    try:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            result.add(import_chunk(chunk))
+            if progress:
+                progress(result)
+    finally:
+        if result.created or result.updated:
+            invalidate_search_cache()
+            invalidate_schedule()
+    return result
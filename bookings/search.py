@@ -0,0 +1,74 @@
+"""
+Travel option search.
+
+Turns the cleaned data of ``TravelOptionFilterForm`` into a queryset whose
+filters line up with the indexes declared on ``TravelOption.Meta``.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import TravelOption, normalize_city
+
+# Sorts after any character a city name can contain
+_PREFIX_UPPER_BOUND = '\U0010ffff'
+
+
+def upcoming_travel_options():
+    """Future departures that still have seats"""
+    return TravelOption.objects.filter(
+        datetime__gte=timezone.now(),
+        available_seats__gt=0
+    )
+
+
+def prefix_filter(field, value):
+    """
+    Match rows whose normalized ``field`` starts with ``value``.
+
+    The range gives the database an indexable bound; the ``startswith``
+    keeps the match exact under collations that do not sort by code point.
+    """
+    key = normalize_city(value)
+    return Q(**{
+        f'{field}__gte': key,
+        f'{field}__lt': key + _PREFIX_UPPER_BOUND,
+        f'{field}__startswith': key,
+    })
+
+
+def start_of_day(date):
+    """First instant of ``date`` in the current time zone"""
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+def search_travel_options(filters):
+    """Apply the cleaned data of a TravelOptionFilterForm"""
+    travel_options = upcoming_travel_options()
+
+    if filters.get('source'):
+        travel_options = travel_options.filter(prefix_filter('source_key', filters['source']))
+
+    if filters.get('destination'):
+        travel_options = travel_options.filter(prefix_filter('destination_key', filters['destination']))
+
+    if filters.get('travel_type'):
+        travel_options = travel_options.filter(type=filters['travel_type'])
+
+    # Compare the column directly instead of wrapping it in a date cast
+    if filters.get('date_from'):
+        travel_options = travel_options.filter(datetime__gte=start_of_day(filters['date_from']))
+
+    if filters.get('date_to'):
+        travel_options = travel_options.filter(
+            datetime__lt=start_of_day(filters['date_to'] + timedelta(days=1))
+        )
+
+    if filters.get('min_price'):
+        travel_options = travel_options.filter(price__gte=filters['min_price'])
+
+    if filters.get('max_price'):
+        travel_options = travel_options.filter(price__lte=filters['max_price'])
+
+    return travel_options
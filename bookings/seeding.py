@@ -0,0 +1,159 @@
+"""
+Deterministic sample data generation.
+
+Nothing here touches the database or Django models, so chunks can be
+generated in worker processes and handed back as plain tuples. Each chunk
+draws from its own RNG seeded with (seed, chunk index), so the output for
+a given seed does not depend on how many workers produced it.
+"""
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from . import seatmaps
+
+CITIES = [
+    'New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix',
+    'Philadelphia', 'San Antonio', 'San Diego', 'Dallas', 'San Jose',
+    'Austin', 'Jacksonville', 'Fort Worth', 'Columbus', 'Charlotte',
+    'San Francisco', 'Indianapolis', 'Seattle', 'Denver', 'Boston',
+    'Washington DC', 'Nashville', 'Oklahoma City', 'Las Vegas', 'Portland'
+]
+
+# Every other city, worked out once instead of on every row
+DESTINATIONS = {city: [other for other in CITIES if other != city] for city in CITIES}
+
+TRAVEL_TYPES = ['Flight', 'Train', 'Bus']
+
+# Price range per seat, in whole currency units
+BASE_PRICES = {
+    'Flight': (150, 800),
+    'Train': (50, 300),
+    'Bus': (25, 150)
+}
+
+SEAT_RANGES = {
+    'Flight': (50, 200),
+    'Train': (100, 400),
+    'Bus': (30, 60)
+}
+
+# Journey time range, in minutes
+DURATIONS = {
+    'Flight': (60, 360),
+    'Train': (90, 600),
+    'Bus': (120, 720)
+}
+
+# Departures are spread over this many days from the start time
+DEPARTURE_WINDOW = timedelta(days=60)
+
+MAX_SEATS_PER_BOOKING = 4
+
+
+def _rng(seed, chunk_index):
+    return random.Random(seed * 1_000_003 + chunk_index)
+
+
+def _uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _seat_map(capacity, available):
+    """A seat map with the first ``capacity - available`` seats taken"""
+    taken = range(1, capacity - available + 1)
+    return seatmaps.claim(seatmaps.all_free(capacity), capacity, taken)
+
+
+def chunk_bounds(total, chunk_size):
+    """(chunk_index, start, stop) for each chunk of ``total`` rows"""
+    return [
+        (index, start, min(start + chunk_size, total))
+        for index, start in enumerate(range(0, total, chunk_size))
+    ]
+
+
+def share(total, start, stop, count):
+    """How many of ``total`` items fall to rows [start, stop) of ``count``"""
+    if not count:
+        return 0
+    return total * stop // count - total * start // count
+
+
+def generate_chunk(seed, chunk_index, size, start_time, booking_count, user_ids, first_row=0):
+    """
+    Generate ``size`` travel options and up to ``booking_count`` bookings
+    on them (a booking is skipped if it lands on a sold-out option).
+    ``first_row`` is the chunk's offset in the whole run; it keeps
+    departures from colliding on the travel option natural key.
+
+    Returns ``(travel_options, bookings)``. Travel options are
+    ``(travel_id, type, source, destination, datetime, price, available_seats,
+    seat_capacity, seat_map, arrival)`` with ``available_seats`` already reduced by
+    the seats of their bookings; bookings are ``(booking_id, user_id,
+    travel_id, number_of_seats, total_price, seat_numbers)`` and take seats
+    in order from seat 1.
+    """
+    rng = _rng(seed, chunk_index)
+    window_seconds = int(DEPARTURE_WINDOW.total_seconds())
+
+    travel_options = []
+    for row in range(first_row, first_row + size):
+        travel_type = rng.choice(TRAVEL_TYPES)
+        source = rng.choice(CITIES)
+        min_price, max_price = BASE_PRICES[travel_type]
+        min_seats, max_seats = SEAT_RANGES[travel_type]
+        option = [
+            _uuid(rng),
+            travel_type,
+            source,
+            rng.choice(DESTINATIONS[source]),
+            # Row number as microseconds: rows of a run can only share a departure
+            # if they are a multiple of a million rows apart
+            start_time + timedelta(seconds=rng.randint(0, window_seconds), microseconds=row % 1_000_000),
+            Decimal(rng.randint(min_price * 100, max_price * 100)) / 100,
+            rng.randint(min_seats, max_seats),
+        ]
+        option.append(option[6])  # seat capacity
+        option.append(option[4] + timedelta(minutes=rng.randint(*DURATIONS[travel_type])))
+        travel_options.append(option)
+
+    bookings = []
+    if travel_options and user_ids:
+        for _ in range(booking_count):
+            option = rng.choice(travel_options)
+            if option[6] == 0:
+                continue
+            number_of_seats = rng.randint(1, min(MAX_SEATS_PER_BOOKING, option[6]))
+            first_seat = option[7] - option[6] + 1
+            option[6] -= number_of_seats
+            bookings.append((
+                _uuid(rng),
+                rng.choice(user_ids),
+                option[0],
+                number_of_seats,
+                number_of_seats * option[5],
+                list(range(first_seat, first_seat + number_of_seats)),
+            ))
+
+    return [
+        (*option[:8], _seat_map(option[7], option[6]), option[8]) for option in travel_options
+    ], bookings
+
+
+def generate_shard(bounds, seed, start_time, count, booking_count, user_ids):
+    """
+    ``generate_chunk`` for one ``(chunk_index, start, stop)`` from
+    ``chunk_bounds``, with the chunk's fair share of ``booking_count``.
+    """
+    chunk_index, start, stop = bounds
+    return generate_chunk(
+        seed,
+        chunk_index,
+        stop - start,
+        start_time,
+        share(booking_count, start, stop, count),
+        user_ids,
+        first_row=start,
+    )
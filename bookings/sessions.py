@@ -0,0 +1,36 @@
+"""
+Session housekeeping.
+
+Django's ``clearsessions`` removes expired sessions with one DELETE, which
+on a large session table scans and locks every expired row in a single
+statement. ``purge_expired_sessions()`` deletes them a batch at a time
+instead. Sessions kept in signed cookies or only in the cache expire on
+their own; with ``cached_db`` the cache entries expire with the session.
+"""
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSessionStore
+from django.utils import timezone
+
+PURGE_BATCH_SIZE = 5000
+
+
+def purge_expired_sessions(batch_size=PURGE_BATCH_SIZE):
+    """
+    Delete expired sessions of the configured SESSION_ENGINE in batches of
+    ``batch_size``. Returns the number deleted.
+    """
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    if not issubclass(store, DatabaseSessionStore):
+        store.clear_expired()
+        return 0
+
+    sessions = store.get_model_class().objects
+    deleted = 0
+    now = timezone.now()
+    while True:
+        keys = list(sessions.filter(expire_date__lt=now).values_list('pk', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += sessions.filter(pk__in=keys).delete()[0]
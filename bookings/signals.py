@@ -0,0 +1,41 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import TravelOption
+from .cache import invalidate_search_cache, invalidate_travel_options
+from .connections import schedule_changed
+from .fares import refresh_deferred, refresh_route_days, route_day, route_days
+
+
+@receiver(post_save, sender=TravelOption)
+@receiver(post_delete, sender=TravelOption)
+def travel_option_changed(sender, instance, **kwargs):
+    """Saves and deletes can change what a search returns"""
+    # Bulk paths invalidate once when they finish
+    if not refresh_deferred():
+        invalidate_search_cache()
+        invalidate_travel_options([instance.pk])
+
+
+@receiver(pre_save, sender=TravelOption)
+def remember_route_day(sender, instance, **kwargs):
+    """An edit can move a travel option off its old fare calendar day"""
+    if not instance._state.adding and not refresh_deferred():
+        instance._previous_route_days = route_days([instance.pk])
+
+
+@receiver(post_save, sender=TravelOption)
+@receiver(post_delete, sender=TravelOption)
+def refresh_fare_calendar(sender, instance, **kwargs):
+    if refresh_deferred():
+        return
+    keys = getattr(instance, '_previous_route_days', set()) | {route_day(instance)}
+    refresh_route_days(keys)
+
+
+@receiver(post_save, sender=TravelOption)
+@receiver(post_delete, sender=TravelOption)
+def patch_connection_index(sender, instance, **kwargs):
+    # Bulk paths call invalidate_schedule() instead
+    if not refresh_deferred():
+        schedule_changed(instance)
@@ -0,0 +1,96 @@
+"""
+Per-process cache of travel options.
+
+The detail and booking pages read one travel option per hit, and a few
+departures get most of the hits. Each process keeps the last
+TRAVEL_OPTION_CACHE_SIZE travel options it read, for at most
+TRAVEL_OPTION_CACHE_TIMEOUT seconds. Before a snapshot is served, its
+version is read from the shared cache in one round trip: the generation
+of that travel option, bumped whenever its seats, price or schedule
+change, and the generation of all travel options, bumped by bulk changes
+(see ``bookings.cache.invalidate_travel_options()``). A snapshot whose
+version moved is read again, so no worker serves a travel option another
+worker has changed, as long as the cache backend is shared by the workers.
+
+Snapshots are for display. Bookings lock the row and check its seats
+inside their transaction, and charge the price read from the row.
+"""
+from collections import OrderedDict
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from .cache import TRAVEL_OPTION_GENERATION_KEY, get_generation, travel_option_generation_key
+from .models import TravelOption
+from .routers import pinned_to_primary
+
+_snapshots = OrderedDict()  # pk -> (version, expires at, travel option), least recently used first
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'invalidated': 0}
+
+
+def _version(pk):
+    keys = [TRAVEL_OPTION_GENERATION_KEY, travel_option_generation_key(pk)]
+    generations = cache.get_many(keys)
+    # A missing generation was evicted or never set: seeding it gives a
+    # version no snapshot was stored under, so the lookup is a miss
+    return tuple(generations[key] if key in generations else get_generation(key) for key in keys)
+
+
+def get_travel_option(pk):
+    """
+    The travel option with primary key ``pk``, from this process's
+    snapshots if they are current. Raises TravelOption.DoesNotExist.
+    Users pinned to the primary skip the snapshots, which may have been
+    read from a lagging replica.
+    """
+    timeout = settings.TRAVEL_OPTION_CACHE_TIMEOUT
+    if timeout <= 0 or pinned_to_primary():
+        return TravelOption.objects.get(pk=pk)
+
+    version = _version(pk)
+    now = time.monotonic()
+    with _lock:
+        entry = _snapshots.get(pk)
+        if entry and entry[0] == version and entry[1] > now:
+            _snapshots.move_to_end(pk)
+            _stats['hits'] += 1
+            # A copy, so a view cannot change what the next request sees
+            return copy.copy(entry[2])
+        _stats['invalidated' if entry else 'misses'] += 1
+
+    travel_option = TravelOption.objects.get(pk=pk)
+    with _lock:
+        _snapshots[pk] = (version, now + timeout, travel_option)
+        _snapshots.move_to_end(pk)
+        while len(_snapshots) > settings.TRAVEL_OPTION_CACHE_SIZE:
+            _snapshots.popitem(last=False)
+    return copy.copy(travel_option)
+
+
+def get_travel_option_or_404(pk):
+    try:
+        return get_travel_option(pk)
+    except TravelOption.DoesNotExist:
+        raise Http404('No TravelOption matches the given query.')
+
+
+def snapshot_stats():
+    """Hit, miss and invalidation counters of this process's snapshots"""
+    with _lock:
+        stats = dict(_stats, size=len(_snapshots))
+    lookups = stats['hits'] + stats['misses'] + stats['invalidated']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def clear():
+    """Drop every snapshot and reset the counters"""
+    with _lock:
+        _snapshots.clear()
+        for name in _stats:
+            _stats[name] = 0
@@ -1,9 +1,54 @@
-from django.test import TestCase, Client
-from django.contrib.auth.models import User
-from django.urls import reverse
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, Client, AsyncRequestFactory, override_settings
+from django.contrib.auth.models import User, AnonymousUser
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, router, transaction, IntegrityError, OperationalError
+from django.db.models import Sum
+from django.http import Http404
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 from django.utils import timezone
 from datetime import timedelta
-from .models import TravelOption, Booking
+from unittest import mock, skipUnless
+from io import StringIO
+import csv
+import json
+import os
+import tempfile
+import logging
+import threading
+import time
+import uuid
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from .models import (
+    TravelOption, Booking, RouteDaySummary, Waitlist, IdempotencyKey, ArchivedTravelOption, ArchivedBooking,
+)
+from .search import search_travel_options, start_of_day
+from .fares import fare_calendar
+from .pagination import KeysetPaginator
+from .cache import search_cache_stats
+from .metrics import MetricsMiddleware, registry as metrics_registry
+from .seeding import SEAT_RANGES
+from .inventory import reserve_seats, release_seats, claim_seats, cancel_all_bookings
+from .waitlist import join_waitlist, promote_waitlist
+from .schedule import import_schedule
+from .exports import csv_lines
+from .archive import archive_past_travel
+from .pricing import option_price, reprice
+from .cache import (
+    SEARCH_GENERATION_KEY, TRAVEL_OPTION_GENERATION_KEY, bump_generation, get_generation,
+    invalidate_schedule, invalidate_travel_options, travel_option_generation_key,
+)
+from . import connections
+from . import snapshots
+from .sessions import purge_expired_sessions
+from . import seatmaps
+from .routers import replica_reads, PIN_COOKIE
+from . import async_views
+
+logger = logging.getLogger(__name__)
 
 
 class TravelOptionModelTest(TestCase):
@@ -129,3 +174,1852 @@ class ViewsTest(TestCase):
         })
         self.assertEqual(response.status_code, 302)  # Redirect after successful registration
         self.assertTrue(User.objects.filter(username='newuser').exists())
+
+
+class SeatInventoryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            type='Flight',
+            source='Chicago',
+            destination='Denver',
+            datetime=timezone.now() + timedelta(days=2),
+            price=120,
+            available_seats=5
+        )
+
+    def test_reserve_and_release(self):
+        self.assertTrue(reserve_seats(self.travel_option, 3))
+        self.assertFalse(reserve_seats(self.travel_option, 3))
+        self.assertTrue(release_seats(self.travel_option, 1))
+
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 3)
+
+    def test_cancel_returns_seats_once(self):
+        reserve_seats(self.travel_option, 2)
+        booking = Booking.objects.create(
+            user=self.user,
+            travel_option=self.travel_option,
+            number_of_seats=2
+        )
+        stale_copy = Booking.objects.get(pk=booking.pk)
+
+        self.assertTrue(booking.cancel())
+        self.assertFalse(stale_copy.cancel())
+
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 5)
+
+    def test_book_travel_takes_seats(self):
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('book_travel', kwargs={'travel_id': self.travel_option.travel_id})
+
+        response = self.client.post(url, {'number_of_seats': 4})
+        self.assertRedirects(response, reverse('my_bookings'), fetch_redirect_response=False)
+
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 1)
+        self.assertEqual(Booking.objects.get().total_price, 480)
+
+
+class SeatInventoryConcurrencyTest(TransactionTestCase):
+    """Hammer one hot travel option from many threads"""
+    threads = 8
+    attempts_per_thread = 25
+    capacity = 60
+
+    def setUp(self):
+        self.travel_option = TravelOption.objects.create(
+            type='Train',
+            source='Boston',
+            destination='New York',
+            datetime=timezone.now() + timedelta(days=1),
+            price=50,
+            available_seats=self.capacity
+        )
+
+    def _reserve_with_retry(self):
+        # SQLite reports lock contention as an error instead of waiting
+        while True:
+            try:
+                with transaction.atomic():
+                    return reserve_seats(self.travel_option.pk, 1)
+            except OperationalError:
+                time.sleep(0.001)
+
+    def _worker(self, results):
+        try:
+            for _ in range(self.attempts_per_thread):
+                results.append(self._reserve_with_retry())
+        finally:
+            connection.close()
+
+    def test_no_oversell_under_contention(self):
+        results = []
+        workers = [
+            threading.Thread(target=self._worker, args=(results,))
+            for _ in range(self.threads)
+        ]
+
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        reserved = results.count(True)
+        logger.info('%d bookings in %.3fs (%.0f bookings/sec)', reserved, elapsed, reserved / elapsed)
+
+        self.travel_option.refresh_from_db()
+        self.assertEqual(len(results), self.threads * self.attempts_per_thread)
+        self.assertEqual(reserved, self.capacity)
+        self.assertEqual(self.travel_option.available_seats, 0)
+
+
+class BulkCancellationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.pulled = TravelOption.objects.create(
+            type='Flight',
+            source='Dallas',
+            destination='Austin',
+            datetime=timezone.now() + timedelta(days=4),
+            price=99,
+            available_seats=100
+        )
+        self.other = TravelOption.objects.create(
+            type='Bus',
+            source='Dallas',
+            destination='Houston',
+            datetime=timezone.now() + timedelta(days=4),
+            price=30,
+            available_seats=10
+        )
+
+    def _book(self, travel_option, number_of_seats, count):
+        Booking.objects.bulk_create([
+            Booking(
+                user=self.user,
+                travel_option=travel_option,
+                number_of_seats=number_of_seats,
+                total_price=number_of_seats * travel_option.price,
+                seat_numbers=claim_seats(travel_option, number_of_seats)
+            )
+            for _ in range(count)
+        ])
+
+    def test_cancels_with_constant_statements(self):
+        self._book(self.pulled, 2, 40)
+        self._book(self.other, 1, 3)
+        Booking.objects.filter(travel_option=self.pulled)[:1].get().cancel()
+
+        # savepoint, lock (SQLite: a no-op update, then the read), read
+        # booked seats, seats update, status update, waitlist update, then
+        # the fare calendar refresh (insert missing day, lock it, aggregate,
+        # update), release
+        lock_queries = 1 if connection.features.has_select_for_update else 2
+        with self.assertNumQueries(10 + lock_queries):
+            cancelled = cancel_all_bookings([self.pulled])
+
+        self.assertEqual(cancelled, 39)
+        self.pulled.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.pulled.available_seats, 100)
+        self.assertEqual(seatmaps.free_seats(self.pulled.seat_map), list(range(1, 101)))
+        self.assertEqual(self.other.available_seats, 10 - 3)
+        self.assertEqual(Booking.objects.filter(travel_option=self.other, status='Confirmed').count(), 3)
+
+    def test_management_command(self):
+        self._book(self.pulled, 1, 2)
+        self._book(self.other, 1, 2)
+
+        out = StringIO()
+        call_command('cancel_travel_options', str(self.pulled.pk), str(self.other.pk), stdout=out)
+
+        self.assertIn('Cancelled 4 bookings', out.getvalue())
+
+        self.assertFalse(Booking.objects.filter(status='Confirmed').exists())
+
+
+class IdempotentBookingTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            type='Flight',
+            source='Denver',
+            destination='Phoenix',
+            datetime=timezone.now() + timedelta(days=6),
+            price=120,
+            available_seats=10
+        )
+        self.url = reverse('book_travel', kwargs={'travel_id': self.travel_option.travel_id})
+
+    def test_form_carries_a_key(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'name="idempotency_key"')
+
+    def test_retried_form_returns_original_booking(self):
+        data = {'number_of_seats': 2, 'seats': '', 'idempotency_key': str(uuid.uuid4())}
+        self.client.post(self.url, data)
+
+        # Key lookup only: the travel option is neither read nor written
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data)
+        self.assertFalse(any('bookings_traveloption' in query['sql'] for query in queries))
+
+        booking = Booking.objects.get()
+        self.assertRedirects(response, reverse('my_bookings'), fetch_redirect_response=False)
+        self.assertContains(self.client.get(response.url), str(booking.booking_id)[:8])
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 8)
+
+    def test_header_key(self):
+        headers = {'HTTP_IDEMPOTENCY_KEY': str(uuid.uuid4())}
+        for _ in range(3):
+            self.client.post(self.url, {'number_of_seats': 1, 'seats': ''}, **headers)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_without_key_each_submission_books(self):
+        for _ in range(2):
+            self.client.post(self.url, {'number_of_seats': 1, 'seats': ''})
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_conflicting_key_without_stored_booking(self):
+        # The concurrent retry's key is gone by the time this attempt looks it up
+        data = {'number_of_seats': 1, 'seats': '', 'idempotency_key': str(uuid.uuid4())}
+        with mock.patch('bookings.idempotency.remember', side_effect=IntegrityError):
+            response = self.client.post(self.url, data)
+
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertContains(self.client.get(self.url), 'We could not confirm this booking')
+        self.assertFalse(Booking.objects.exists())
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 10)
+
+    def test_expired_key_is_purged_and_reusable(self):
+        data = {'number_of_seats': 1, 'seats': '', 'idempotency_key': str(uuid.uuid4())}
+        self.client.post(self.url, data)
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1 expired', out.getvalue())
+
+        self.client.post(self.url, data)
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+
+class WaitlistTest(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'waiter{i}', password='testpass123') for i in range(4)
+        ]
+        self.travel_option = TravelOption.objects.create(
+            type='Train',
+            source='Boston',
+            destination='New York',
+            datetime=timezone.now() + timedelta(days=3),
+            price=40,
+            available_seats=4
+        )
+        self.held = Booking.objects.create(
+            user=self.users[0],
+            travel_option=self.travel_option,
+            number_of_seats=4,
+            seat_numbers=claim_seats(self.travel_option, 4)
+        )
+        self.travel_option.refresh_from_db()
+
+    def test_full_travel_option_redirects_to_waitlist(self):
+        client = Client()
+        client.login(username='waiter1', password='testpass123')
+        url = reverse('book_travel', args=[self.travel_option.travel_id])
+        self.assertRedirects(
+            client.get(url), reverse('join_waitlist', args=[self.travel_option.travel_id])
+        )
+
+        response = client.post(
+            reverse('join_waitlist', args=[self.travel_option.travel_id]), {'number_of_seats': 2}
+        )
+        self.assertRedirects(response, reverse('my_bookings'))
+        client.post(reverse('join_waitlist', args=[self.travel_option.travel_id]), {'number_of_seats': 2})
+        self.assertEqual(Waitlist.objects.filter(user=self.users[1], status='Waiting').count(), 1)
+
+        response = client.get(reverse('my_bookings'))
+        self.assertContains(response, 'Waitlist')
+
+    def test_promotes_in_joining_order(self):
+        first, _ = join_waitlist(self.users[1], self.travel_option, 3)
+        blocked, _ = join_waitlist(self.users[2], self.travel_option, 2)
+        last, _ = join_waitlist(self.users[3], self.travel_option, 1)
+
+        self.held.cancel()
+        self.assertEqual(promote_waitlist(), 1)
+
+        first.refresh_from_db()
+        blocked.refresh_from_db()
+        last.refresh_from_db()
+        self.travel_option.refresh_from_db()
+        self.assertEqual(first.status, 'Promoted')
+        self.assertEqual(first.booking.user, self.users[1])
+        self.assertEqual(first.booking.seat_numbers, [1, 2, 3])
+        self.assertEqual(first.booking.total_price, 120)
+        # The pair does not fit in the last seat, and the single seat that
+        # would is not handed out over its head
+        self.assertEqual(blocked.status, 'Waiting')
+        self.assertEqual(last.status, 'Waiting')
+        self.assertEqual(self.travel_option.available_seats, 1)
+        self.assertEqual(seatmaps.free_seats(self.travel_option.seat_map), [4])
+
+    def test_promotion_statements_do_not_grow_with_entries(self):
+        options = [
+            TravelOption.objects.create(
+                type='Bus',
+                source='Boston',
+                destination='Albany',
+                datetime=timezone.now() + timedelta(days=3),
+                price=15,
+                available_seats=10
+            )
+            for _ in range(3)
+        ]
+        for option in options:
+            for user in self.users:
+                join_waitlist(user, option, 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(promote_waitlist(), 12)
+        # Scan for options, lock, read entries, insert bookings, update
+        # entries and options, refresh the fare calendar, and the final scan
+        self.assertLess(len(queries), 20)
+        for option in options:
+            option.refresh_from_db()
+            self.assertEqual(option.available_seats, 2)
+
+    def test_leave_waitlist(self):
+        entry, _ = join_waitlist(self.users[1], self.travel_option, 1)
+        client = Client()
+        client.login(username='waiter1', password='testpass123')
+
+        client.post(reverse('leave_waitlist', args=[entry.waitlist_id]))
+        self.held.cancel()
+
+        self.assertEqual(promote_waitlist(), 0)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'Cancelled')
+
+    def test_pulled_travel_option_cancels_waitlist(self):
+        entry, _ = join_waitlist(self.users[1], self.travel_option, 1)
+        cancel_all_bookings([self.travel_option])
+
+        self.assertEqual(promote_waitlist(), 0)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'Cancelled')
+
+    def test_management_command(self):
+        join_waitlist(self.users[1], self.travel_option, 1)
+        self.held.cancel()
+
+        out = StringIO()
+        call_command('promote_waitlist', stdout=out)
+        self.assertIn('Promoted 1 waitlist entries', out.getvalue())
+
+
+class TravelOptionSearchTest(TestCase):
+    def setUp(self):
+        self.option = TravelOption.objects.create(
+            type='Train',
+            source='  San   Francisco ',
+            destination='Los Angeles',
+            datetime=timezone.now() + timedelta(days=3),
+            price=75,
+            available_seats=20
+        )
+
+    def test_route_keys_are_normalized(self):
+        self.assertEqual(self.option.source_key, 'san francisco')
+        self.assertEqual(self.option.destination_key, 'los angeles')
+
+    def test_city_filters_match_prefix_case_insensitively(self):
+        self.assertIn(self.option, search_travel_options({'source': 'SAN fran'}))
+        self.assertIn(self.option, search_travel_options({'destination': 'los angeles'}))
+        self.assertNotIn(self.option, search_travel_options({'source': 'francisco'}))
+
+    def test_date_to_includes_whole_day(self):
+        departure_date = timezone.localtime(self.option.datetime).date()
+        self.assertIn(self.option, search_travel_options({'date_to': departure_date}))
+        self.assertNotIn(
+            self.option,
+            search_travel_options({'date_to': departure_date - timedelta(days=1)})
+        )
+
+
+class TravelOptionSearchPlanTest(TestCase):
+    """The planner should answer each search shape from its matching index"""
+
+    cases = [
+        ({}, 'travel_upcoming_idx'),
+        ({'source': 'city 1'}, 'travel_route_idx'),
+        ({'destination': 'town 3'}, 'travel_destination_idx'),
+        ({'travel_type': 'Bus'}, 'travel_type_idx'),
+        ({'min_price': 10, 'max_price': 20}, 'travel_price_idx'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        TravelOption.objects.bulk_create([
+            TravelOption(
+                type=('Flight', 'Train', 'Bus')[i % 3],
+                source=f'City {i % 50}',
+                destination=f'Town {i % 40}',
+                source_key=f'city {i % 50}',
+                destination_key=f'town {i % 40}',
+                datetime=now + timedelta(hours=i),
+                price=i % 300,
+                available_seats=i % 5
+            )
+            for i in range(3000)
+        ])
+
+    def assertUsesIndex(self, filters, index_name):
+        plan = search_travel_options(filters).explain()
+        self.assertIn(index_name, plan, f'{filters} was planned as: {plan}')
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+    def test_sqlite_plans(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        for filters, index_name in self.cases:
+            with self.subTest(filters=filters):
+                self.assertUsesIndex(filters, index_name)
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL query plans')
+    def test_postgresql_plans(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE bookings_traveloption')
+            # A few thousand rows fit in a handful of pages; make the
+            # planner show which index it would use on a large table
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for filters, index_name in self.cases:
+            with self.subTest(filters=filters):
+                self.assertUsesIndex(filters, index_name)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        departure = timezone.now() + timedelta(days=1)
+        # Identical departure times force the travel_id tie-breaker
+        destinations = ['Tucson', 'Mesa', 'Yuma']
+        TravelOption.objects.bulk_create([
+            TravelOption(
+                type='Bus' if i % 2 else 'Train',
+                source='Phoenix',
+                destination=destinations[i % 3],
+                source_key='phoenix',
+                destination_key=destinations[i % 3].casefold(),
+                datetime=departure + timedelta(hours=i // 3),
+                price=20,
+                available_seats=10
+            )
+            for i in range(25)
+        ])
+
+    def _walk(self, paginator):
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen.extend(page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_row_once_in_order(self):
+        queryset = TravelOption.objects.all()
+        seen = self._walk(KeysetPaginator(queryset, ('datetime', 'travel_id'), per_page=4))
+        self.assertEqual(seen, list(queryset.order_by('datetime', 'travel_id')))
+
+    def test_descending_order(self):
+        option = TravelOption.objects.first()
+        Booking.objects.bulk_create([
+            Booking(user=self.user, travel_option=option, number_of_seats=1, total_price=20)
+            for _ in range(9)
+        ])
+        queryset = self.user.bookings.all()
+        seen = self._walk(KeysetPaginator(queryset, ('-booking_date', '-booking_id'), per_page=2))
+        self.assertEqual(seen, list(queryset.order_by('-booking_date', '-booking_id')))
+
+    def test_invalid_cursor_returns_first_page(self):
+        paginator = KeysetPaginator(TravelOption.objects.all(), ('datetime', 'travel_id'), per_page=5)
+        self.assertEqual(list(paginator.page('not-a-cursor')), list(paginator.page()))
+
+    def test_list_view_pages_keep_filters(self):
+        url = reverse('travel_options_list')
+        response = self.client.get(url, {'travel_type': 'Bus'})
+        first_page = response.context['travel_options']
+
+        # 12 of the 25 options are buses
+        self.assertEqual(len(first_page), 12)
+        self.assertFalse(response.context['page'].has_next)
+
+        with CaptureQueriesContext(connection) as first_queries:
+            response = self.client.get(url)
+        self.assertTrue(response.context['page'].has_next)
+        self.assertIn('cursor=', response.context['next_querystring'])
+
+        with CaptureQueriesContext(connection) as next_queries:
+            response = self.client.get(f"{url}?{response.context['next_querystring']}")
+        self.assertEqual(len(response.context['travel_options']), 5)
+        self.assertEqual(len(first_queries), len(next_queries))
+
+
+class MyBookingsQueryCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.options = TravelOption.objects.bulk_create([
+            TravelOption(
+                type='Flight',
+                source=f'City {i}',
+                destination='Denver',
+                source_key=f'city {i}',
+                destination_key='denver',
+                datetime=timezone.now() + timedelta(days=i + 1),
+                price=100,
+                available_seats=500
+            )
+            for i in range(20)
+        ])
+
+    def _book(self, count):
+        Booking.objects.bulk_create([
+            Booking(
+                user=self.user,
+                travel_option=self.options[i % len(self.options)],
+                number_of_seats=1,
+                total_price=100,
+                status='Cancelled' if i % 4 == 0 else 'Confirmed'
+            )
+            for i in range(count)
+        ])
+
+    def test_query_count_is_flat(self):
+        self._book(10)
+        with CaptureQueriesContext(connection) as baseline:
+            response = self.client.get(reverse('my_bookings'))
+        self.assertEqual(response.context['booking_stats']['total'], 10)
+
+        self._book(9990)
+        with self.assertNumQueries(len(baseline)):
+            response = self.client.get(reverse('my_bookings'))
+
+        stats = response.context['booking_stats']
+        self.assertEqual(stats['total'], 10000)
+        self.assertEqual(stats['cancelled'], 2501)
+        self.assertEqual(stats['confirmed'], 7499)
+        self.assertEqual(stats['total_spent'], 749900)
+
+
+class SearchCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            type='Flight',
+            source='Nashville',
+            destination='Atlanta',
+            datetime=timezone.now() + timedelta(days=6),
+            price=150,
+            available_seats=3
+        )
+        self.url = reverse('travel_options_list')
+
+    def test_repeated_search_is_served_from_cache(self):
+        self.client.get(self.url, {'source': 'nashville'})
+        with CaptureQueriesContext(connection) as queries:
+            # Same search once normalized
+            self.client.get(self.url, {'source': '  NASHVILLE '})
+
+        self.assertEqual(len(queries), 0)
+        stats = search_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_booking_invalidates_cached_results(self):
+        self.client.get(self.url)
+        reserve_seats(self.travel_option, 3)
+
+        response = self.client.get(self.url)
+        self.assertNotIn(self.travel_option, response.context['travel_options'])
+        self.assertEqual(search_cache_stats()['misses'], 2)
+
+    def test_price_change_invalidates_cached_results(self):
+        self.client.get(self.url)
+        self.travel_option.price = 99
+        self.travel_option.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['travel_options'][0].price, 99)
+
+    @override_settings(SEARCH_CACHE_TIMEOUT=0)
+    def test_timeout_zero_disables_cache(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(search_cache_stats()['hits'], 0)
+
+
+class TravelOptionApiTest(TestCase):
+    def setUp(self):
+        departure = timezone.now() + timedelta(days=2)
+        self.options = [
+            TravelOption.objects.create(
+                type='Train' if i % 2 else 'Bus',
+                source='Portland',
+                destination='Seattle',
+                datetime=departure + timedelta(hours=i),
+                price=40 + i,
+                available_seats=30
+            )
+            for i in range(5)
+        ]
+
+    def test_search_pages_with_cursor(self):
+        url = reverse('api_travel_options')
+        data = self.client.get(url, {'source': 'port', 'limit': 3}).json()
+
+        self.assertEqual(len(data['results']), 3)
+        self.assertEqual(data['results'][0]['travel_id'], str(self.options[0].travel_id))
+        self.assertEqual(data['results'][0]['price'], '40.00')
+
+        data = self.client.get(url, {'source': 'port', 'limit': 3, 'cursor': data['next_cursor']}).json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get(reverse('api_travel_options'), {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('min_price', response.json()['errors'])
+
+    def test_ndjson_export_streams_every_match(self):
+        response = self.client.get(reverse('api_travel_options'), {'travel_type': 'Train', 'format': 'ndjson'})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['type'] for row in rows], ['Train', 'Train'])
+
+    def test_detail(self):
+        option = self.options[0]
+        response = self.client.get(reverse('api_travel_option_detail', kwargs={'travel_id': option.travel_id}))
+        self.assertEqual(response.json()['destination'], 'Seattle')
+
+        TravelOption.objects.filter(pk=option.pk).delete()
+        response = self.client.get(reverse('api_travel_option_detail', kwargs={'travel_id': option.travel_id}))
+        self.assertEqual(response.status_code, 404)
+
+
+class SeedDataCommandTest(TestCase):
+    def _seed(self, **options):
+        call_command('seed_data', count=120, users=5, bookings=300, seed=42, batch_size=50, stdout=StringIO(), **options)
+        return list(
+            TravelOption.objects.order_by('travel_id')
+            .values_list('travel_id', 'source_key', 'price', 'available_seats')
+        )
+
+    def test_same_seed_gives_same_data(self):
+        first = self._seed()
+        self.assertEqual(len(first), 120)
+        self.assertEqual(self._seed(), first)
+
+    def test_booked_seats_are_taken_from_available_seats(self):
+        self._seed()
+
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Booking.objects.count(), 300)
+        for option in TravelOption.objects.annotate(booked=Sum('bookings__number_of_seats')):
+            capacity = option.available_seats + (option.booked or 0)
+            self.assertLessEqual(capacity, SEAT_RANGES[option.type][1])
+            self.assertGreaterEqual(capacity, SEAT_RANGES[option.type][0])
+
+
+class BenchBookingCommandTest(TransactionTestCase):
+    def test_reports_json_and_cleans_up(self):
+        out = StringIO()
+        # Concurrent workers on one hot option; SQLite lock errors on the
+        # in-memory test database surface as 5xx responses, never as
+        # oversells. Their "Internal Server Error" logs are expected noise.
+        logger = logging.getLogger('django.request')
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.CRITICAL)
+        call_command('bench_booking', concurrency=4, requests=5, travel_options=1, seats=4, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['requests'], 20)
+        self.assertEqual(report['config']['concurrency'], 4)
+        self.assertEqual(report['oversell_violations'], [])
+        self.assertEqual(set(report['operations']), {'book', 'cancel', 'search'})
+        self.assertFalse(TravelOption.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+
+@override_settings(
+    MIDDLEWARE=['bookings.metrics.MetricsMiddleware'] + settings.MIDDLEWARE,
+    TEMPLATES=[dict(settings.TEMPLATES[0], BACKEND='bookings.metrics.InstrumentedDjangoTemplates')],
+)
+class MetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics_registry.reset()
+        TravelOption.objects.create(
+            type='Bus',
+            source='Austin',
+            destination='Dallas',
+            datetime=timezone.now() + timedelta(days=1),
+            price=25,
+            available_seats=40
+        )
+
+    def test_records_latency_queries_and_template_time(self):
+        self.client.get(reverse('travel_options_list'))
+        self.client.get(reverse('travel_options_list'))
+
+        self.assertEqual(metrics_registry.latency['travel_options_list'].count, 2)
+        # The second request is answered from the search cache
+        self.assertEqual(metrics_registry.query_counts['travel_options_list'].sum, 1)
+        self.assertEqual(metrics_registry.template_seconds['travel_options_list'].count, 2)
+        self.assertEqual(metrics_registry.responses[('travel_options_list', 200)], 2)
+
+    def test_prometheus_text_format(self):
+        self.client.get(reverse('home'))
+        text = metrics_registry.render()
+
+        self.assertIn('# TYPE travel_booking_request_duration_seconds histogram', text)
+        self.assertIn('travel_booking_request_duration_seconds_bucket{view="home",le="+Inf"} 1', text)
+        self.assertIn('travel_booking_request_duration_seconds_count{view="home"} 1', text)
+        self.assertIn('travel_booking_responses_total{view="home",status="200"} 1', text)
+
+    async def test_async_chain_stays_async(self):
+        middleware = MetricsMiddleware(async_views.travel_options_list)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        request = AsyncRequestFactory().get(reverse('travel_options_list'))
+        request.user = AnonymousUser()
+        request.resolver_match = resolve(request.path)
+        response = await middleware(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics_registry.query_counts['travel_options_list'].sum, 1)
+        self.assertEqual(metrics_registry.template_seconds['travel_options_list'].count, 1)
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.travel_option = TravelOption.objects.create(
+            type='Bus',
+            source='Austin',
+            destination='Dallas',
+            datetime=timezone.now() + timedelta(days=1),
+            price=25,
+            available_seats=40
+        )
+
+    def get(self, path, data=None):
+        request = self.factory.get(path, data)
+        request.user = AnonymousUser()
+        return request
+
+    async def test_home(self):
+        response = await async_views.home(self.get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Austin')
+
+    async def test_travel_options_list_uses_search_cache(self):
+        request = self.get('/travel-options/', {'source': 'austin'})
+        first = await async_views.travel_options_list(request)
+        second = await async_views.travel_options_list(request)
+
+        self.assertContains(first, 'Dallas')
+        self.assertEqual(first.content, second.content)
+        stats = await sync_to_async(search_cache_stats)()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    async def test_travel_option_detail(self):
+        path = f'/travel-options/{self.travel_option.travel_id}/'
+        response = await async_views.travel_option_detail(self.get(path), self.travel_option.travel_id)
+        self.assertContains(response, 'Dallas')
+
+        with self.assertRaises(Http404):
+            await async_views.travel_option_detail(self.get(path), uuid.uuid4())
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            type='Bus',
+            source='Austin',
+            destination='Dallas',
+            datetime=timezone.now() + timedelta(days=1),
+            price=25,
+            available_seats=40
+        )
+        self.factory = AsyncRequestFactory()
+
+    def read_databases(self, request):
+        @replica_reads
+        def view(request):
+            return router.db_for_read(TravelOption), router.db_for_read(User), router.db_for_write(TravelOption)
+        return view(request)
+
+    def test_read_views_use_replica_for_travel_data_only(self):
+        request = self.factory.get('/')
+        self.assertEqual(self.read_databases(request), ('replica_0', 'default', 'default'))
+        self.assertEqual(router.db_for_read(TravelOption), 'default')
+
+    def test_pinned_user_reads_from_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.read_databases(request), ('default', 'default', 'default'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(self.read_databases(self.factory.get('/')), ('default', 'default', 'default'))
+
+    async def test_async_view(self):
+        @replica_reads
+        async def view(request):
+            return await sync_to_async(router.db_for_read)(TravelOption)
+
+        self.assertEqual(await view(self.factory.get('/')), 'replica_0')
+
+    def test_booking_pins_user_to_primary(self):
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.post(
+            reverse('book_travel', args=[self.travel_option.travel_id]),
+            {'number_of_seats': 1}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+class FareCalendarTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.day = timezone.localdate() + timedelta(days=3)
+        departure = start_of_day(self.day) + timedelta(hours=9)
+        self.cheap = TravelOption.objects.create(
+            type='Bus', source='Austin', destination='Dallas',
+            datetime=departure, price=20, available_seats=2
+        )
+        self.dear = TravelOption.objects.create(
+            type='Train', source='Austin', destination='Dallas',
+            datetime=departure + timedelta(hours=3), price=45, available_seats=30
+        )
+        self.next_day = TravelOption.objects.create(
+            type='Bus', source='Austin', destination='Dallas',
+            datetime=departure + timedelta(days=1), price=25, available_seats=40
+        )
+
+    def calendar(self, **kwargs):
+        return {
+            row['date']: (row['min_price'], row['departures'], row['total_seats'])
+            for row in fare_calendar('austin ', 'DALLAS', **kwargs)
+        }
+
+    def test_calendar_in_one_query(self):
+        with self.assertNumQueries(1):
+            days = self.calendar()
+        self.assertEqual(days, {
+            self.day: (20, 2, 32),
+            self.day + timedelta(days=1): (25, 1, 40),
+        })
+        self.assertEqual(self.calendar(travel_type='Train'), {self.day: (45, 1, 30)})
+        self.assertEqual(self.calendar(start=self.day + timedelta(days=1)), {
+            self.day + timedelta(days=1): (25, 1, 40),
+        })
+
+    def test_seat_changes_update_calendar(self):
+        self.client.login(username='testuser', password='testpass123')
+        self.client.post(reverse('book_travel', args=[self.cheap.travel_id]), {'number_of_seats': 2})
+        # The sold-out bus no longer sets the cheapest fare
+        self.assertEqual(self.calendar()[self.day], (45, 1, 30))
+
+        Booking.objects.get(travel_option=self.cheap).cancel()
+        self.assertEqual(self.calendar()[self.day], (20, 2, 32))
+
+        cancel_all_bookings([self.cheap])
+        self.assertEqual(self.calendar()[self.day], (20, 2, 32))
+
+    def test_edits_and_deletes_update_calendar(self):
+        self.cheap.datetime += timedelta(days=1, hours=2)
+        self.cheap.save()
+        self.assertEqual(self.calendar(), {
+            self.day: (45, 1, 30),
+            self.day + timedelta(days=1): (20, 2, 42),
+        })
+
+        self.dear.delete()
+        self.assertEqual(self.calendar(), {self.day + timedelta(days=1): (20, 2, 42)})
+
+    def test_rebuild_matches_incremental_updates(self):
+        reserve_seats(self.dear, 5)
+        self.cheap.price = 50
+        self.cheap.save()
+        incremental = self.calendar()
+
+        call_command('rebuild_fare_calendar', stdout=StringIO())
+        self.assertEqual(self.calendar(), incremental)
+        self.assertEqual(RouteDaySummary.objects.count(), 3)
+
+    def test_api(self):
+        response = self.client.get(reverse('api_fare_calendar'), {'source': 'Austin', 'destination': 'Dallas'})
+        self.assertEqual(response.status_code, 200)
+        first = response.json()['results'][0]
+        self.assertEqual(first['date'], self.day.isoformat())
+        self.assertEqual(first['min_price'], '20.00')
+        self.assertEqual((first['departures'], first['total_seats']), (2, 32))
+
+        response = self.client.get(reverse('api_fare_calendar'), {'source': 'Austin'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_view(self):
+        response = self.client.get(reverse('fare_calendar'), {'source': 'Austin', 'destination': 'Dallas'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '$20.00')
+        self.assertContains(response, f'date_from={self.day:%Y-%m-%d}')
+
+
+class ScheduleImportTest(TestCase):
+    CSV = (
+        'type,source,destination,datetime,price,seats\n'
+        'Train,Boston,New York,{day}T08:00,40,10\n'
+        'bus, Boston , Albany,{day}T09:30,15.50,30\n'
+        'Boat,Boston,Albany,{day}T10:00,15,30\n'
+        'Bus,Boston,Albany,not a date,15,30\n'
+        'Bus,Boston,Albany,{day}T11:00,-1,30\n'
+    )
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.day = (timezone.localdate() + timedelta(days=5)).isoformat()
+
+    def _import(self, text, file_format='csv', chunk_size=2):
+        return import_schedule(StringIO(text.format(day=self.day)), file_format, chunk_size)
+
+    def test_creates_and_reports_row_errors(self):
+        result = self._import(self.CSV)
+
+        self.assertEqual((result.rows, result.created, result.updated), (5, 2, 0))
+        self.assertEqual([line for line, _ in result.errors], [4, 5, 6])
+        bus = TravelOption.objects.get(type='Bus')
+        self.assertEqual((bus.source, bus.destination_key, bus.price), ('Boston', 'albany', 15.5))
+        self.assertEqual(seatmaps.free_count(bus.seat_map), 30)
+        self.assertEqual(RouteDaySummary.objects.filter(departures__gt=0).count(), 2)
+
+    def test_upsert_keeps_booked_seats(self):
+        self._import(self.CSV)
+        train = TravelOption.objects.get(type='Train')
+        Booking.objects.create(
+            user=self.user, travel_option=train, number_of_seats=3,
+            seat_numbers=claim_seats(train, 3)
+        )
+
+        result = self._import(
+            '{{"type": "Train", "source": "Boston", "destination": "New York", '
+            '"datetime": "{day}T08:00", "price": 55, "seats": 12}}\n'
+            '{{"type": "Train", "source": "Boston", "destination": "New York", '
+            '"datetime": "{day}T18:00", "price": 35, "seats": 2}}\n',
+            file_format='jsonl',
+        )
+
+        self.assertEqual((result.created, result.updated, result.errors), (1, 1, []))
+        train.refresh_from_db()
+        self.assertEqual((train.price, train.seat_capacity, train.available_seats), (55, 12, 9))
+        self.assertEqual(seatmaps.free_seats(train.seat_map), list(range(4, 13)))
+
+        # Shrinking below a booked seat is refused for that row only
+        result = self._import(
+            '{{"type": "Train", "source": "Boston", "destination": "New York", '
+            '"datetime": "{day}T08:00", "price": 55, "seats": 2}}\n',
+            file_format='jsonl',
+        )
+        self.assertEqual(result.errors, [(1, 'seats above 2 are already booked')])
+        train.refresh_from_db()
+        self.assertEqual(train.available_seats, 9)
+
+    def test_arrival_column(self):
+        result = self._import(
+            'type,source,destination,datetime,arrival,price,seats\n'
+            'Train,Boston,New York,{day}T08:00,{day}T11:45,40,10\n'
+            'Train,Boston,Albany,{day}T08:00,{day}T07:00,40,10\n'
+        )
+        self.assertEqual(result.errors, [(3, 'arrival must be after datetime')])
+        train = TravelOption.objects.get()
+        self.assertEqual(train.arrival - train.datetime, timedelta(hours=3, minutes=45))
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.CSV.format(day=self.day))
+        self.addCleanup(os.remove, f.name)
+
+        out, err = StringIO(), StringIO()
+        call_command('import_schedule', f.name, stdout=out, stderr=err)
+        self.assertIn('2 created, 0 updated, 3 errors', out.getvalue())
+        self.assertIn('rows/sec', out.getvalue())
+        self.assertIn('Line 4: type must be one of', err.getvalue())
+
+        call_command('import_schedule', f.name, stdout=out, stderr=err)
+        self.assertIn('0 created, 2 updated', out.getvalue())
+        self.assertEqual(TravelOption.objects.count(), 2)
+
+
+class BookingExportTest(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'traveller{i}', email=f't{i}@example.com', password='testpass123')
+            for i in range(3)
+        ]
+        self.travel_option = TravelOption.objects.create(
+            type='Flight',
+            source='Miami',
+            destination='Atlanta',
+            datetime=timezone.now() + timedelta(days=8),
+            price=150,
+            available_seats=100
+        )
+        Booking.objects.bulk_create([
+            Booking(
+                user=self.users[i % 3],
+                travel_option=self.travel_option,
+                number_of_seats=2,
+                total_price=300,
+                seat_numbers=[2 * i + 1, 2 * i + 2],
+                status='Cancelled' if i % 5 == 0 else 'Confirmed',
+            )
+            for i in range(30)
+        ])
+        Booking.objects.filter(status='Cancelled').update(booking_date=timezone.now() - timedelta(days=10))
+
+    def _rows(self, lines):
+        return list(csv.reader(''.join(lines).splitlines()))
+
+    def _archive_one(self):
+        archived_option = ArchivedTravelOption.objects.create(
+            travel_id=uuid.uuid4(),
+            type='Bus',
+            source='Tampa',
+            destination='Orlando',
+            datetime=timezone.now() - timedelta(days=40),
+            price=20,
+            available_seats=30,
+        )
+        return ArchivedBooking.objects.create(
+            booking_id=uuid.uuid4(),
+            user=self.users[0],
+            travel_option=archived_option,
+            number_of_seats=1,
+            total_price=20,
+            booking_date=timezone.now() - timedelta(days=45),
+            status='Confirmed',
+            seat_numbers=[7],
+        )
+
+    def test_one_query_per_table_for_any_number_of_rows(self):
+        with self.assertNumQueries(2):
+            rows = self._rows(csv_lines())
+        self.assertEqual(len(rows), 31)
+        self.assertEqual(rows[0][:4], ['booking_id', 'booking_date', 'status', 'username'])
+        self.assertIn('Miami', rows[1])
+        self.assertIn('1 2', [row[rows[0].index('seat_numbers')] for row in rows[1:]])
+
+    def test_archived_bookings_merged_in_date_order(self):
+        archived = self._archive_one()
+
+        rows = self._rows(csv_lines())
+        self.assertEqual(len(rows), 1 + 31)
+        # The oldest booking, ahead of the cancelled ones from 10 days ago
+        self.assertEqual(rows[1][0], str(archived.booking_id))
+        self.assertEqual(rows[1][rows[0].index('source')], 'Tampa')
+        dates = [row[rows[0].index('booking_date')] for row in rows[1:]]
+        self.assertEqual(dates, sorted(dates))
+
+        out = StringIO()
+        call_command('export_bookings', '--to', str(timezone.localdate() - timedelta(days=1)), stdout=out)
+        self.assertEqual(len(self._rows([out.getvalue()])), 1 + 6 + 1)
+
+    def test_admin_action_exports_archived_selection(self):
+        archived = self._archive_one()
+        User.objects.create_superuser(username='finance', password='testpass123', email='f@example.com')
+        self.client.login(username='finance', password='testpass123')
+
+        response = self.client.post(reverse('admin:bookings_archivedbooking_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [str(archived.pk)],
+        })
+
+        rows = self._rows(line.decode() for line in response.streaming_content)
+        self.assertEqual([row[0] for row in rows[1:]], [str(archived.booking_id)])
+
+    def test_admin_action_streams_selection(self):
+        User.objects.create_superuser(username='finance', password='testpass123', email='f@example.com')
+        self.client.login(username='finance', password='testpass123')
+        selected = Booking.objects.filter(status='Confirmed').values_list('pk', flat=True)
+
+        response = self.client.post(reverse('admin:bookings_booking_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [str(pk) for pk in selected],
+        })
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = self._rows(line.decode() for line in response.streaming_content)
+        self.assertEqual(len(rows), 1 + 24)
+
+    def test_management_command_filters(self):
+        out = StringIO()
+        call_command('export_bookings', status='Cancelled', stdout=out)
+        self.assertEqual(len(self._rows([out.getvalue()])), 1 + 6)
+
+        out = StringIO()
+        call_command('export_bookings', date_from=timezone.localdate(), stdout=out)
+        self.assertEqual(len(self._rows([out.getvalue()])), 1 + 24)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bookings.csv')
+            out = StringIO()
+            call_command('export_bookings', '--to', str(timezone.localdate() - timedelta(days=1)), '--output', path, stdout=out)
+            self.assertIn('Exported 6 bookings', out.getvalue())
+            with open(path, newline='') as f:
+                self.assertEqual(len(list(csv.reader(f))), 1 + 6)
+
+
+class HighVolumeAdminTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123', email='a@example.com')
+        self.client.force_login(self.admin)
+        self.options = [
+            TravelOption.objects.create(
+                type='Bus',
+                source=source,
+                destination='Salt Lake City',
+                datetime=timezone.now() + timedelta(days=2, hours=i),
+                price=30,
+                available_seats=40
+            )
+            for i, source in enumerate(['Boise', 'Boulder', 'Reno'])
+        ]
+
+    def _book(self, count):
+        users = User.objects.bulk_create([User(username=f'rider{uuid.uuid4().hex[:8]}') for _ in range(count)])
+        Booking.objects.bulk_create([
+            Booking(user=user, travel_option=self.options[i % 3], number_of_seats=1, total_price=30)
+            for i, user in enumerate(users)
+        ])
+
+    def _queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_booking_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:bookings_booking_changelist')
+        self._book(3)
+        few = self._queries(url)
+        self._book(40)
+        self.assertEqual(self._queries(url), few)
+
+    def test_large_tables_use_estimated_count(self):
+        url = reverse('admin:bookings_traveloption_changelist')
+        with mock.patch('bookings.pagination.estimated_count', return_value=1_000_000):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+        self.assertContains(response, '1000000 travel options')
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+
+    def test_city_filter_and_autocomplete(self):
+        url = reverse('admin:bookings_traveloption_changelist')
+        response = self.client.get(url, {'source': ' BOISE', 'type__exact': 'Bus'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.options[0]])
+        self.assertContains(response, 'name="type__exact" value="Bus"')
+
+        response = self.client.get(reverse('admin:bookings_traveloption_cities', args=['source']), {'term': 'bo'})
+        self.assertEqual(response.json(), {'results': ['boise', 'boulder']})
+
+    def test_bulk_price_and_seat_actions(self):
+        url = reverse('admin:bookings_traveloption_changelist')
+        selected = [str(option.pk) for option in self.options[:2]]
+        Booking.objects.create(
+            user=self.admin, travel_option=self.options[0], number_of_seats=38,
+            seat_numbers=claim_seats(self.options[0], 38)
+        )
+
+        self.client.post(url, {'action': 'adjust_prices', '_selected_action': selected, 'price_change': '-12.5'})
+        self.client.post(url, {'action': 'adjust_seats', '_selected_action': selected, 'seat_change': '-5'})
+
+        first, second, untouched = TravelOption.objects.order_by('datetime')
+        self.assertEqual((first.price, second.price, untouched.price), (26.25, 26.25, 30))
+        # Only 2 seats were left on the first option, so it was skipped
+        self.assertEqual((first.available_seats, second.available_seats), (2, 35))
+        self.assertEqual(seatmaps.free_count(second.seat_map), 35)
+        self.assertEqual(fare_calendar('boulder', 'salt lake city')[0]['min_price'], 26.25)
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.past = TravelOption.objects.bulk_create([
+            TravelOption(
+                type='Train',
+                source='Boston',
+                destination='New York',
+                source_key='boston',
+                destination_key='new york',
+                datetime=timezone.now() - timedelta(days=30 - i, hours=12),
+                price=50,
+                available_seats=100,
+            )
+            for i in range(5)
+        ])
+        self.upcoming = TravelOption.objects.create(
+            type='Train',
+            source='Boston',
+            destination='New York',
+            datetime=timezone.now() + timedelta(days=3),
+            price=60,
+            available_seats=100,
+        )
+        self.bookings = Booking.objects.bulk_create([
+            Booking(
+                user=self.user,
+                travel_option=option,
+                number_of_seats=2,
+                total_price=option.price * 2,
+                status='Cancelled' if i == 0 else 'Confirmed',
+            )
+            for i, option in enumerate(self.past + [self.upcoming])
+        ])
+        call_command('rebuild_fare_calendar', stdout=StringIO())
+
+    def test_moves_departed_options_and_bookings(self):
+        IdempotencyKey.objects.create(
+            user=self.user, key=uuid.uuid4(), booking=self.bookings[1],
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        Waitlist.objects.create(user=self.user, travel_option=self.past[2], number_of_seats=1)
+
+        archived = archive_past_travel(timezone.now() - timedelta(days=7), batch_size=2)
+
+        self.assertEqual(archived, (5, 5))
+        self.assertEqual(list(TravelOption.objects.all()), [self.upcoming])
+        self.assertEqual(list(Booking.objects.values_list('pk', flat=True)), [self.bookings[-1].pk])
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertFalse(Waitlist.objects.exists())
+        self.assertEqual(ArchivedTravelOption.objects.count(), 5)
+        archived_booking = ArchivedBooking.objects.get(pk=self.bookings[0].pk)
+        self.assertEqual(archived_booking.status, 'Cancelled')
+        self.assertEqual(archived_booking.travel_option.destination, 'New York')
+        self.assertFalse(RouteDaySummary.objects.filter(date__lt=timezone.localdate()).exists())
+        self.assertTrue(RouteDaySummary.objects.filter(date__gt=timezone.localdate()).exists())
+
+    def test_resumes_after_copied_chunk(self):
+        # A run that died after copying rows but before deleting them
+        ArchivedTravelOption.objects.create(
+            travel_id=self.past[0].pk, type='Train', source='Boston', destination='New York',
+            datetime=self.past[0].datetime, price=50, available_seats=100,
+        )
+        self.assertEqual(archive_past_travel(timezone.now()), (5, 5))
+        self.assertEqual(archive_past_travel(timezone.now()), (0, 0))
+        self.assertEqual(ArchivedTravelOption.objects.count(), 5)
+
+    def test_my_bookings_lists_archived_trips(self):
+        archive_past_travel(timezone.now())
+        self.client.login(username='testuser', password='testpass123')
+
+        response = self.client.get(reverse('my_bookings'))
+
+        self.assertEqual(len(response.context['bookings']), 6)
+        stats = response.context['booking_stats']
+        self.assertEqual(stats['total'], 6)
+        self.assertEqual(stats['cancelled'], 1)
+        self.assertEqual(stats['total_spent'], 4 * 100 + 120)
+        self.assertContains(response, reverse('travel_option_detail', args=[self.upcoming.pk]))
+        self.assertNotContains(response, reverse('travel_option_detail', args=[self.past[1].pk]))
+
+        response = self.client.get(reverse('my_bookings'), {'status': 'Cancelled'})
+        self.assertEqual(
+            [booking.pk for booking in response.context['bookings']], [self.bookings[0].pk]
+        )
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command('archive_past_travel', days=28, batch_size=1, stdout=out)
+        self.assertIn('Archived 3 travel options and 3 bookings', out.getvalue())
+
+        out = StringIO()
+        call_command('archive_past_travel', days=0, benchmark=True, repeat=1, stdout=out)
+        report = json.loads(out.getvalue()[out.getvalue().index('{'):])
+        self.assertEqual(report['before']['travel_options'], 3)
+        self.assertEqual(report['after']['travel_options'], 1)
+        self.assertIn('search_route', report['after']['queries'])
+
+
+class PricingTest(TestCase):
+    DAYS_CURVE = [(0, 2.0), (10, 1.0)]
+    LOAD_CURVE = [(0, 1.0), (1, 2.0)]
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.option = TravelOption.objects.create(
+            type='Train',
+            source='Chicago',
+            destination='Detroit',
+            datetime=self.now + timedelta(days=5),
+            price=100,
+            available_seats=100,
+        )
+        # Half the seats sold
+        TravelOption.objects.filter(pk=self.option.pk).update(available_seats=50)
+        self.unmapped = TravelOption.objects.create(
+            type='Bus',
+            source='Chicago',
+            destination='Detroit',
+            datetime=self.now + timedelta(days=20),
+            price=40,
+            available_seats=30,
+        )
+        TravelOption.objects.filter(pk=self.unmapped.pk).update(seat_map=None, seat_capacity=None)
+        self.departed = TravelOption.objects.create(
+            type='Train',
+            source='Chicago',
+            destination='Detroit',
+            datetime=self.now - timedelta(hours=1),
+            price=80,
+            available_seats=10,
+        )
+
+    def _reprice(self):
+        return reprice(self.now, days_curve=self.DAYS_CURVE, load_curve=self.LOAD_CURVE)
+
+    def test_reprices_from_curves(self):
+        self.assertEqual(self._reprice(), (2, 1))
+
+        self.option.refresh_from_db()
+        self.assertEqual(self.option.price, 225)  # 100 x 1.5 (5 days) x 1.5 (half sold)
+        self.unmapped.refresh_from_db()
+        self.assertEqual(self.unmapped.price, 40)  # past the days curve, no known load
+        self.departed.refresh_from_db()
+        self.assertEqual(self.departed.price, 80)
+        self.assertEqual(
+            fare_calendar('Chicago', 'Detroit', 'Train', start=timezone.localdate(self.option.datetime))[0]['min_price'],
+            225,
+        )
+
+    def test_repricing_starts_from_base_price(self):
+        self._reprice()
+        with self.assertNumQueries(2):
+            # Prices already current: base fares checked, one read, nothing written
+            self.assertEqual(self._reprice(), (2, 0))
+
+        TravelOption.objects.filter(pk=self.option.pk).update(base_price=200)
+        self.assertEqual(self._reprice(), (2, 1))
+        self.option.refresh_from_db()
+        self.assertEqual(self.option.price, 450)
+
+    def test_vectorized_matches_per_row(self):
+        TravelOption.objects.bulk_create([
+            TravelOption(
+                type='Flight',
+                source='Chicago',
+                destination=f'City {i}',
+                source_key='chicago',
+                destination_key=f'city {i}',
+                datetime=self.now + timedelta(hours=7 * i),
+                price=f'{50 + i * 3.17:.2f}',
+                available_seats=i % 40,
+                seat_capacity=40,
+                seat_map=seatmaps.all_free(40),
+            )
+            for i in range(200)
+        ])
+        expected = {
+            option.pk: option_price(option, self.now, self.DAYS_CURVE, self.LOAD_CURVE)
+            for option in TravelOption.objects.filter(datetime__gt=self.now)
+        }
+
+        self._reprice()
+
+        self.assertEqual(
+            dict(TravelOption.objects.filter(datetime__gt=self.now).values_list('pk', 'price')), expected
+        )
+
+    def test_booking_charged_quoted_price(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('book_travel', args=[self.option.pk])
+        quote = self.client.get(url).context['form']['price_quote'].value()
+
+        self._reprice()
+        response = self.client.post(url, {'number_of_seats': 2, 'price_quote': quote})
+
+        self.assertRedirects(response, reverse('my_bookings'))
+        self.assertEqual(user.bookings.get().total_price, 200)
+
+    def test_quote_never_charges_more_than_current_price(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('book_travel', args=[self.option.pk])
+        TravelOption.objects.filter(pk=self.option.pk).update(price=300, base_price=100)
+        quote = self.client.get(url).context['form']['price_quote'].value()
+
+        self._reprice()  # down to 225
+        for ttl in (900, -1):
+            with override_settings(PRICE_QUOTE_TTL=ttl):
+                self.client.post(url, {'number_of_seats': 1, 'price_quote': quote})
+        self.assertEqual(list(user.bookings.values_list('total_price', flat=True)), [225, 225])
+
+    def test_stale_quote_shows_new_price(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('book_travel', args=[self.option.pk])
+        quote = self.client.get(url).context['form']['price_quote'].value()
+        self._reprice()
+
+        with override_settings(PRICE_QUOTE_TTL=-1):
+            response = self.client.post(url, {'number_of_seats': 2, 'price_quote': quote}, follow=True)
+        self.assertContains(response, 'The price has changed to $225.00 per seat')
+        self.assertFalse(user.bookings.exists())
+
+        response = self.client.post(url, {'number_of_seats': 2, 'price_quote': quote[:-1] + 'x'})
+        self.assertRedirects(response, url)
+        self.assertFalse(user.bookings.exists())
+
+        quote = self.client.get(url).context['form']['price_quote'].value()
+        with override_settings(PRICE_QUOTE_TTL=-1):
+            # Expired, but the price is still the one shown
+            self.client.post(url, {'number_of_seats': 2, 'price_quote': quote})
+        self.assertEqual(user.bookings.get().total_price, 450)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command('reprice', stdout=out)
+        self.assertIn('Repriced 2 travel options', out.getvalue())
+
+        out = StringIO()
+        call_command('reprice', benchmark=True, sample=1, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['per_row_loop']['rows'], 1)
+        self.assertEqual(report['vectorized']['rows'], 2)
+
+    def test_benchmark_changes_nothing(self):
+        keys = [SEARCH_GENERATION_KEY, TRAVEL_OPTION_GENERATION_KEY, travel_option_generation_key(self.option.pk)]
+        generations = [get_generation(key) for key in keys]
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            call_command('reprice', benchmark=True, sample=2, stdout=StringIO())
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual([get_generation(key) for key in keys], generations)
+        self.option.refresh_from_db()
+        self.assertEqual((self.option.price, self.option.base_price), (100, None))
+
+
+class ConnectionSearchTest(TestCase):
+    def setUp(self):
+        # Each test starts without an index
+        patcher = mock.patch.object(connections, '_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.start = timezone.now() + timedelta(days=1)
+        self.flight_in = self._option('Flight', 'Boston', 'Chicago', 1, 3, 200)
+        # Leaves an hour after the flight lands, short of the 90 minute transfer
+        self.tight_flight = self._option('Flight', 'Chicago', 'Denver', 4, 6, 150)
+        self.train = self._option('Train', 'Chicago', 'Denver', 3.5, 9, 80)
+        self.flight_out = self._option('Flight', 'Chicago', 'Denver', 5, 7, 300)
+        self.bus_in = self._option('Bus', 'Boston', 'Chicago', 2, 10, 40)
+        self.bus_out = self._option('Bus', 'Chicago', 'Denver', 11, 20, 30, seats=1)
+
+    def _option(self, travel_type, source, destination, departs, arrives, price, seats=20):
+        return TravelOption.objects.create(
+            type=travel_type,
+            source=source,
+            destination=destination,
+            datetime=self.start + timedelta(hours=departs),
+            arrival=self.start + timedelta(hours=arrives),
+            price=price,
+            available_seats=seats,
+        )
+
+    def _search(self, **kwargs):
+        return [
+            [leg.pk for leg in itinerary.legs]
+            for itinerary in connections.search_connections('boston', 'DENVER', after=self.start, **kwargs)
+        ]
+
+    def test_earliest_arrival_respects_transfer_times(self):
+        self.assertEqual(self._search(), [
+            [self.flight_in.pk, self.flight_out.pk],
+            [self.bus_in.pk, self.bus_out.pk],
+        ])
+
+    def test_earlier_arrival_with_more_legs_does_not_block_a_route(self):
+        # Salem is reached first by two buses, then later by one; only the
+        # later arrival leaves a third leg for the bus on to Albany
+        self._option('Bus', 'Worcester', 'Lowell', 0.2, 0.5, 10)
+        self._option('Bus', 'Lowell', 'Salem', 0.8, 1, 10)
+        to_salem = self._option('Bus', 'Worcester', 'Salem', 1.05, 1.5, 10)
+        salem_troy = self._option('Bus', 'Salem', 'Troy', 15.6, 16, 10)
+        troy_albany = self._option('Bus', 'Troy', 'Albany', 18.5, 19, 10)
+
+        found = [
+            [leg.pk for leg in itinerary.legs]
+            for itinerary in connections.search_connections('Worcester', 'Albany', after=self.start)
+        ]
+        self.assertEqual(found, [[to_salem.pk, salem_troy.pk, troy_albany.pk]])
+
+    def test_cheapest(self):
+        self.assertEqual(self._search(sort='cheapest'), [
+            [self.bus_in.pk, self.bus_out.pk],
+            [self.flight_in.pk, self.train.pk],
+            [self.flight_in.pk, self.flight_out.pk],
+        ])
+        self.assertEqual(self._search(sort='cheapest', seats=2, limit=1), [[self.flight_in.pk, self.train.pk]])
+
+    def test_sold_out_leg_is_searched_around(self):
+        self._search()
+        # Seats change without signals; the index still has seats on it
+        TravelOption.objects.filter(pk=self.flight_out.pk).update(available_seats=0)
+
+        with self.assertNumQueries(2):
+            # Legs read back, then read back again after searching without the sold-out one
+            found = self._search(limit=1)
+        self.assertEqual(found, [[self.flight_in.pk, self.train.pk]])
+
+    def test_saved_option_is_patched_in(self):
+        self._search()
+        index = connections._index
+
+        with self.captureOnCommitCallbacks(execute=True):
+            direct = self._option('Flight', 'Boston', 'Denver', 1.5, 5, 500)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flight_out.delete()
+
+        self.assertEqual(self._search(limit=2), [[direct.pk], [self.bus_in.pk, self.bus_out.pk]])
+        self.assertIs(connections._index, index)
+
+    def test_bulk_change_rebuilds(self):
+        self._search()
+        index = connections._index
+
+        TravelOption.objects.filter(type='Flight').update(arrival=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_schedule()
+
+        self.assertEqual(self._search(), [[self.bus_in.pk, self.bus_out.pk]])
+        self.assertIsNot(connections._index, index)
+
+    def test_page_and_api(self):
+        params = {'source': 'Boston', 'destination': 'Denver', 'date': self.start.date().isoformat()}
+        response = self.client.get(reverse('connection_search'), params)
+        self.assertContains(response, '1 change')
+        self.assertEqual(len(response.context['itineraries']), 2)
+
+        response = self.client.get(reverse('api_connections'), dict(params, sort='cheapest'))
+        results = response.json()['results']
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['total_price'], '70.00')
+        self.assertEqual([leg['type'] for leg in results[0]['legs']], ['Bus', 'Bus'])
+
+        response = self.client.get(reverse('api_connections'), {'source': 'Boston'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TravelOptionSnapshotTest(TestCase):
+    def setUp(self):
+        snapshots.clear()
+        self.addCleanup(snapshots.clear)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            type='Train',
+            source='Boston',
+            destination='New York',
+            datetime=timezone.now() + timedelta(days=3),
+            price=50,
+            available_seats=10,
+        )
+        self.url = reverse('travel_option_detail', args=[self.travel_option.pk])
+
+    def test_repeat_reads_skip_the_database(self):
+        with self.assertNumQueries(1):
+            snapshots.get_travel_option(self.travel_option.pk)
+        with self.assertNumQueries(0):
+            travel_option = snapshots.get_travel_option(self.travel_option.pk)
+        self.assertEqual(travel_option.available_seats, 10)
+
+        self.client.get(self.url)
+        stats = snapshots.snapshot_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (2, 1, 1))
+        self.assertAlmostEqual(stats['hit_rate'], 2 / 3)
+
+    def test_changes_made_elsewhere_are_seen(self):
+        snapshots.get_travel_option(self.travel_option.pk)
+
+        # Another worker books: only the generation in the shared cache tells this one
+        claim_seats(self.travel_option, 3)
+        self.assertContains(self.client.get(self.url), '7')
+        self.assertEqual(snapshots.snapshot_stats()['invalidated'], 1)
+
+        # Bulk changes drop every snapshot
+        TravelOption.objects.filter(pk=self.travel_option.pk).update(price=65)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_schedule()
+        self.assertEqual(snapshots.get_travel_option(self.travel_option.pk).price, 65)
+
+        other = TravelOption.objects.create(
+            type='Bus', source='Boston', destination='Albany',
+            datetime=timezone.now() + timedelta(days=3), price=20, available_seats=5,
+        )
+        snapshots.get_travel_option(other.pk)
+        invalidate_travel_options([self.travel_option.pk])
+        with self.assertNumQueries(0):
+            snapshots.get_travel_option(other.pk)
+
+    def test_evicted_generation_never_matches_an_old_snapshot(self):
+        key = travel_option_generation_key(self.travel_option.pk)
+        cache.delete(key)
+        bump_generation(key)
+        snapshots.get_travel_option(self.travel_option.pk)
+
+        # Culled from the shared cache, then bumped by another worker's booking
+        cache.delete(key)
+        TravelOption.objects.filter(pk=self.travel_option.pk).update(available_seats=4)
+        bump_generation(key)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(snapshots.get_travel_option(self.travel_option.pk).available_seats, 4)
+
+    def test_snapshots_expire_and_stay_bounded(self):
+        snapshots.get_travel_option(self.travel_option.pk)
+        with mock.patch.object(snapshots.time, 'monotonic', return_value=time.monotonic() + 61):
+            with self.assertNumQueries(1):
+                snapshots.get_travel_option(self.travel_option.pk)
+
+        with self.settings(TRAVEL_OPTION_CACHE_SIZE=1):
+            other = TravelOption.objects.create(
+                type='Bus', source='Boston', destination='Albany',
+                datetime=timezone.now() + timedelta(days=3), price=20, available_seats=5,
+            )
+            snapshots.get_travel_option(other.pk)
+        self.assertEqual(snapshots.snapshot_stats()['size'], 1)
+        with self.assertNumQueries(1):
+            snapshots.get_travel_option(self.travel_option.pk)
+
+        with self.assertRaises(Http404):
+            snapshots.get_travel_option_or_404(uuid.uuid4())
+
+    def test_booking_uses_the_row_not_the_snapshot(self):
+        self.client.login(username='testuser', password='testpass123')
+        book_url = reverse('book_travel', args=[self.travel_option.pk])
+        self.client.get(book_url)
+
+        # Changed without invalidating, so the snapshot is stale
+        TravelOption.objects.filter(pk=self.travel_option.pk).update(price=80, available_seats=1)
+        self.assertEqual(snapshots.get_travel_option(self.travel_option.pk).price, 50)
+
+        response = self.client.post(book_url, {'number_of_seats': 2, 'seats': ''})
+        self.assertContains(response, 'Only 1 seats are available')
+        self.client.post(book_url, {'number_of_seats': 1, 'seats': ''})
+        self.assertEqual(Booking.objects.get().total_price, 80)
+
+
+class SessionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            type='Train',
+            source='Boston',
+            destination='New York',
+            datetime=timezone.now() + timedelta(days=3),
+            price=50,
+            available_seats=10,
+        )
+
+    def _session_queries(self, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(*args, **kwargs)
+        return response, [query['sql'] for query in queries if 'django_session' in query['sql']]
+
+    def test_anonymous_pages_never_load_a_session(self):
+        for url in (reverse('home'), reverse('travel_options_list')):
+            response, session_queries = self._session_queries(url)
+            self.assertEqual(session_queries, [])
+            self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_cached_sessions_and_cookie_messages(self):
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.post(
+            reverse('book_travel', args=[self.travel_option.pk]), {'number_of_seats': 1, 'seats': ''}
+        )
+        self.assertIn('messages', response.cookies)
+
+        response, session_queries = self._session_queries(reverse('my_bookings'))
+        self.assertContains(response, 'Booking confirmed!')
+        self.assertEqual(session_queries, [])
+
+    def test_purge_expired_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(minutes=i + 1))
+            for i in range(5)
+        ] + [Session(session_key='live', session_data='', expire_date=now + timedelta(days=1))])
+
+        with self.assertNumQueries(7):
+            self.assertEqual(purge_expired_sessions(batch_size=2), 5)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'):
+            self.assertEqual(purge_expired_sessions(), 0)
+        out = StringIO()
+        call_command('purge_sessions', stdout=out)
+        self.assertIn('Deleted 0 expired sessions', out.getvalue())
+
+
+class TemplateFragmentCacheTest(TestCase):
+    def setUp(self):
+        caches['template_fragments'].clear()
+        self.addCleanup(caches['template_fragments'].clear)
+        departure = timezone.now() + timedelta(days=3)
+        self.first, self.second = (
+            TravelOption.objects.create(
+                type='Train', source='Boston', destination=destination,
+                datetime=departure + timedelta(hours=hours), price=50, available_seats=10,
+            )
+            for hours, destination in ((1, 'New York'), (2, 'Albany'))
+        )
+
+    def test_home_departures_are_cached_until_a_booking(self):
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        self.assertEqual([query['sql'] for query in queries if 'bookings_traveloption' in query['sql']], [])
+        self.assertContains(response, '10 seats available', count=2)
+
+        claim_seats(self.first, 3)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '7 seats available', count=1)
+        self.assertContains(response, '10 seats available', count=1)
+
+    def test_only_changed_cards_are_rendered_again(self):
+        self.client.get(reverse('travel_options_list'))
+
+        # Neither change is in a card's key; only the seats of the first one are
+        TravelOption.objects.filter(pk__in=[self.first.pk, self.second.pk]).update(source='Cambridge')
+        claim_seats(self.first, 3)
+        response = self.client.get(reverse('travel_options_list'))
+        self.assertContains(response, 'Cambridge → New York')
+        self.assertContains(response, '7 seats available')
+        self.assertContains(response, 'Boston → Albany')
+
+        # Cards differ for signed-in users
+        User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('travel_options_list'))
+        self.assertContains(response, 'Book Now', count=2)
+
+
+class SeatMapTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.travel_option = TravelOption.objects.create(
+            type='Train',
+            source='Boston',
+            destination='New York',
+            datetime=timezone.now() + timedelta(days=2),
+            price=40,
+            available_seats=10
+        )
+
+    def test_bitmap_operations(self):
+        seat_map = seatmaps.claim(seatmaps.all_free(10), 10, [2, 4, 5])
+        self.assertEqual(len(seat_map), 2)
+        self.assertEqual(seatmaps.free_seats(seat_map), [1, 3, 6, 7, 8, 9, 10])
+        self.assertEqual(seatmaps.best_available(seat_map, 3), [6, 7, 8])
+        self.assertEqual(seatmaps.best_available(seat_map, 1), [1])
+        self.assertIsNone(seatmaps.claim(seat_map, 10, [3, 4]))
+        self.assertIsNone(seatmaps.claim(seat_map, 10, [11]))
+
+        scattered = seatmaps.claim(seatmaps.all_free(6), 6, [2, 4, 6])
+        self.assertEqual(seatmaps.best_available(scattered, 2), [1, 3])
+        self.assertIsNone(seatmaps.best_available(scattered, 4))
+
+        released, freed = seatmaps.release(seat_map, 10, [4, 6])
+        self.assertEqual((seatmaps.free_count(released), freed), (8, 1))
+
+        grown = seatmaps.set_capacity(seat_map, 10, 12)
+        self.assertEqual(seatmaps.free_seats(grown), [1, 3, 6, 7, 8, 9, 10, 11, 12])
+        self.assertEqual(seatmaps.free_seats(seatmaps.set_capacity(seat_map, 10, 5)), [1, 3])
+        self.assertIsNone(seatmaps.set_capacity(seat_map, 10, 4))
+
+    def test_new_option_has_free_seat_map(self):
+        self.assertEqual(self.travel_option.seat_capacity, 10)
+        self.assertEqual(seatmaps.free_seats(self.travel_option.seat_map), list(range(1, 11)))
+
+    def test_claim_specific_and_best_available_seats(self):
+        self.assertEqual(claim_seats(self.travel_option, seat_numbers=[3, 4]), [3, 4])
+        self.assertIsNone(claim_seats(self.travel_option, seat_numbers=[4, 5]))
+        self.assertEqual(claim_seats(self.travel_option, 3), [5, 6, 7])
+
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 5)
+        self.assertEqual(seatmaps.free_seats(self.travel_option.seat_map), [1, 2, 8, 9, 10])
+
+    def test_book_and_cancel_chosen_seats(self):
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('book_travel', args=[self.travel_option.travel_id])
+
+        response = self.client.post(url, {'number_of_seats': 2, 'seats': '7, 8'})
+        self.assertEqual(response.status_code, 302)
+        booking = Booking.objects.get(user=self.user)
+        self.assertEqual(booking.seat_numbers, [7, 8])
+
+        response = self.client.post(url, {'number_of_seats': 1, 'seats': '8'})
+        self.assertContains(response, 'Seat(s) 8 are not available.')
+
+        booking.cancel()
+        self.travel_option.refresh_from_db()
+        self.assertEqual(self.travel_option.available_seats, 10)
+        self.assertEqual(seatmaps.free_count(self.travel_option.seat_map), 10)
+
+    def test_editing_available_seats_updates_map(self):
+        claim_seats(self.travel_option, seat_numbers=[1])
+        self.travel_option.refresh_from_db()
+
+        self.travel_option.available_seats = 6
+        self.travel_option.save()
+        self.assertEqual(seatmaps.free_seats(self.travel_option.seat_map), [2, 3, 4, 5, 6, 7])
+
+        self.travel_option.available_seats = 12
+        self.travel_option.save()
+        self.assertEqual(self.travel_option.seat_capacity, 16)
+        self.assertEqual(seatmaps.free_count(self.travel_option.seat_map), 12)
+
+    def test_seat_map_endpoint(self):
+        claim_seats(self.travel_option, seat_numbers=[1, 9])
+        response = self.client.get(reverse('api_travel_option_seat_map', args=[self.travel_option.travel_id]))
+
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['X-Seat-Capacity'], '10')
+        self.assertEqual(response['X-Seats-Available'], '8')
+        self.assertEqual(response.content, bytes([0b11111110, 0b10]))
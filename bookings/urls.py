@@ -1,9 +1,13 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, api, async_views
+
+# Read-only pages are served by async views when running under ASGI
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     # Home page
-    path('', views.home, name='home'),
+    path('', read_views.home, name='home'),
     
     # Authentication URLs
     path('register/', views.RegisterView.as_view(), name='register'),
@@ -11,11 +15,22 @@ urlpatterns = [
     path('profile/', views.profile_view, name='profile'),
     
     # Travel options URLs
-    path('travel-options/', views.travel_options_list, name='travel_options_list'),
-    path('travel-options/<uuid:travel_id>/', views.travel_option_detail, name='travel_option_detail'),
+    path('travel-options/', read_views.travel_options_list, name='travel_options_list'),
+    path('travel-options/<uuid:travel_id>/', read_views.travel_option_detail, name='travel_option_detail'),
     path('travel-options/<uuid:travel_id>/book/', views.book_travel, name='book_travel'),
+    path('travel-options/<uuid:travel_id>/waitlist/', views.join_waitlist, name='join_waitlist'),
+    path('travel-options/connections/', views.connection_search, name='connection_search'),
+    path('fare-calendar/', views.fare_calendar, name='fare_calendar'),
     
     # Booking management URLs
     path('my-bookings/', views.my_bookings, name='my_bookings'),
     path('my-bookings/<uuid:booking_id>/cancel/', views.cancel_booking, name='cancel_booking'),
+    path('my-bookings/waitlist/<uuid:waitlist_id>/leave/', views.leave_waitlist, name='leave_waitlist'),
+    
+    # Read-only JSON API
+    path('api/travel-options/', api.travel_options_search, name='api_travel_options'),
+    path('api/travel-options/<uuid:travel_id>/', api.travel_option_detail, name='api_travel_option_detail'),
+    path('api/travel-options/<uuid:travel_id>/seats/', api.travel_option_seat_map, name='api_travel_option_seat_map'),
+    path('api/fare-calendar/', api.route_fare_calendar, name='api_fare_calendar'),
+    path('api/connections/', api.connections, name='api_connections'),
 ]
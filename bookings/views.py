@@ -1,33 +1,48 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView, LogoutView
 from django.contrib import messages
-from django.db.models import Q
-from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db import IntegrityError, transaction
 from django.urls import reverse_lazy
 from django.views.generic import CreateView
 from django.utils import timezone
-from .models import TravelOption, Booking
+from .models import TravelOption, Booking, Waitlist
+from .inventory import claim_seats
+from .search import search_travel_options, start_of_day, upcoming_travel_options
+from .pagination import KeysetPaginator, MergedKeysetPaginator
+from .cache import SEARCH_GENERATION_KEY, cached_search, get_generation
+from . import connections, fares, idempotency, pricing, seatmaps, snapshots, waitlist
+from .routers import replica_reads, pin_to_primary, pinned_to_primary
 from .forms import (
     CustomUserCreationForm, 
     CustomAuthenticationForm,
     UserProfileForm, 
     TravelOptionFilterForm, 
+    FareCalendarForm,
+    ConnectionSearchForm,
     BookingForm, 
+    WaitlistForm,
     BookingSearchForm
 )
 
 
+TRAVEL_OPTIONS_PER_PAGE = 20
+BOOKINGS_PER_PAGE = 20
+
+
+@replica_reads
 def home(request):
     """Home page view with recent travel options"""
-    recent_options = TravelOption.objects.filter(
-        datetime__gte=timezone.now(),
-        available_seats__gt=0
-    )[:6]
-    
     context = {
-        'recent_options': recent_options,
+        # Unevaluated: the template only runs the query when its cached block is missing
+        'recent_options': upcoming_travel_options()[:6],
+        'recent_options_generation': get_generation(SEARCH_GENERATION_KEY),
+        'pinned_to_primary': pinned_to_primary(),
+        'home_cache_timeout': settings.HOME_CACHE_TIMEOUT,
+        'card_cache_timeout': settings.CARD_CACHE_TIMEOUT,
     }
     return render(request, 'bookings/home.html', context)
 
@@ -70,129 +85,214 @@ def profile_view(request):
     return render(request, 'registration/profile.html', context)
 
 
+@replica_reads
 def travel_options_list(request):
     """List and filter travel options"""
     form = TravelOptionFilterForm(request.GET)
-    travel_options = TravelOption.objects.filter(
-        datetime__gte=timezone.now(),
-        available_seats__gt=0
+    filters = form.cleaned_data if form.is_valid() else {}
+    cursor = request.GET.get('cursor')
+    
+    page = cached_search(
+        filters, cursor, TRAVEL_OPTIONS_PER_PAGE,
+        lambda: KeysetPaginator(
+            search_travel_options(filters),
+            ('datetime', 'travel_id'),
+            per_page=TRAVEL_OPTIONS_PER_PAGE,
+        ).page(cursor),
     )
     
+    context = {
+        'form': form,
+        'travel_options': page.object_list,
+        'page': page,
+        'next_querystring': page.next_querystring(request.GET) if page.has_next else '',
+        'first_querystring': page.first_querystring(request.GET),
+        'card_cache_timeout': settings.CARD_CACHE_TIMEOUT,
+    }
+    return render(request, 'bookings/travel_options_list.html', context)
+
+
+@replica_reads
+def fare_calendar(request):
+    """Cheapest fare per day on a route"""
+    form = FareCalendarForm(request.GET or None)
+    days = []
     if form.is_valid():
-        # Apply filters
-        if form.cleaned_data['source']:
-            travel_options = travel_options.filter(
-                source__icontains=form.cleaned_data['source']
-            )
-        
-        if form.cleaned_data['destination']:
-            travel_options = travel_options.filter(
-                destination__icontains=form.cleaned_data['destination']
-            )
-        
-        if form.cleaned_data['travel_type']:
-            travel_options = travel_options.filter(
-                type=form.cleaned_data['travel_type']
-            )
-        
-        if form.cleaned_data['date_from']:
-            travel_options = travel_options.filter(
-                datetime__date__gte=form.cleaned_data['date_from']
-            )
-        
-        if form.cleaned_data['date_to']:
-            travel_options = travel_options.filter(
-                datetime__date__lte=form.cleaned_data['date_to']
-            )
-        
-        if form.cleaned_data['min_price']:
-            travel_options = travel_options.filter(
-                price__gte=form.cleaned_data['min_price']
-            )
-        
-        if form.cleaned_data['max_price']:
-            travel_options = travel_options.filter(
-                price__lte=form.cleaned_data['max_price']
-            )
+        days = fares.fare_calendar(
+            form.cleaned_data['source'],
+            form.cleaned_data['destination'],
+            travel_type=form.cleaned_data['travel_type'],
+            start=form.cleaned_data['start'],
+        )
     
     context = {
         'form': form,
-        'travel_options': travel_options,
+        'days': days,
     }
-    return render(request, 'bookings/travel_options_list.html', context)
+    return render(request, 'bookings/fare_calendar.html', context)
+
+
+@replica_reads
+def connection_search(request):
+    """Itineraries between two cities, changing on the way if needed"""
+    form = ConnectionSearchForm(request.GET or None)
+    itineraries = []
+    if form.is_valid():
+        date = form.cleaned_data['date']
+        itineraries = connections.search_connections(
+            form.cleaned_data['source'],
+            form.cleaned_data['destination'],
+            after=start_of_day(date) if date else None,
+            seats=form.cleaned_data['seats'] or 1,
+            sort=form.cleaned_data['sort'] or 'earliest',
+        )
+    
+    context = {
+        'form': form,
+        'itineraries': itineraries,
+    }
+    return render(request, 'bookings/connections.html', context)
+
+
+def _booking_confirmed(request, booking):
+    seats = f" Seats: {', '.join(map(str, booking.seat_numbers))}." if booking.seat_numbers else ''
+    messages.success(request, f'Booking confirmed! Booking ID: {str(booking.booking_id)[:8]}.{seats}')
+    return pin_to_primary(redirect('my_bookings'))
 
 
 @login_required
 def book_travel(request, travel_id):
     """Book a travel option"""
-    travel_option = get_object_or_404(TravelOption, travel_id=travel_id)
+    idempotency_key = idempotency.request_key(request) if request.method == 'POST' else None
+    if idempotency_key:
+        # A retry of a submission that already went through
+        booking = idempotency.replayed_booking(request.user, idempotency_key)
+        if booking:
+            return _booking_confirmed(request, booking)
+    
+    if request.method == 'POST':
+        # A booking is charged the price in the row, not in a snapshot
+        travel_option = get_object_or_404(TravelOption, travel_id=travel_id)
+    else:
+        travel_option = snapshots.get_travel_option_or_404(travel_id)
     
     if not travel_option.has_available_seats:
-        messages.error(request, 'Sorry, this travel option is fully booked.')
-        return redirect('travel_options_list')
+        messages.error(request, 'Sorry, this travel option is fully booked. You can join the waitlist.')
+        return redirect('join_waitlist', travel_id=travel_id)
     
     if request.method == 'POST':
         form = BookingForm(request.POST, travel_option=travel_option)
         if form.is_valid():
-            with transaction.atomic():
-                # Check if seats are still available
-                travel_option.refresh_from_db()
-                number_of_seats = form.cleaned_data['number_of_seats']
-                
-                if number_of_seats > travel_option.available_seats:
-                    messages.error(request, 'Sorry, not enough seats available.')
+            number_of_seats = form.cleaned_data['number_of_seats']
+            price = travel_option.price
+            if form.cleaned_data['price_quote']:
+                # Charge the price the user saw, unless it is stale
+                price = pricing.quoted_price(travel_option, form.cleaned_data['price_quote'])
+                if price is None:
+                    messages.error(
+                        request,
+                        f'The price has changed to ${travel_option.price} per seat. Please check it and book again.'
+                    )
+                    return redirect('book_travel', travel_id=travel_id)
+            try:
+                with transaction.atomic():
+                    # Take the seats first; this fails instead of overbooking
+                    seat_numbers = claim_seats(travel_option, number_of_seats, form.cleaned_data['seats'])
+                    if seat_numbers is None:
+                        if form.cleaned_data['seats']:
+                            messages.error(request, 'Sorry, those seats have just been taken.')
+                        else:
+                            messages.error(request, 'Sorry, not enough seats available.')
+                        return redirect('book_travel', travel_id=travel_id)
+                    
+                    # Create booking
+                    booking = form.save(commit=False)
+                    booking.user = request.user
+                    booking.travel_option = travel_option
+                    booking.total_price = number_of_seats * price
+                    booking.seat_numbers = seat_numbers
+                    booking.save()
+                    
+                    if idempotency_key:
+                        idempotency.remember(request.user, idempotency_key, booking)
+            except IntegrityError:
+                if not idempotency_key:
+                    raise
+                # A concurrent retry booked first; this attempt was rolled back
+                booking = idempotency.replayed_booking(request.user, idempotency_key)
+                if booking is None:
+                    # ...and its key has expired or been purged since
+                    messages.error(
+                        request,
+                        'We could not confirm this booking. Please check My Bookings before booking again.'
+                    )
                     return redirect('book_travel', travel_id=travel_id)
-                
-                # Create booking
-                booking = form.save(commit=False)
-                booking.user = request.user
-                booking.travel_option = travel_option
-                booking.total_price = number_of_seats * travel_option.price
-                booking.save()
-                
-                # Update available seats
-                travel_option.available_seats -= number_of_seats
-                travel_option.save()
-                
-                messages.success(request, f'Booking confirmed! Booking ID: {str(booking.booking_id)[:8]}')
-                return redirect('my_bookings')
+            
+            return _booking_confirmed(request, booking)
     else:
         form = BookingForm(travel_option=travel_option)
     
     context = {
         'form': form,
         'travel_option': travel_option,
+        'free_seats': seatmaps.free_seats(travel_option.seat_map) if travel_option.seat_map is not None else [],
     }
     return render(request, 'bookings/book_travel.html', context)
 
 
+def _filter_bookings(bookings, filters):
+    """Apply the cleaned data of a BookingSearchForm"""
+    if filters.get('status'):
+        bookings = bookings.filter(status=filters['status'])
+    
+    if filters.get('travel_type'):
+        bookings = bookings.filter(travel_option__type=filters['travel_type'])
+    
+    if filters.get('date_from'):
+        bookings = bookings.filter(travel_option__datetime__date__gte=filters['date_from'])
+    
+    if filters.get('date_to'):
+        bookings = bookings.filter(travel_option__datetime__date__lte=filters['date_to'])
+    
+    return bookings
+
+
 @login_required
 def my_bookings(request):
-    """View user's bookings with search functionality"""
+    """View user's bookings, including archived past trips, with search functionality"""
     form = BookingSearchForm(request.GET)
-    bookings = request.user.bookings.all()
+    filters = form.cleaned_data if form.is_valid() else {}
+    booking_sets = [
+        _filter_bookings(request.user.bookings.select_related('travel_option'), filters),
+        _filter_bookings(request.user.archived_bookings.select_related('travel_option'), filters),
+    ]
     
-    if form.is_valid():
-        # Apply filters
-        if form.cleaned_data['status']:
-            bookings = bookings.filter(status=form.cleaned_data['status'])
-        
-        if form.cleaned_data['travel_type']:
-            bookings = bookings.filter(travel_option__type=form.cleaned_data['travel_type'])
-        
-        if form.cleaned_data['date_from']:
-            bookings = bookings.filter(
-                travel_option__datetime__date__gte=form.cleaned_data['date_from']
-            )
-        
-        if form.cleaned_data['date_to']:
-            bookings = bookings.filter(
-                travel_option__datetime__date__lte=form.cleaned_data['date_to']
-            )
+    page = MergedKeysetPaginator(
+        booking_sets, ('-booking_date', '-booking_id'), per_page=BOOKINGS_PER_PAGE
+    ).page(request.GET.get('cursor'))
+    
+    # One aggregate query per table instead of walking every booking in the template
+    booking_stats = {'total': 0, 'confirmed': 0, 'cancelled': 0, 'total_spent': None}
+    for bookings in booking_sets:
+        stats = bookings.aggregate(
+            total=Count('pk'),
+            confirmed=Count('pk', filter=Q(status='Confirmed')),
+            cancelled=Count('pk', filter=Q(status='Cancelled')),
+            total_spent=Sum('total_price', filter=Q(status='Confirmed')),
+        )
+        for key, value in stats.items():
+            if value is not None:
+                booking_stats[key] = (booking_stats[key] or 0) + value
     
     context = {
         'form': form,
-        'bookings': bookings,
+        'bookings': page.object_list,
+        'waitlist_entries': request.user.waitlist_entries.filter(status='Waiting').select_related('travel_option'),
+        'booking_stats': booking_stats,
+        'now': timezone.now(),
+        'page': page,
+        'next_querystring': page.next_querystring(request.GET) if page.has_next else '',
+        'first_querystring': page.first_querystring(request.GET),
     }
     return render(request, 'bookings/my_bookings.html', context)
 
@@ -212,7 +312,7 @@ def cancel_booking(request, booking_id):
                 messages.success(request, 'Booking cancelled successfully. Seats have been returned.')
             else:
                 messages.error(request, 'Unable to cancel booking.')
-        return redirect('my_bookings')
+        return pin_to_primary(redirect('my_bookings'))
     
     context = {
         'booking': booking,
@@ -220,9 +320,52 @@ def cancel_booking(request, booking_id):
     return render(request, 'bookings/cancel_booking.html', context)
 
 
+@login_required
+def join_waitlist(request, travel_id):
+    """Join the waitlist of a sold-out travel option"""
+    travel_option = snapshots.get_travel_option_or_404(travel_id)
+    
+    if travel_option.has_available_seats:
+        return redirect('book_travel', travel_id=travel_id)
+    
+    if request.method == 'POST':
+        form = WaitlistForm(request.POST)
+        if form.is_valid():
+            entry, created = waitlist.join_waitlist(
+                request.user, travel_option, form.cleaned_data['number_of_seats']
+            )
+            if created:
+                messages.success(request, "You're on the waitlist. We'll book your seats as soon as they free up.")
+            else:
+                messages.info(request, "You're already on the waitlist for this travel option.")
+            return pin_to_primary(redirect('my_bookings'))
+    else:
+        form = WaitlistForm()
+    
+    context = {
+        'form': form,
+        'travel_option': travel_option,
+    }
+    return render(request, 'bookings/join_waitlist.html', context)
+
+
+@login_required
+def leave_waitlist(request, waitlist_id):
+    """Leave a waitlist"""
+    entry = get_object_or_404(Waitlist, waitlist_id=waitlist_id, user=request.user)
+    
+    if request.method == 'POST':
+        if Waitlist.objects.filter(pk=entry.pk, status='Waiting').update(status='Cancelled'):
+            messages.success(request, 'You have left the waitlist.')
+        else:
+            messages.warning(request, 'This waitlist entry is no longer waiting.')
+    return pin_to_primary(redirect('my_bookings'))
+
+
+@replica_reads
 def travel_option_detail(request, travel_id):
     """View details of a travel option"""
-    travel_option = get_object_or_404(TravelOption, travel_id=travel_id)
+    travel_option = snapshots.get_travel_option_or_404(travel_id)
     
     context = {
         'travel_option': travel_option,
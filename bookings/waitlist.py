@@ -0,0 +1,125 @@
+"""
+Waitlist for sold-out travel options.
+
+Cancelling a booking only gives its seats back; ``promote_waitlist()``,
+run by the promote_waitlist command, later hands freed seats to waiting
+users in the order they joined. Travel options are promoted in batches:
+each batch locks its travel options once, books every entry that fits in
+one bulk INSERT and writes the seat maps back in one bulk UPDATE, so a
+burst of cancellations costs a handful of statements per batch instead of
+a transaction per seat.
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .cache import invalidate_search_cache, invalidate_travel_options
+from .fares import refresh_travel_options
+from .inventory import lock_travel_options, take_seats
+from .models import Booking, TravelOption, Waitlist
+
+PROMOTION_BATCH_SIZE = 100
+
+
+def join_waitlist(user, travel_option, number_of_seats):
+    """
+    Put ``user`` in the queue for ``travel_option``. Returns
+    ``(entry, created)``; a user has at most one waiting entry per option.
+    """
+    try:
+        with transaction.atomic():
+            return Waitlist.objects.get_or_create(
+                user=user,
+                travel_option=travel_option,
+                status='Waiting',
+                defaults={'number_of_seats': number_of_seats},
+            )
+    except IntegrityError:
+        # Joined concurrently from another request
+        return Waitlist.objects.get(user=user, travel_option=travel_option, status='Waiting'), False
+
+
+def waiting_travel_options(after=None, limit=PROMOTION_BATCH_SIZE):
+    """
+    Primary keys of upcoming travel options with free seats and a queue,
+    in primary key order after ``after``.
+    """
+    entries = Waitlist.objects.filter(
+        status='Waiting',
+        travel_option__available_seats__gt=0,
+        travel_option__datetime__gte=timezone.now(),
+    )
+    if after is not None:
+        entries = entries.filter(travel_option__gt=after)
+    return list(
+        entries.order_by('travel_option')
+        .values_list('travel_option', flat=True)
+        .distinct()[:limit]
+    )
+
+
+def promote_travel_options(travel_option_pks):
+    """
+    Book waiting users onto the given travel options in joining order.
+
+    An option's queue stops at the first entry that does not fit, so a
+    large party is not overtaken by smaller ones that joined later.
+    Returns the number of entries promoted.
+    """
+    with transaction.atomic():
+        options = {
+            option.pk: option
+            for option in lock_travel_options(TravelOption.objects.filter(pk__in=travel_option_pks))
+        }
+        entries = Waitlist.objects.filter(
+            travel_option__in=options, status='Waiting'
+        ).order_by('travel_option', 'joined_at', 'waitlist_id')
+
+        bookings, promoted, blocked = [], [], set()
+        for entry in entries:
+            option = options[entry.travel_option_id]
+            if option.pk in blocked:
+                continue
+            seat_numbers = take_seats(option, entry.number_of_seats)
+            if seat_numbers is None:
+                blocked.add(option.pk)
+                continue
+
+            entry.booking = Booking(
+                user_id=entry.user_id,
+                travel_option=option,
+                number_of_seats=entry.number_of_seats,
+                total_price=entry.number_of_seats * option.price,
+                seat_numbers=seat_numbers,
+            )
+            entry.status = 'Promoted'
+            bookings.append(entry.booking)
+            promoted.append(entry)
+
+        if not promoted:
+            return 0
+
+        Booking.objects.bulk_create(bookings)
+        Waitlist.objects.bulk_update(promoted, ['status', 'booking'])
+        changed = {entry.travel_option_id: options[entry.travel_option_id] for entry in promoted}
+        TravelOption.objects.bulk_update(changed.values(), ['available_seats', 'seat_map'])
+        refresh_travel_options(changed.values())
+
+    invalidate_search_cache()
+    invalidate_travel_options(changed)
+    return len(promoted)
+
+
+def promote_waitlist(batch_size=PROMOTION_BATCH_SIZE):
+    """
+    One pass over every travel option that has both free seats and a
+    queue, ``batch_size`` options per transaction. Returns the number of
+    entries promoted.
+    """
+    promoted = 0
+    last = None
+    while True:
+        batch = waiting_travel_options(after=last, limit=batch_size)
+        if not batch:
+            return promoted
+        promoted += promote_travel_options(batch)
+        last = batch[-1]
@@ -45,7 +45,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'bookings.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,17 +54,37 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Serve the read-only pages with async views; opt-in, as they have not yet
+# beaten the sync views under a real server
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+# Per-view latency, SQL and template metrics, served in Prometheus format at /metrics
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'bookings.metrics.MetricsMiddleware')
+
 ROOT_URLCONF = 'travel_booking.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': (
+            'bookings.metrics.InstrumentedDjangoTemplates' if METRICS_ENABLED
+            else 'django.template.backends.django.DjangoTemplates'
+        ),
         'DIRS': [
             BASE_DIR / 'templates',
             BASE_DIR / 'bookings' / 'templates',
         ],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept per process; the development server
+            # still picks up edits, as it resets the cache on reload
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -82,10 +102,17 @@ WSGI_APPLICATION = 'travel_booking.wsgi.application'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
 # Use PostgreSQL in production, SQLite in development
+# Seconds to keep a connection open between requests (0 closes it after
+# each request); health checks drop connections the server has closed.
+CONN_MAX_AGE = config('CONN_MAX_AGE', default=0, cast=int)
+CONN_HEALTH_CHECKS = config('CONN_HEALTH_CHECKS', default=True, cast=bool)
+
 if config('DATABASE_URL', default=None):
     DATABASES = {
         'default': dj_database_url.config(
-            default=config('DATABASE_URL')
+            default=config('DATABASE_URL'),
+            conn_max_age=CONN_MAX_AGE,
+            conn_health_checks=CONN_HEALTH_CHECKS,
         )
     }
 else:
@@ -93,9 +120,98 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': CONN_HEALTH_CHECKS,
         }
     }
 
+# Read replicas for the search pages, as comma-separated database URLs
+DATABASE_REPLICAS = []
+for index, url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv())):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dj_database_url.parse(
+        url, conn_max_age=CONN_MAX_AGE, conn_health_checks=CONN_HEALTH_CHECKS
+    )
+    # Tests run against the primary's test database
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['bookings.routers.ReplicaRouter']
+
+# How long a user's reads stay on the primary after they book or cancel
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS', default=10, cast=int)
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# LocMemCache is per process; use a shared backend so invalidations reach
+# every worker. Redis and memcached increment generations atomically; the
+# file-based cache does not. MAX_ENTRIES must stay well above the number
+# of generation keys (one per travel option), search pages and sessions,
+# or culling evicts generations along with everything else.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='travel-booking'),
+        'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=100000, cast=int)},
+    },
+    # Used by {% cache %}. A fragment's key carries everything that changes
+    # it, so each process can keep its own, with no round trip per fragment
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template-fragments',
+        'OPTIONS': {'MAX_ENTRIES': config('TEMPLATE_FRAGMENT_CACHE_ENTRIES', default=5000, cast=int)},
+    },
+}
+
+# Sessions and flash messages
+# https://docs.djangoproject.com/en/4.2/topics/http/sessions/#configuring-the-session-engine
+# cached_db serves session reads from the cache and writes through to the
+# database; it needs a cache shared by the workers, or a logout in one
+# worker leaves the session alive in the others, so the database is the
+# default with LocMemCache. signed_cookies keeps sessions in the browser.
+SESSION_ENGINE = config(
+    'SESSION_ENGINE',
+    default='django.contrib.sessions.backends.db'
+    if CACHES['default']['BACKEND'].endswith('LocMemCache')
+    else 'django.contrib.sessions.backends.cached_db',
+)
+# Flash messages ride in a cookie to the next page and never touch the session
+MESSAGE_STORAGE = config('MESSAGE_STORAGE', default='django.contrib.messages.storage.cookie.CookieStorage')
+
+# Longest time (seconds) a cached search result may be served; 0 disables it
+SEARCH_CACHE_TIMEOUT = config('SEARCH_CACHE_TIMEOUT', default=30, cast=int)
+
+# Travel options each worker keeps in memory for the detail and booking
+# pages, and the longest time (seconds) one is kept; 0 disables them
+TRAVEL_OPTION_CACHE_SIZE = config('TRAVEL_OPTION_CACHE_SIZE', default=1000, cast=int)
+TRAVEL_OPTION_CACHE_TIMEOUT = config('TRAVEL_OPTION_CACHE_TIMEOUT', default=60, cast=int)
+
+# Rendered travel option cards are kept for this long (seconds); a card is
+# keyed on its seats, price and departure, so changes show up at once and
+# the timeout only bounds edits to anything else, such as a city name
+CARD_CACHE_TIMEOUT = config('CARD_CACHE_TIMEOUT', default=300, cast=int)
+# The home page's upcoming departures are cached for this long (seconds)
+# and dropped by every booking and price change
+HOME_CACHE_TIMEOUT = config('HOME_CACHE_TIMEOUT', default=10, cast=int)
+
+# How long a booking submission's idempotency key replays the original booking (seconds)
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60, cast=int)
+
+
+def price_curve(value):
+    """Points of a pricing curve written as ``x:multiplier,x:multiplier``"""
+    return [tuple(float(number) for number in point.split(':')) for point in Csv()(value)]
+
+
+# Fare multipliers the reprice command interpolates between, by days left
+# until departure and by the share of seats sold
+PRICING_DAYS_CURVE = config('PRICING_DAYS_CURVE', default='0:1.5,3:1.3,14:1.1,30:1.0,90:0.9', cast=price_curve)
+PRICING_LOAD_CURVE = config('PRICING_LOAD_CURVE', default='0:0.9,0.5:1.0,0.8:1.2,1:1.5', cast=price_curve)
+
+# How long a price shown on the booking page is honoured after a reprice (seconds)
+PRICE_QUOTE_TTL = config('PRICE_QUOTE_TTL', default=15 * 60, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators